@@ -1,20 +1,19 @@
 # agents.py
-import requests
 import json
 from flask import jsonify
 import os
-from openai import OpenAI
-import csv
-import pandas as pd
-import re
 import glob
 import faiss
 import numpy as np
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Tuple, Iterator
+from corpus_store import load_abstracts
+from retrieval_utils import normalize_rows, mmr_select, fuse_scores, search_all, top_k_hits
+from lexical_index import has_lexical_index, search as lexical_search
+from vector_index import load_project_index, locate, load_chunk_vectors, current_stems, covered_rows
+from llm_gateway import get_openai_client, post_chat_completion, chat_completion, embed_texts
+from llm_dispatcher import rate_limited, estimate_tokens
 
-api_key = os.environ("API-KEY")
-
-client = OpenAI(api_key=api_key)
+client = get_openai_client()
 
 
 # Models (you can change these)
@@ -22,38 +21,88 @@ EMBED_MODEL = "text-embedding-ada-002"   # keep this if your FAISS was built wit
 CHAT_MODEL  = "gpt-4o"
 
 def call_openai_chat(model: str, messages: List[Dict[str, str]], temperature=0.2, max_tokens=6000) -> str:
-    resp = client.chat.completions.create(
-        model=model,
-        messages=messages,
-        temperature=temperature,
-        max_tokens=max_tokens,
-    )
-    return resp.choices[0].message.content
+    return chat_completion(model, messages, temperature=temperature, max_tokens=max_tokens)
+
+def stream_openai_chat(model: str, messages: List[Dict[str, str]], temperature=0.2, max_tokens=6000) -> Iterator[str]:
+    """Yields completion text deltas as they arrive."""
+    with rate_limited(model, estimate_tokens(messages, max_tokens)):
+        stream = client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True,
+        )
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
 
 def embed_query(text: str) -> np.ndarray:
     # IMPORTANT: must match the embedding model used to build your FAISS indexes
-    emb = client.embeddings.create(input=text, model=EMBED_MODEL)
-    return np.array(emb.data[0].embedding, dtype="float32")
+    return np.array(embed_texts([text], model=EMBED_MODEL)[0], dtype="float32")
 
-def load_abstracts_from_csv(project_id: str) -> List[str]:
-    project_path = os.path.join("data", project_id)
-    if not os.path.exists(project_path):
-        return []
-    abstracts = []
-    for fp in glob.glob(os.path.join(project_path, "*.csv")):
+def embed_queries(texts: List[str]) -> np.ndarray:
+    """Embeds several queries in one request; returns an (n, d) float32 matrix in input order."""
+    return np.array(embed_texts(texts, model=EMBED_MODEL), dtype="float32")
+
+def _approx_tokens(text: str) -> int:
+    # ~4 characters per token is close enough for budgeting English prose
+    return max(1, len(text) // 4)
+
+def _document_vectors(project_id: str, sources: List[str]) -> Dict[str, np.ndarray]:
+    """Mean chunk embedding per uploaded file, read from dataembedding/<project_id>."""
+    folder = os.path.join("dataembedding", project_id)
+    vectors = {}
+    for source in set(sources):
+        if not source:
+            continue
         try:
-            df = pd.read_csv(fp)
-            if "Abstract" in df.columns:
-                abstracts.extend(df["Abstract"].dropna().astype(str).tolist())
+            emb = load_chunk_vectors(folder, source, mmap=True)
+            if emb is not None and len(emb):
+                vectors[source] = np.asarray(emb, dtype="float32").mean(axis=0)
         except Exception:
             continue
-    return abstracts
+    return vectors
+
+def select_intro_abstracts(project_id: str, token_budget: int = 3000, trim: int = 400,
+                           lambda_mult: float = 0.5, dup_threshold: float = 0.97) -> List[str]:
+    """
+    Picks a representative, de-duplicated subset of the project's abstracts for the
+    introduction. Papers with stored embeddings are ordered by MMR (relevance =
+    similarity to the corpus centroid); the rest follow in ingestion order.
+    Abstracts are trimmed to `trim` characters and added until `token_budget` is spent.
+    """
+    rows = load_abstracts(project_id, columns=("abstract", "source"))
+    if not rows:
+        return []
+
+    doc_vecs = _document_vectors(project_id, [r["source"] for r in rows])
+    embedded = [i for i, r in enumerate(rows) if r["source"] in doc_vecs]
+    order: List[int] = []
+    if embedded:
+        mat = normalize_rows(np.stack([doc_vecs[rows[i]["source"]] for i in embedded]))
+        centroid = normalize_rows(mat.mean(axis=0))[0]
+        picks = mmr_select(mat, mat @ centroid, len(embedded),
+                           lambda_mult=lambda_mult, dup_threshold=dup_threshold)
+        order = [embedded[p] for p in picks]
+    seen = set(embedded)
+    order += [i for i in range(len(rows)) if i not in seen]
+
+    selected, used = [], 0
+    for i in order:
+        text = rows[i]["abstract"][:trim]
+        cost = _approx_tokens(text)
+        if used + cost > token_budget:
+            break
+        selected.append(text)
+        used += cost
+    return selected
 
 def load_all_embeddings(project_id: str) -> List[Dict[str, Any]]:
     """
     Looks in dataembedding/<project_id> for triplets:
-      <stem>_chunks.npy, <stem>_embeddings.npy, <stem>_faiss.index
-    Returns: list of {stem, index, chunks, dim}
+      <stem>_chunks.npy, <stem>_faiss.index and optionally <stem>_embeddings.npy
+    Returns: list of {stem, index, chunks, embeddings (None if not stored), dim}
     """
     folder = os.path.join("dataembedding", project_id)
     if not os.path.isdir(folder):
@@ -63,7 +112,7 @@ def load_all_embeddings(project_id: str) -> List[Dict[str, Any]]:
         stem = chunk_file[:-11]  # remove '_chunks.npy'
         emb_file = f"{stem}_embeddings.npy"
         idx_file = f"{stem}_faiss.index"
-        if not (os.path.exists(emb_file) and os.path.exists(idx_file)):
+        if not os.path.exists(idx_file):
             continue
         try:
             chunks = np.load(chunk_file, allow_pickle=True).tolist()
@@ -72,6 +121,8 @@ def load_all_embeddings(project_id: str) -> List[Dict[str, Any]]:
                 "stem": os.path.basename(stem),
                 "index": index,
                 "chunks": chunks,
+                # candidate vectors for MMR; decoded from the index when no copy is kept
+                "embeddings": np.load(emb_file, mmap_mode="r") if os.path.exists(emb_file) else None,
                 "dim": index.d
             })
         except Exception:
@@ -94,44 +145,131 @@ def _chunk_meta_of(item: Any) -> Dict[str, Any]:
         }
     return {"title":"", "year":"", "section":"", "url":"", "paper_id":""}
 
-def retrieve_passages_for_query(resources: List[Dict[str,Any]], query: str,
-                                total_passages=24, max_per_doc=2, trim=700) -> List[Dict[str, Any]]:
-    qvec = embed_query(query).reshape(1, -1)
+def _chunk_vector(res: Dict[str, Any], idx: int) -> np.ndarray:
+    emb = res.get("embeddings")
+    if emb is not None and idx < len(emb):
+        return np.asarray(emb[idx], dtype="float32")
+    return res["index"].reconstruct(int(idx))
+
+def _select_passages(by_stem: Dict[str, Dict[str, Any]], keys: List[Tuple[str, int]],
+                     lexical_scores: Dict[Tuple[str, int], float], qvec: np.ndarray,
+                     total_passages: int, max_per_doc: int, trim: int,
+                     mmr_lambda: float, dup_threshold: float, hybrid_alpha: float) -> List[Dict[str, Any]]:
+    """Builds hits for one query's candidate keys, fuses scores and picks notes with MMR."""
     hits: List[Dict[str,Any]] = []
-    for res in resources:
-        if res["dim"] != qvec.shape[1]:
+    vecs: List[np.ndarray] = []
+    for key in dict.fromkeys(keys):
+        stem, idx = key
+        res = by_stem.get(stem)
+        if res is None:
             continue
-        # overfetch, we will prune
-        D, I = res["index"].search(qvec, max_per_doc * 4)
-        for dist, idx in zip(D[0], I[0]):
-            if idx < 0 or idx >= len(res["chunks"]):
-                continue
-            raw = res["chunks"][idx]
-            text = _chunk_text_of(raw)
-            if not text:
-                continue
-            meta = _chunk_meta_of(raw)
-            hits.append({
-                "paper_key": res["stem"] or meta.get("paper_id") or res["stem"],
-                "text": text[:trim],
-                "meta": meta,
-                "score": float(-dist)  # higher is better
-            })
-    # sort and diversify
-    hits.sort(key=lambda x: x["score"], reverse=True)
-    kept, per_paper = [], {}
-    for h in hits:
-        pk = h["paper_key"]
-        if per_paper.get(pk, 0) >= max_per_doc:
+        if idx >= len(res["chunks"]):
             continue
-        kept.append(h)
-        per_paper[pk] = per_paper.get(pk, 0) + 1
-        if len(kept) >= total_passages:
-            break
+        raw = res["chunks"][idx]
+        text = _chunk_text_of(raw)
+        if not text:
+            continue
+        meta = _chunk_meta_of(raw)
+        hits.append({
+            "key": key,
+            "paper_key": res["stem"] or meta.get("paper_id") or res["stem"],
+            "text": text[:trim],
+            "meta": meta,
+        })
+        vecs.append(_chunk_vector(res, idx))
+    if not hits:
+        return []
+
+    cand = normalize_rows(np.stack(vecs))
+    vector_scores = {}
+    if qvec is not None:
+        cosine = cand @ qvec
+        vector_scores = {h["key"]: float(c) for h, c in zip(hits, cosine)}
+    lexical = {h["key"]: lexical_scores[h["key"]] for h in hits if h["key"] in lexical_scores}
+    fused = fuse_scores(vector_scores, lexical, alpha=hybrid_alpha)
+    relevance = np.array([fused.get(h.pop("key"), 0.0) for h in hits], dtype="float32")
+    for h, r in zip(hits, relevance):
+        h["score"] = float(r)  # higher is better
+
+    # diversify: MMR over candidate embeddings with a per-paper cap
+    groups = np.array([h["paper_key"] for h in hits])
+    picks = mmr_select(cand, relevance, total_passages, lambda_mult=mmr_lambda,
+                       dup_threshold=dup_threshold, groups=groups, max_per_group=max_per_doc)
+    kept = [hits[i] for i in picks]
     for i, k in enumerate(kept, start=1):
         k["note_id"] = i  # local numbering per RQ
     return kept
 
+def retrieve_passages_for_queries(resources: List[Dict[str,Any]], queries: List[str],
+                                  total_passages=24, max_per_doc=2, trim=700,
+                                  mmr_lambda=0.7, dup_threshold=0.95,
+                                  project_id: str = None, mode="hybrid", hybrid_alpha=0.5,
+                                  project_index: Dict[str, Any] = None,
+                                  min_score: float = None) -> List[List[Dict[str, Any]]]:
+    """
+    Collects candidates from the FAISS indexes and/or the project's BM25 index
+    (mode: "vector", "lexical" or "hybrid"; lexical needs project_id and makes no
+    embedding call), fuses their scores, then picks each query's evidence set with MMR.
+    All queries are embedded in one request and searched as one (n_queries, d)
+    matrix per index; hits are split back out per query afterwards.
+    When the project has a consolidated ANN index (project_index, see
+    vector_index.load_project_index) it is searched instead of the per-file
+    indexes of the files it covers; files uploaded or re-uploaded since its
+    last update are still searched through their own indexes.
+    Vector hits are scored by cosine similarity (see similarity_scores); min_score
+    drops weaker ones.
+    mmr_lambda=1.0 is pure relevance, lower values favour diversity. Candidates with
+    cosine >= dup_threshold to an already chosen passage (e.g. preprint vs journal
+    version) are dropped, and each paper contributes at most max_per_doc passages.
+    Returns one list of notes per query, in input order.
+    """
+    if not queries:
+        return []
+    use_lexical = mode in ("hybrid", "lexical") and bool(project_id) and has_lexical_index(project_id)
+    use_vector = mode in ("hybrid", "vector") or not use_lexical
+    by_stem = {res["stem"]: res for res in resources}
+
+    # candidate keys are (stem, chunk position) so both retrievers line up
+    keys: List[List[Tuple[str, int]]] = [[] for _ in queries]
+    qmat = None
+    if use_vector:
+        qmat = normalize_rows(embed_queries(list(queries)))
+        pool = total_passages * 8  # candidate pool handed to MMR
+        covered = set()
+        if project_index is not None and project_index["index"].d == qmat.shape[1]:
+            covered = current_stems(project_index)
+            S, O, R = search_all([project_index["index"]], qmat, pool)
+            # owner -1 marks project-index hits; hits on re-uploaded files are dropped
+            O, R = np.full_like(O, -1), covered_rows(project_index, R)
+        else:
+            S, O, R = search_all([], qmat, pool)
+        # files the project index does not cover (yet): overfetch per paper
+        searchable = [res for res in resources if res["dim"] == qmat.shape[1] and res["stem"] not in covered]
+        S2, O2, R2 = search_all([res["index"] for res in searchable], qmat, max_per_doc * 4)
+        S, O, R = (np.concatenate(pair, axis=1) for pair in ((S, S2), (O, O2), (R, R2)))
+        for q in range(len(queries)):
+            # keep the best `pool` hits across all indexes
+            owners, rows, _ = top_k_hits(S[q], O[q], R[q], pool, min_score)
+            keys[q].extend(locate(project_index, int(r)) if o < 0 else (searchable[o]["stem"], int(r))
+                           for o, r in zip(owners, rows))
+
+    results = []
+    for q, query in enumerate(queries):
+        lexical_scores: Dict[Tuple[str, int], float] = {}
+        if use_lexical:
+            for stem, idx, score in lexical_search(project_id, query, top_k=total_passages * 4):
+                if stem in by_stem:
+                    keys[q].append((stem, idx))
+                    lexical_scores[(stem, idx)] = score
+        results.append(_select_passages(
+            by_stem, keys[q], lexical_scores, qmat[q] if qmat is not None else None,
+            total_passages, max_per_doc, trim, mmr_lambda, dup_threshold, hybrid_alpha))
+    return results
+
+def retrieve_passages_for_query(resources: List[Dict[str,Any]], query: str, **kwargs) -> List[Dict[str, Any]]:
+    """Single-query form of retrieve_passages_for_queries (same keyword arguments)."""
+    return retrieve_passages_for_queries(resources, [query], **kwargs)[0]
+
 def synthesize_rq_answer(rq: str, notes: List[Dict[str,Any]], model=CHAT_MODEL) -> str:
     ev_lines = []
     for n in notes:
@@ -161,13 +299,12 @@ Rules:
     ]
     return call_openai_chat(model, msg, temperature=0.2, max_tokens=2200)
 
-def synthesize_final_report(objective: str,
-                            research_questions: List[str],
-                            abstracts: List[str],
-                            rq_sections: List[Tuple[str, str, List[Dict[str,Any]]]],
-                            model=CHAT_MODEL) -> str:
-    # keep abstracts short (just for landscape)
-    abs_overview = "\n".join(f"- {a[:400]}" for a in abstracts[:40])
+def _final_report_messages(objective: str,
+                           research_questions: List[str],
+                           abstracts: List[str],
+                           rq_sections: List[Tuple[str, str, List[Dict[str,Any]]]]) -> List[Dict[str, str]]:
+    # abstracts arrive pre-selected and budgeted by select_intro_abstracts (landscape only)
+    abs_overview = "\n".join(f"- {a[:400]}" for a in abstracts)
 
     results_blocks, refs_blocks = [], []
     for i, (rq, answer_text, notes) in enumerate(rq_sections, start=1):
@@ -221,19 +358,30 @@ Rules:
 - Academic tone; specific and descriptive.
 """}
     ]
+    return msg
+
+def synthesize_final_report(objective: str,
+                            research_questions: List[str],
+                            abstracts: List[str],
+                            rq_sections: List[Tuple[str, str, List[Dict[str,Any]]]],
+                            model=CHAT_MODEL) -> str:
+    msg = _final_report_messages(objective, research_questions, abstracts, rq_sections)
     return call_openai_chat(model, msg, temperature=0.2, max_tokens=7000)
 
+def stream_final_report(objective: str,
+                        research_questions: List[str],
+                        abstracts: List[str],
+                        rq_sections: List[Tuple[str, str, List[Dict[str,Any]]]],
+                        model=CHAT_MODEL) -> Iterator[str]:
+    msg = _final_report_messages(objective, research_questions, abstracts, rq_sections)
+    return stream_openai_chat(model, msg, temperature=0.2, max_tokens=7000)
+
 
 def generate_research_objective_with_gpt(user_prompt, model="gpt-3.5-turbo"):
     """
     Generates a research objective based on a user's input prompt using OpenAI's GPT model.
     """
 
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
-
     # Construct the dynamic prompt
     prompt_content = (
         f"You are a helpful assistant skilled in writing systematic research objectives. "
@@ -249,7 +397,7 @@ def generate_research_objective_with_gpt(user_prompt, model="gpt-3.5-turbo"):
         "temperature": 0.7
     }
 
-    response = requests.post("https://api.openai.com/v1/chat/completions", headers=headers, data=json.dumps(data))
+    response = post_chat_completion(data)
 
     if response.status_code == 200:
         result = response.json()
@@ -261,12 +409,7 @@ def generate_research_objective_with_gpt(user_prompt, model="gpt-3.5-turbo"):
         return {"error": "Failed to generate research objective", "status_code": response.status_code}
 
 
-def generate_research_questions_and_purpose_with_gpt(objective, model):
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
-
+def generate_research_questions_and_purpose_with_gpt(objective, model, cache=True):
     # Construct the prompt dynamically
     prompt_content = (
     f"Given the following research objective:\n\n"
@@ -288,7 +431,6 @@ def generate_research_questions_and_purpose_with_gpt(objective, model):
     }}"""
     )
 
-
     data = {
         "model": model,
         "messages": [
@@ -332,7 +474,8 @@ def generate_research_questions_and_purpose_with_gpt(objective, model):
     #     print(response.text)
     #     return {"error": "Failed to generate research questions"}
     try:
-        response = requests.post("https://api.openai.com/v1/chat/completions", headers=headers, data=json.dumps(data))
+        # same objective -> same questions unless the caller asks to regenerate
+        response = post_chat_completion(data, cache=cache)
 
         if response.status_code == 200:
             result = response.json()
@@ -354,8 +497,6 @@ def generate_research_questions_and_purpose_with_gpt(objective, model):
 
 
 def generate_summary_conclusion(papers_info):
-    headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
-
     prompt_parts = ["Summarize the conclusions of the following papers:"]
     for paper in papers_info:
         title = paper.get("title")
@@ -372,11 +513,7 @@ def generate_summary_conclusion(papers_info):
         ],
     }
 
-    response = requests.post(
-        "https://api.openai.com/v1/chat/completions",
-        headers=headers,
-        data=json.dumps(data),
-    )
+    response = post_chat_completion(data)
 
     if response.status_code == 200:
         result = response.json()
@@ -392,10 +529,6 @@ def generate_abstract_with_openai(prompt, model):
     """Generates a summary abstract using OpenAI's GPT model based on the provided prompt."""
     # Fetching the API key from environment variables for better security practice
 
-    headers = {
-        "Authorization": f"Bearer {api_key}",  # Using the API key from environment variables
-        "Content-Type": "application/json"
-    }
     data = {
         "model": model,
         "messages": [
@@ -404,7 +537,7 @@ def generate_abstract_with_openai(prompt, model):
         ]
     }
 
-    response = requests.post("https://api.openai.com/v1/chat/completions", headers=headers, data=json.dumps(data))
+    response = post_chat_completion(data)
     if response.status_code == 200:
         result = response.json()
         content = result['choices'][0]['message']['content']
@@ -414,10 +547,6 @@ def generate_abstract_with_openai(prompt, model):
 
 
 def generate_introduction_summary_with_openai(prompt, model):
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
     data = {
         "model": model,
         "messages": [
@@ -425,7 +554,7 @@ def generate_introduction_summary_with_openai(prompt, model):
             {"role": "user", "content": prompt}
         ]
     }
-    response = requests.post("https://api.openai.com/v1/chat/completions", headers=headers, data=json.dumps(data))
+    response = post_chat_completion(data)
     if response.status_code == 200:
         result = response.json()
         content = result['choices'][0]['message']['content']
@@ -434,49 +563,63 @@ def generate_introduction_summary_with_openai(prompt, model):
         raise Exception("Failed to generate the introduction summary from OpenAI.")
 
 
-def generate_research_report(project_id, research_questions, objective, model):
+def iter_research_report(project_id, research_questions, objective, model) -> Iterator[Dict[str, Any]]:
     """
-    NEW behavior:
-      - Uses abstracts for Intro/landscape.
-      - Uses FAISS+embeddings for per-RQ retrieval & synthesis.
-      - Produces a full SLR with per-RQ answers and citations.
-    Returns: {"report": str, "sources": [...], "rq_notes": {...}} OR {"error": ...}
+    Staged form of generate_research_report. Yields event dicts as each stage completes:
+      {"event": "rq_retrieved", "rq_index", "rq", "n_notes"}   per RQ
+      {"event": "rq_synthesis", "rq_index", "rq", "text"}      per RQ
+      {"event": "token", "text"}                               final report deltas
+      {"event": "done", "message", "report", "sources", "rq_notes"}
+    or a single {"event": "error", "error": ...}.
     """
-    # 1) Load abstracts (optional but nice for Intro)
-    abstracts = load_abstracts_from_csv(project_id)
+    # 1) Representative abstracts for the Intro (optional but nice)
+    abstracts = select_intro_abstracts(project_id)
 
     # 2) Load FAISS resources
     resources = load_all_embeddings(project_id)
     if not resources:
-        return {"error": "No embeddings/FAISS indexes found for this project. Upload papers and build indexes first."}
+        yield {"event": "error", "error": "No embeddings/FAISS indexes found for this project. Upload papers and build indexes first."}
+        return
+    project_index = load_project_index(project_id)  # None for small corpora
 
     if not research_questions:
-        return {"error": "No research questions provided"}
+        yield {"event": "error", "error": "No research questions provided"}
+        return
 
     # 3) For each RQ: retrieve notes + synthesize an answer
     rq_sections = []          # (rq, synthesized_text, notes)
     rq_notes_map = {}         # rq -> notes
 
-    for rq in research_questions:
-        notes = retrieve_passages_for_query(
-            resources,
-            rq,
-            total_passages=24,   # tune (12–36 typical)
-            max_per_doc=2,       # diversify sources
-            trim=700             # keep notes compact
-        )
+    # one embedding request and one FAISS call per index for all RQs
+    notes_per_rq = retrieve_passages_for_queries(
+        resources,
+        research_questions,
+        project_id=project_id,
+        project_index=project_index,
+        total_passages=24,   # tune (12–36 typical)
+        max_per_doc=2,       # diversify sources
+        trim=700             # keep notes compact
+    )
+    for i, (rq, notes) in enumerate(zip(research_questions, notes_per_rq)):
+        yield {"event": "rq_retrieved", "rq_index": i, "rq": rq, "n_notes": len(notes)}
+    for i, (rq, notes) in enumerate(zip(research_questions, notes_per_rq)):
         answer_text = synthesize_rq_answer(rq, notes, model=model)
         rq_sections.append((rq, answer_text, notes))
         rq_notes_map[rq] = notes
+        yield {"event": "rq_synthesis", "rq_index": i, "rq": rq, "text": answer_text}
 
-    # 4) Compose final SLR
-    report = synthesize_final_report(
+    # 4) Compose final SLR, streamed
+    parts = []
+    for delta in stream_final_report(
         objective=objective,
         research_questions=research_questions,
         abstracts=abstracts,
         rq_sections=rq_sections,
         model=model
-    )
+    ):
+        parts.append(delta)
+        yield {"event": "token", "text": delta}
+    report = "".join(parts)
 
     # 5) Build flat sources list (nice for Phase 3 sidebar)
     all_sources = []
@@ -493,13 +636,30 @@ def generate_research_report(project_id, research_questions, objective, model):
             if entry not in all_sources:
                 all_sources.append(entry)
 
-    return {
+    yield {
+        "event": "done",
         "message": "SLR report generated successfully.",
         "report": report,
         "sources": all_sources,
         "rq_notes": rq_notes_map
     }
 
+def generate_research_report(project_id, research_questions, objective, model):
+    """
+    NEW behavior:
+      - Uses abstracts for Intro/landscape.
+      - Uses FAISS+embeddings for per-RQ retrieval & synthesis.
+      - Produces a full SLR with per-RQ answers and citations.
+    Returns: {"report": str, "sources": [...], "rq_notes": {...}} OR {"error": ...}
+    """
+    for event in iter_research_report(project_id, research_questions, objective, model):
+        if event["event"] == "error":
+            return {"error": event["error"]}
+        if event["event"] == "done":
+            event.pop("event")
+            return event
+    return {"error": "Report generation ended without a result"}
+
     
 def refine_research_report(existing_report, user_feedback, model="gpt-4"):
     """Refines an AI-generated research report based on user feedback."""
@@ -515,11 +675,6 @@ def refine_research_report(existing_report, user_feedback, model="gpt-4"):
     Please adjust and improve the report accordingly, while preserving structure and coherence.
     """
 
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
-
     data = {
         "model": model,
         "messages": [
@@ -530,7 +685,7 @@ def refine_research_report(existing_report, user_feedback, model="gpt-4"):
     }
 
     try:
-        response = requests.post("https://api.openai.com/v1/chat/completions", headers=headers, data=json.dumps(data))
+        response = post_chat_completion(data)
 
         if response.status_code == 200:
             result = response.json()
@@ -1,20 +1,48 @@
 # agents2.py
-import requests
 import json
-import os
 import re
-key = os.getenv("API-KEY")
-api_key = key
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from llm_gateway import post_chat_completion
+from boolean_query import parse, terms, normalize_search_string, apply_refinement, MAX_SEARCH_STRING_CHARS
+
+# models that accept response_format={"type": "json_object"}
+JSON_MODE_MODELS = ("gpt-4o", "gpt-4.1", "gpt-4-turbo", "gpt-4-1106", "gpt-4-0125", "gpt-3.5-turbo")
+
+
+def supports_json_mode(model):
+    return bool(model) and model.startswith(JSON_MODE_MODELS) and model != "gpt-3.5-turbo-0613"
+
+
+def run_stage_graph(stages, max_workers=4):
+    """
+    Runs {name: (fn, [dependency names])} with each stage started as soon as
+    its dependencies finish; fn receives the dict of results so far.
+    Returns {name: result}.
+    """
+    results, timings, pending = {}, {}, {}
+    remaining = dict(stages)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while remaining or pending:
+            for name, (fn, deps) in list(remaining.items()):
+                if all(d in results for d in deps):
+                    pending[pool.submit(fn, dict(results))] = (name, time.perf_counter())
+                    del remaining[name]
+            if not pending:
+                raise ValueError(f"Unsatisfiable stage dependencies: {sorted(remaining)}")
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                name, started = pending.pop(fut)
+                results[name] = fut.result()
+                timings[name] = round((time.perf_counter() - started) * 1000)
+    print(f"Stage timings (ms): {timings}")
+    return results
 
 
 def extract_pico_elements(objective, research_questions, model):
     """
     Extracts PICO elements (Population, Intervention, Comparison, Outcome) from a research objective and research questions.
     """
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
 
     prompt_content = f"""
     Given the research objective: '{objective}' and the research questions: {', '.join(research_questions)}, 
@@ -44,8 +72,7 @@ def extract_pico_elements(objective, research_questions, model):
         "temperature": 0.5
     }
 
-    response = requests.post(
-        "https://api.openai.com/v1/chat/completions", headers=headers, data=json.dumps(data))
+    response = post_chat_completion(data, cache=True)
 
     if response.status_code == 200:
         result = response.json()
@@ -73,10 +100,6 @@ def extract_elements_by_strategy(objective, research_questions, model, search_st
     """
     Extracts key elements based on the selected search strategy (PICO, SPIDER, etc.).
     """
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
 
     prompt_content = f"""
     Given the research objective: '{objective}' 
@@ -107,8 +130,7 @@ def extract_elements_by_strategy(objective, research_questions, model, search_st
         "temperature": 0.5
     }
 
-    response = requests.post(
-        "https://api.openai.com/v1/chat/completions", headers=headers, data=json.dumps(data))
+    response = post_chat_completion(data, cache=True)
 
     if response.status_code == 200:
         result = response.json()
@@ -132,27 +154,97 @@ def extract_elements_by_strategy(objective, research_questions, model, search_st
         return {"error": f"Failed to extract {search_strategy} elements"}
 
 
-def generate_search_string_with_gpt(objective, research_questions, model, search_strategy):
+def extract_elements_and_keywords(objective, research_questions, model, search_strategy):
     """
-    Generates a search string based on the selected search strategy (PICO, SPIDER, etc.).
+    One JSON-mode call that returns both the framework elements and the
+    keyword list. Returns (elements_dict, keywords_json) or None when the
+    output can't be used, so the caller can fall back to separate calls.
     """
+    prompt_content = f"""
+    Given the research objective: '{objective}'
+    Research Questions: {json.dumps(research_questions, indent=2)}
 
-    # Step 1: Extract relevant elements based on the search strategy
-    extracted_elements = extract_elements_by_strategy(
-        objective, research_questions, model, search_strategy)
+    1. Extract the key elements based on the **{search_strategy}** framework.
+    - If {search_strategy} is **PICO**, extract Population, Intervention, Comparison, and Outcome.
+    - If {search_strategy} is **SPIDER**, extract Sample, Phenomenon of Interest, Design, Evaluation, and Research type.
+    - If {search_strategy} is **PEO**, extract Population, Exposure, and Outcome.
+    - If {search_strategy} is **Other**, extract relevant components based on the research context.
+    2. Extract the MOST important keywords (1–4 words each) from the objective and questions.
 
-    if "error" in extracted_elements:
-        return f"Failed to extract {search_strategy} elements. Search query generation aborted."
+    **Output Format (STRICT JSON, no explanations):**
+    {{
+      "elements": {{"Component1": ["example1", "example2"], "Component2": ["example1", "example2"]}},
+      "keywords": ["keyword1", "keyword2", "keyword phrase3"]
+    }}
+    """
 
-    # Step 2: Construct search query based on extracted elements
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
+    data = {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": f"You are an AI assistant that extracts {search_strategy} elements and search keywords for systematic literature reviews."},
+            {"role": "user", "content": prompt_content}
+        ],
+        "temperature": 0.3,
+        "response_format": {"type": "json_object"}
     }
-    
-    keywords = extract_keywords(objective, research_questions, model)
 
-    # Step 3: Build a dynamic prompt for query generation
+    response = post_chat_completion(data, cache=True)
+    if response.status_code != 200:
+        print(f"❌ OpenAI API Error: {response.status_code}")
+        print(response.text)
+        return None
+    try:
+        parsed = json.loads(response.json()['choices'][0]['message']['content'])
+        elements, keywords = parsed["elements"], parsed["keywords"]
+    except (json.JSONDecodeError, KeyError, TypeError):
+        print("❌ Combined extraction returned unusable JSON, falling back to separate calls.")
+        return None
+    if not isinstance(elements, dict) or not elements or not isinstance(keywords, list):
+        return None
+    return elements, json.dumps(keywords)
+
+
+def generate_search_string_with_gpt(objective, research_questions, model, search_strategy, merge_extraction=None):
+    """
+    Generates a search string based on the selected search strategy (PICO, SPIDER, etc.).
+
+    Runs as a stage graph: the element and keyword extractions don't depend on
+    each other, so they run concurrently, or as one JSON-mode call when the
+    model supports it (merge_extraction=None decides by model), and only the
+    final query composition waits for both.
+    """
+    if merge_extraction is None:
+        merge_extraction = supports_json_mode(model)
+
+    def separate(_):
+        stages = {
+            "elements": (lambda r: extract_elements_by_strategy(objective, research_questions, model, search_strategy), []),
+            "keywords": (lambda r: extract_keywords(objective, research_questions, model), []),
+        }
+        results = run_stage_graph(stages)
+        return results["elements"], results["keywords"]
+
+    def extraction(r):
+        merged = extract_elements_and_keywords(objective, research_questions, model, search_strategy)
+        return merged if merged is not None else separate(r)
+
+    def query(r):
+        extracted_elements, keywords = r["extraction"]
+        if "error" in extracted_elements:
+            return f"Failed to extract {search_strategy} elements. Search query generation aborted."
+        return compose_search_string(objective, research_questions, model, search_strategy,
+                                     extracted_elements, keywords)
+
+    stages = {
+        "extraction": (extraction if merge_extraction else separate, []),
+        "query": (query, ["extraction"]),
+    }
+    return run_stage_graph(stages)["query"]
+
+
+def compose_search_string(objective, research_questions, model, search_strategy, extracted_elements, keywords):
+    """Final stage: turns the extracted elements and keywords into a Boolean search string."""
+    # Build a dynamic prompt for query generation
     prompt_content = f"""
     Given the research objective: '{objective}',
     research questions: {', '.join(research_questions)},
@@ -199,18 +291,17 @@ def generate_search_string_with_gpt(objective, research_questions, model, search
         "temperature": 0.7
     }
 
-    response = requests.post(
-        "https://api.openai.com/v1/chat/completions", headers=headers, data=json.dumps(data))
+    response = post_chat_completion(data)
 
     if response.status_code == 200:
         result = response.json()
         content = result['choices'][0]['message']['content']
         print(f"Generated Query ({search_strategy}): {content}")
 
-        # Extract and clean the search query
+        # Extract the query, then drop long phrases, keep 3 AND groups and fit the length limit
         raw_search_string = extract_search_string(content)
-        cleaned = clean_query_terms(raw_search_string)
-        simplified = simplify_search_query(cleaned)
+        simplified = normalize_search_string(raw_search_string, max_words=3, max_groups=3,
+                                             max_chars=MAX_SEARCH_STRING_CHARS)
 
         print("Simplified Query:", simplified)
         return simplified.strip()
@@ -221,40 +312,45 @@ def generate_search_string_with_gpt(objective, research_questions, model, search
 
 
 def extract_search_string(response_text):
-    lines = response_text.strip().split("\n")
-    for line in lines:
-        if line.startswith("(") and ")" in line:
-            return line
-    return response_text.strip()
+    """
+    Picks the Boolean query out of an LLM reply: the line (or the whole reply,
+    for queries wrapped over several lines) that parses with the fewest
+    problems and the most terms. Code fences and labels are ignored.
+    """
+    text = re.sub(r"```[a-zA-Z]*", "", response_text or "").strip()
+    candidates = [line.strip() for line in text.split("\n") if re.search(r"\b(?:AND|OR)\b|\(", line)]
+    candidates.append(text)
+    best, best_rank = text, None
+    for candidate in candidates:
+        candidate = re.sub(r"^[^(\"]*?:\s*", "", candidate)  # "Search string: (...)"
+        node, warnings = parse(candidate)
+        if node is None:
+            continue
+        rank = (len(warnings), -len(terms(node)))
+        if best_rank is None or rank < best_rank:
+            best, best_rank = candidate, rank
+    return best.strip()
 
 def clean_query_terms(query, max_words=3):
-    terms = re.findall(r'"(.*?)"', query)
-    clean_terms = [t for t in terms if len(t.split()) <= max_words]
-    for t in terms:
-        if t not in clean_terms:
-            query = query.replace(f'"{t}"', '')
-    return query
+    """Drops quoted terms longer than max_words without leaving empty groups behind."""
+    return normalize_search_string(query, max_words=max_words)
 
 def simplify_search_query(query, max_groups=3):
     """
-    Keep up to max_groups OR groups joined with AND.
+    Keep up to max_groups AND groups (exclusions are kept).
     """
-    or_groups = re.findall(r'\(([^()]+ OR [^()]+)\)', query)
-    if len(or_groups) >= max_groups:
-        return " AND ".join(f'({grp})' for grp in or_groups[:max_groups])
-    elif len(or_groups) > 0:
-        return " AND ".join(f'({grp})' for grp in or_groups)
-    else:
-        return query
+    return normalize_search_string(query, max_groups=max_groups)
 
 def refine_search_string_with_gpt(search_string, feedback, model):
     """
-    Uses GPT to refine an existing search string based on user feedback.
+    Refines an existing search string based on user feedback. Structural edits
+    (add/remove/exclude terms, new or merged groups) are applied locally;
+    anything else goes to GPT.
     """
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
+    local = apply_refinement(search_string, feedback)
+    if local:
+        print(f"Refined locally: {local}")
+        return local
 
     prompt_content = f"""
     You are an expert in refining literature search queries. Given the current search string:
@@ -283,14 +379,13 @@ def refine_search_string_with_gpt(search_string, feedback, model):
         "temperature": 0.5
     }
 
-    response = requests.post(
-        "https://api.openai.com/v1/chat/completions", headers=headers, data=json.dumps(data))
+    response = post_chat_completion(data)
 
     if response.status_code == 200:
         result = response.json()
         refined_query = extract_search_string(
             result['choices'][0]['message']['content'])
-        return refined_query.strip()
+        return normalize_search_string(refined_query).strip()
     else:
         return "Error refining search string."
 
@@ -314,7 +409,5 @@ def extract_keywords(objective, research_questions, model):
         "temperature": 0.3
     }
 
-    response = requests.post("https://api.openai.com/v1/chat/completions",
-                             headers={"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"},
-                             data=json.dumps(data))
+    response = post_chat_completion(data, cache=True)
     return response.json()["choices"][0]["message"]["content"]
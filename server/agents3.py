@@ -1,56 +1,127 @@
 import csv
-from scholarly import ProxyGenerator, scholarly
 import os
+import time
+import threading
 import requests
 import xml.etree.ElementTree as ET
-from urllib.parse import quote
+from boolean_query import parse, normalize, to_scopus, to_arxiv, to_semantic_scholar, drop_unsupported_not
 
 api_key = os.getenv('ELSEVIER_API_KEY')
 
 ieee_api_key = os.getenv('IEEE_API_KEY')
+
+SCHOLAR_DEADLINE_S = float(os.getenv("SCHOLAR_DEADLINE_S", "20"))
+SCHOLAR_CACHE_TTL_S = float(os.getenv("SCHOLAR_CACHE_TTL_S", str(24 * 3600)))
+SCHOLAR_CACHE_ENTRIES = 256
+
 # Initialize a global variable to track if the proxy setup has been done
 proxy_setup_done = False
+_scholarly = None
+_scholarly_lock = threading.Lock()
 
-def setup_proxy():
-    global proxy_setup_done
-    # Check if the proxy setup has already been done
-    if not proxy_setup_done:
-        # Set up a ProxyGenerator object to use free proxies
-        pg = ProxyGenerator()
-        pg.FreeProxies()
-        scholarly.use_proxy(pg)
-        
-        # Mark the setup as done
-        proxy_setup_done = True
-        print("Proxy setup completed.")
-    else:
-        print("Proxy setup was already completed earlier in this session.")
+# (search string, min_results) -> {"papers", "done", "finished", "error"}
+_scholar_results = {}
+_scholar_results_lock = threading.Lock()
 
-# Example usage
-setup_proxy()
+def setup_proxy():
+    """
+    Imports scholarly and routes it through free proxies on first use rather
+    than at import time, so importing this module (and starting the server)
+    needs no network. Returns the configured scholarly client.
+    """
+    global proxy_setup_done, _scholarly
+    with _scholarly_lock:
+        # Check if the proxy setup has already been done
+        if not proxy_setup_done:
+            from scholarly import ProxyGenerator, scholarly
+
+            # Set up a ProxyGenerator object to use free proxies
+            pg = ProxyGenerator()
+            pg.FreeProxies()
+            scholarly.use_proxy(pg)
+
+            # Mark the setup as done
+            _scholarly = scholarly
+            proxy_setup_done = True
+            print("Proxy setup completed.")
+        return _scholarly
+
+
+def _parse_scholar_paper(paper):
+    return {
+        'title': paper['bib']['title'],
+        'author': paper['bib'].get('author'),
+        'pub_year': paper['bib'].get('pub_year'),
+        'publication_url': paper.get('pub_url', 'Not Available'),
+        'journal_name': paper['bib'].get('journal', 'Not Available'),
+        # Attempting to extract DOI, publication date, and making an educated guess on paper type
+        'doi': paper.get('doi', 'Not Available'),
+        'publication_date': paper['bib'].get('pub_year', 'Not Available'), # Simplified to publication year
+        'paper_type': 'Journal' if 'journal' in paper['bib'] else 'Conference' if 'conference' in paper['bib'] else 'Primary Study' # Simplistic categorization
+    }
 
 
-def fetch_papers(search_string, min_results=8):
-    search_query = scholarly.search_pubs(search_string)
-    papers_details = []
-    for _ in range(min_results):
-        try:
-            paper = next(search_query)
-            paper_details = {
-                'title': paper['bib']['title'],
-                'author': paper['bib'].get('author'),
-                'pub_year': paper['bib'].get('pub_year'),
-                'publication_url': paper.get('pub_url', 'Not Available'),
-                'journal_name': paper['bib'].get('journal', 'Not Available'),
-                # Attempting to extract DOI, publication date, and making an educated guess on paper type
-                'doi': paper.get('doi', 'Not Available'),
-                'publication_date': paper['bib'].get('pub_year', 'Not Available'), # Simplified to publication year
-                'paper_type': 'Journal' if 'journal' in paper['bib'] else 'Conference' if 'conference' in paper['bib'] else 'Primary Study' # Simplistic categorization
-            }
-            papers_details.append(paper_details)
-        except StopIteration:
-            break  # Exit if there are no more results
-    return papers_details
+def _scrape_scholar(key, entry, search_string, min_results):
+    """
+    Worker thread: appends papers to entry as they arrive, then sets
+    entry['done']. A failed scrape is dropped from the cache so its partial
+    list is never served as a result.
+    """
+    try:
+        search_query = setup_proxy().search_pubs(search_string)
+        for _ in range(min_results):
+            try:
+                paper = next(search_query)
+            except StopIteration:
+                break  # Exit if there are no more results
+            entry["papers"].append(_parse_scholar_paper(paper))
+    except Exception as e:
+        entry["error"] = str(e)
+        print(f"❌ Scholar search failed for '{search_string}': {e}")
+        with _scholar_results_lock:
+            if _scholar_results.get(key) is entry:
+                del _scholar_results[key]
+    finally:
+        entry["finished"] = time.time()
+        entry["done"].set()
+
+
+def fetch_papers(search_string, min_results=8, deadline_s=SCHOLAR_DEADLINE_S):
+    """Google Scholar papers for search_string; see fetch_papers_with_status."""
+    return fetch_papers_with_status(search_string, min_results, deadline_s)[0]
+
+
+def fetch_papers_with_status(search_string, min_results=8, deadline_s=SCHOLAR_DEADLINE_S):
+    """
+    (papers, complete) for search_string, returned within deadline_s.
+
+    Only scrapes that finished without an error are reused, per search
+    string; a failed scrape is dropped and returns complete=False. When the
+    deadline passes first, the papers found so far are returned with
+    complete=False and the scrape carries on in the background, so a later
+    call for the same string gets the full list. Concurrent calls for one
+    string share a single scrape.
+    """
+    key = (search_string.strip(), min_results)
+    now = time.time()
+    with _scholar_results_lock:
+        entry = _scholar_results.get(key)
+        expired = entry is not None and entry["done"].is_set() and now - entry["finished"] > SCHOLAR_CACHE_TTL_S
+        if entry is None or expired:
+            if len(_scholar_results) >= SCHOLAR_CACHE_ENTRIES:
+                finished = sorted((e["finished"], k) for k, e in _scholar_results.items() if e["done"].is_set())
+                for _, old_key in finished[:len(finished) // 2 or 1]:
+                    del _scholar_results[old_key]
+            entry = {"papers": [], "done": threading.Event(), "finished": 0.0, "error": None}
+            _scholar_results[key] = entry
+            threading.Thread(target=_scrape_scholar, args=(key, entry, search_string, min_results),
+                             name="scholar-search", daemon=True).start()
+
+    if not entry["done"].wait(deadline_s):
+        print(f"⚠️ Scholar search hit the {deadline_s:g}s deadline; returning {len(entry['papers'])}/{min_results} "
+              f"papers as a truncated result")
+        return list(entry["papers"]), False
+    return list(entry["papers"]), entry["error"] is None
 
 
 def save_papers_to_csv(papers_details, filename='papers.csv'):
@@ -108,6 +179,33 @@ def encode_search_string(search_string):
     encoded_string = urllib.parse.quote(search_string, safe='')
     return encoded_string
 
+def parse_search_string(search_string):
+    """Normalised Boolean AST of the search string, or None if it has no terms."""
+    node, warnings = parse(search_string)
+    if warnings:
+        print(f"Search string repaired: {warnings}")
+    return normalize(node)
+
+def build_elsevier_query(search_string, start_year, end_year, is_english):
+    """
+    Scopus query for the search string plus the year and language filters.
+    Years are inclusive, like the arXiv date range and the local corpus count;
+    Scopus only has strict PUBYEAR comparisons, hence the +/- 1.
+    """
+    node = parse_search_string(search_string)
+    title_abs = to_scopus(node) if node else f'TITLE-ABS({search_string})'
+    if end_year and str(start_year) != str(end_year):
+        query_parts = [title_abs, f'PUBYEAR > {int(start_year) - 1}', f'PUBYEAR < {int(end_year) + 1}']
+    else:
+        query_parts = [title_abs, f'PUBYEAR = {start_year}']
+
+    # Add English language filter if needed
+    if is_english:
+        query_parts.append('LANGUAGE(english)')
+
+    # Join all parts with AND
+    return ' AND '.join(f'({part})' for part in query_parts)
+
 def search_elsevier(search_string, start_year, end_year, limit, is_english, is_peer_reviewed, keywords, is_cited):
     url = "https://api.elsevier.com/content/search/scopus"
     headers = {
@@ -128,17 +226,7 @@ def search_elsevier(search_string, start_year, end_year, limit, is_english, is_p
     # else:
     #     query = f'TITLE-ABS-KEY({search_string}) AND PUBYEAR = {start_year}'
         
-    if end_year and start_year != end_year:
-        query_parts = [f'TITLE-ABS({search_string})', f'PUBYEAR > {start_year}', f'PUBYEAR < {end_year}']
-    else:
-        query_parts = [f'TITLE-ABS({search_string})', f'PUBYEAR = {start_year}']
-
-    # Add English language filter if needed
-    if is_english:
-        query_parts.append('LANGUAGE(english)')
-
-    # Join all parts with AND
-    query = ' AND '.join(f'({part})' for part in query_parts)
+    query = build_elsevier_query(search_string, start_year, end_year, is_english)
 
 
     total_fetched = 0
@@ -245,14 +333,24 @@ def search_elsevier(search_string, start_year, end_year, limit, is_english, is_p
         
     return all_papers
 
-def search_arxiv(search_string, start_year, end_year, limit):
-    search_query = f"all:{search_string}"
+def build_arxiv_query(search_string, start_year, end_year):
+    """arXiv search_query for the search string restricted to the submission years."""
+    warnings = []
+    node = drop_unsupported_not(parse_search_string(search_string), warnings)
+    if warnings:
+        print(f"⚠️ arXiv query rewritten: {warnings}")
+    # every term needs its own all: prefix; the date filter applies to the whole expression
+    search_query = f"({to_arxiv(node)})" if node else f"all:{search_string}"
      # Ensure that start_year is always used in the query
     if end_year:
         search_query += f" AND submittedDate:[{start_year}01010000 TO {end_year}12312359]"
     else:
         search_query += f" AND submittedDate:[{start_year}01010000 TO {start_year}12312359]"
         # search_query = f"AND submittedDate:{start_year}"
+    return search_query
+
+def search_arxiv(search_string, start_year, end_year, limit):
+    search_query = build_arxiv_query(search_string, start_year, end_year)
     
     url = "http://export.arxiv.org/api/query"
     params = {
@@ -364,8 +462,10 @@ def search_semantic_scholar(search_string, start_year, end_year, limit, is_engli
     
     print(f"search string: {search_string}")
 
+    # /paper/search is plain-text relevance search and ignores Boolean operators
+    node = parse_search_string(search_string)
     params = {
-        "query": search_string,
+        "query": to_semantic_scholar(node) if node else search_string,
         "limit": limit,
         "year": "2024-",
         "fields": "title,url,publicationTypes,publicationDate,openAccessPdf,authors"
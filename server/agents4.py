@@ -1,7 +1,6 @@
 # agent4.py
-import requests
-import os
-api_key = os.getenv("API-KEY")
+from llm_gateway import post_chat_completion
+from llm_dispatcher import PRIORITY_BULK
 import re
 import fitz 
 import json
@@ -47,11 +46,6 @@ def extract_structured_data_from_ai(pdf_path, model="gpt-4o"):
     {pdf_text[:3000]}  # Limit text length to avoid token overflow
     """
 
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json",
-    }
-    
     data = {
         "model": model,
         "messages": [
@@ -62,7 +56,7 @@ def extract_structured_data_from_ai(pdf_path, model="gpt-4o"):
         "max_tokens": 512
     }
     
-    response = requests.post("https://api.openai.com/v1/chat/completions", headers=headers, json=data)
+    response = post_chat_completion(data, priority=PRIORITY_BULK, cache=True)
 
     if response.status_code == 200:
         try:
@@ -84,7 +78,6 @@ def extract_structured_data_from_ai(pdf_path, model="gpt-4o"):
         return {"error": f"OpenAI API error: {response.status_code}", "details": response.text}
 
 def check_paper_relevance_and_keywords(title, search_string, model):
-    headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
     # Adjust the prompt to ask for relevance and keywords
     prompt = (f"Determine if the paper titled '{title}' is relevant to the topic '{search_string}'. "
               "and in return just informed paper is relevant or paper is not relevant, to the point.")
@@ -97,7 +90,7 @@ def check_paper_relevance_and_keywords(title, search_string, model):
         ]
     }
 
-    response = requests.post("https://api.openai.com/v1/chat/completions", headers=headers, json=data)
+    response = post_chat_completion(data, priority=PRIORITY_BULK)
     if response.status_code == 200:
         result = response.json()
         response_text = result['choices'][0]['message']['content'].strip().lower()
@@ -115,25 +108,20 @@ def check_paper_relevance_and_keywords(title, search_string, model):
     return (False, [])
 
 def filter_papers_with_gpt_turbo(search_string, papers, model):
+    """
+    Keeps the papers whose title the model judges relevant. `papers` is a flat
+    list of paper dicts (agents3.fetch_papers) or a list of per-source lists
+    (the /api/filter_papers payload); both yield one flat list.
+    """
     filtered_titles = []
 
-    # Check if there are at least two arrays in papers
-    if len(papers) >= 2:
-        first_array = papers[0]
-        second_array = papers[1]
-
-        # Extract titles from the first array
-        for paper in first_array:
-            title = paper.get('title', '')
+    for paper in papers:
+        group = paper if isinstance(paper, list) else [paper]
+        for item in group:
+            title = item.get('title', '')
             if title and check_paper_relevance_and_keywords(title, search_string, model):
-                filtered_titles.append(paper)
-        
-        # Extract titles from the second array
-        for paper in second_array:
-            title = paper.get('title', '')
-            if title and check_paper_relevance_and_keywords(title, search_string, model):
-                filtered_titles.append(paper)
-    
+                filtered_titles.append(item)
+
     return filtered_titles
 
 def is_response_relevant(response):
@@ -171,10 +159,6 @@ def generate_response_gpt4_turbo(question, papers_info, model, source_type):
         "content": "Based on the provided papers information, please answer the research question and cite relevant references for cross-verification."
     })
     
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json",
-    }
     
     data = {
         "model": model,
@@ -183,7 +167,7 @@ def generate_response_gpt4_turbo(question, papers_info, model, source_type):
         "max_tokens": 512
     }
     
-    response = requests.post("https://api.openai.com/v1/chat/completions", headers=headers, json=data, timeout=800)
+    response = post_chat_completion(data, timeout=800)
     
     if response.status_code == 200:
         result = response.json()
@@ -0,0 +1,47 @@
+# bench_deep_research.py
+"""
+Offline throughput benchmark for the deep-research source pipeline, using a
+synthetic fixture with simulated search / fetch latency (no network, no LLM).
+
+    python bench_deep_research.py --subquestions 8 --fetch-ms 1500 --hosts 20
+    python bench_deep_research.py --fixture recorded.json
+"""
+import argparse
+import time
+
+from deep_researcher import gather_sources, MAX_SOURCES
+from search_providers import FixtureProvider
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixture", help="replay a recorded fixture instead of a synthetic one")
+    parser.add_argument("--subquestions", type=int, default=8)
+    parser.add_argument("--hits", type=int, default=400)
+    parser.add_argument("--hosts", type=int, default=20)
+    parser.add_argument("--search-ms", type=int, default=800)
+    parser.add_argument("--fetch-ms", type=int, default=1500)
+    parser.add_argument("--max-sources", type=int, default=MAX_SOURCES)
+    parser.add_argument("--deadline", type=float, default=90.0)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.fixture:
+        provider = FixtureProvider.from_file(args.fixture)
+    else:
+        provider = FixtureProvider.synthetic(args.hits, args.hosts, search_ms=args.search_ms, fetch_ms=args.fetch_ms)
+    subquestions = [f"benchmark subquestion {i}" for i in range(args.subquestions)]
+    serial_s = args.subquestions * provider.search_latency + args.max_sources * provider.fetch_latency
+    print(f"subquestions={args.subquestions} max_sources={args.max_sources} "
+          f"search={provider.search_latency * 1000:.0f}ms fetch={provider.fetch_latency * 1000:.0f}ms "
+          f"(serial estimate {serial_s:.1f}s)")
+
+    for run in range(args.runs):
+        t0 = time.perf_counter()
+        sources = gather_sources(subquestions, provider, max_sources=args.max_sources, deadline_s=args.deadline)
+        elapsed = time.perf_counter() - t0
+        print(f"run {run + 1}: {len(sources)} sources in {elapsed:.2f}s ({len(sources) / elapsed:.1f} sources/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+# bench_retrieval.py
+"""
+Offline retrieval benchmarks on synthetic clustered vectors (no API calls).
+
+    python bench_retrieval.py tiers --n 200000 --dim 1536
+    python bench_retrieval.py merge --indexes 10 100 500
+    python bench_retrieval.py quant --n 50000
+"""
+import argparse
+import time
+
+import numpy as np
+import faiss
+
+from vector_index import build_index, INDEX_TYPES
+from retrieval_utils import search_all, top_k_hits, similarity_scores
+
+
+def synthetic_corpus(n: int, dim: int, n_queries: int, n_clusters: int = 256, seed: int = 0):
+    """Unit-length vectors drawn around random centres, roughly like embedding space."""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((n_clusters, dim)).astype("float32")
+    assign = rng.integers(0, n_clusters, n + n_queries)
+    x = centres[assign] + 0.6 * rng.standard_normal((n + n_queries, dim)).astype("float32")
+    x /= np.linalg.norm(x, axis=1, keepdims=True)
+    return x[:n], x[n:]
+
+
+def recall_at_k(truth: np.ndarray, found: np.ndarray) -> float:
+    k = truth.shape[1]
+    hits = sum(len(set(t) & set(f[f >= 0])) for t, f in zip(truth, found))
+    return hits / (k * len(truth))
+
+
+def bench_tiers(n: int, dim: int, n_queries: int, k: int) -> None:
+    corpus, queries = synthetic_corpus(n, dim, n_queries)
+    print(f"corpus={n} dim={dim} queries={n_queries} k={k}")
+    print(f"{'index':<10}{'build s':>10}{'ms/query':>12}{'recall@k':>10}")
+
+    truth = None
+    for index_type in INDEX_TYPES:
+        t0 = time.perf_counter()
+        index, config = build_index(corpus, index_type)
+        build_s = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        for q in queries:
+            index.search(q.reshape(1, -1), k)  # one query at a time, like /api/rag_chat
+        ms = (time.perf_counter() - t0) * 1000 / n_queries
+        _, found = index.search(queries, k)
+        if truth is None:
+            truth = found  # flat runs first and is exact
+        print(f"{config['type']:<10}{build_s:>10.2f}{ms:>12.3f}{recall_at_k(truth, found):>10.3f}")
+
+
+def _merge_python(indexes, chunks, query, k):
+    # previous approach: a tuple per hit from every index, then a full sort
+    matched = []
+    for index, index_chunks in zip(indexes, chunks):
+        D, I = index.search(query, k)
+        for score, idx in zip(similarity_scores(index, D[0]), I[0]):
+            if 0 <= idx < len(index_chunks):
+                matched.append((float(score), index_chunks[idx]))
+    return [c for _, c in sorted(matched, key=lambda x: x[0], reverse=True)[:k]]
+
+
+def _merge_vectorised(indexes, chunks, query, k):
+    S, O, R = search_all(indexes, query, k)
+    owners, rows, _ = top_k_hits(S[0], O[0], R[0], k)
+    return [chunks[o][r] for o, r in zip(owners, rows)]
+
+
+def bench_merge(index_counts, chunks_per_index: int, dim: int, k: int, repeats: int) -> None:
+    print(f"chunks/index={chunks_per_index} dim={dim} k={k} repeats={repeats}")
+    print(f"{'indexes':>8}{'python ms':>12}{'numpy ms':>12}{'speedup':>10}")
+    for n_indexes in index_counts:
+        corpus, queries = synthetic_corpus(n_indexes * chunks_per_index, dim, repeats)
+        indexes, chunks = [], []
+        for i in range(n_indexes):
+            block = corpus[i * chunks_per_index:(i + 1) * chunks_per_index]
+            index = faiss.IndexFlatIP(dim)
+            index.add(block)
+            indexes.append(index)
+            chunks.append([f"doc{i}_chunk_{j}" for j in range(chunks_per_index)])
+
+        timings = []
+        for merge in (_merge_python, _merge_vectorised):
+            t0 = time.perf_counter()
+            for q in queries:
+                merge(indexes, chunks, q.reshape(1, -1), k)
+            timings.append((time.perf_counter() - t0) * 1000 / repeats)
+        print(f"{n_indexes:>8}{timings[0]:>12.3f}{timings[1]:>12.3f}{timings[0] / timings[1]:>9.1f}x")
+
+
+def bench_quant(n: int, dim: int, n_queries: int, k: int, rerank_factor: int) -> None:
+    """recall@k and bytes/vector of compressed codecs, with and without an fp16 rerank copy."""
+    corpus, queries = synthetic_corpus(n, dim, n_queries)
+    exact = faiss.IndexFlatIP(dim)
+    exact.add(corpus)
+    _, truth = exact.search(queries, k)
+    rerank_copy = corpus.astype("float16")
+
+    m = next(m for m in (96, 64, 48, 32, 16, 8) if dim % m == 0)
+    codecs = [("fp32", "Flat"), ("fp16", "SQfp16"), ("sq8", "SQ8"), (f"pq{m}", f"PQ{m}x8")]
+    print(f"corpus={n} dim={dim} queries={n_queries} k={k} rerank over top {rerank_factor * k}")
+    print(f"{'codec':<8}{'bytes/vec':>10}{'recall@k':>10}{'+fp16 rerank':>14}{'bytes/vec':>11}")
+    for name, factory in codecs:
+        index = faiss.index_factory(dim, factory, faiss.METRIC_INNER_PRODUCT)
+        if not index.is_trained:
+            index.train(corpus[: min(n, 50_000)])
+        index.add(corpus)
+        code_bytes = faiss.serialize_index(index).nbytes / n
+
+        _, found = index.search(queries, k)
+        _, pool = index.search(queries, rerank_factor * k)
+        reranked = np.empty_like(found)
+        for qi, (q, cand) in enumerate(zip(queries, pool)):
+            cand = cand[cand >= 0]
+            exact_scores = rerank_copy[cand].astype("float32") @ q
+            reranked[qi] = cand[np.argsort(-exact_scores)[:k]]
+        print(f"{name:<8}{code_bytes:>10.0f}{recall_at_k(truth, found):>10.3f}"
+              f"{recall_at_k(truth, reranked):>14.3f}{code_bytes + 2 * dim:>11.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="bench", required=True)
+    tiers = sub.add_parser("tiers", help="recall vs latency of each ANN tier against the flat baseline")
+    tiers.add_argument("--n", type=int, default=100_000)
+    tiers.add_argument("--dim", type=int, default=1536)
+    tiers.add_argument("--queries", type=int, default=200)
+    tiers.add_argument("--k", type=int, default=10)
+    merge = sub.add_parser("merge", help="per-index Python merge vs vectorised argpartition top-k")
+    merge.add_argument("--indexes", type=int, nargs="+", default=[10, 100, 500])
+    merge.add_argument("--chunks", type=int, default=40)
+    merge.add_argument("--dim", type=int, default=1536)
+    merge.add_argument("--k", type=int, default=24)
+    merge.add_argument("--repeats", type=int, default=50)
+    quant = sub.add_parser("quant", help="recall and footprint of fp16 / SQ8 / PQ storage")
+    quant.add_argument("--n", type=int, default=50_000)
+    quant.add_argument("--dim", type=int, default=1536)
+    quant.add_argument("--queries", type=int, default=200)
+    quant.add_argument("--k", type=int, default=10)
+    quant.add_argument("--rerank-factor", type=int, default=4)
+    args = parser.parse_args()
+
+    if args.bench == "tiers":
+        bench_tiers(args.n, args.dim, args.queries, args.k)
+    elif args.bench == "merge":
+        bench_merge(args.indexes, args.chunks, args.dim, args.k, args.repeats)
+    elif args.bench == "quant":
+        bench_quant(args.n, args.dim, args.queries, args.k, args.rerank_factor)
+
+
+if __name__ == "__main__":
+    main()
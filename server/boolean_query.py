@@ -0,0 +1,545 @@
+# boolean_query.py
+"""
+Boolean search-string parser, normaliser and per-provider serialisers.
+
+Nodes are plain dicts:
+    {"type": "term", "value": "machine learning"}
+    {"type": "AND" | "OR", "children": [node, ...]}
+    {"type": "NOT", "child": node}
+
+Parsing binds OR tighter than AND; NOT (or AND NOT) negates only the operand
+that follows it, so "a AND NOT b AND c" excludes b alone. The parser recovers
+from the usual LLM slips - unbalanced parentheses, dangling operators,
+unterminated quotes - recording a warning for each instead of dropping
+groups. Serialisers always fully parenthesise and put the exclusions of an
+AND after its positive terms, because Scopus applies AND NOT last: written
+first, "a AND NOT b AND c" would mean a AND NOT (b AND c) there. The output
+therefore means the same thing on every provider.
+"""
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+Node = Dict[str, Any]
+
+STOPWORDS = {"a", "an", "the", "of", "in", "on", "for", "to", "and", "or", "with", "by", "at", "from"}
+FIELD_GROUPS = {"TITLE-ABS-KEY", "TITLE-ABS", "TITLE", "ABS", "KEY", "ALL", "TITLE-ABS-KEY-AUTH"}
+FIELD_PREFIX_RE = re.compile(r"^(?:all|ti|abs|au|co|jr|cat|rn|id):", re.IGNORECASE)
+MAX_SEARCH_STRING_CHARS = 200
+
+_TOKEN_RE = re.compile(r'"([^"]*)("?)|\(|\)|[^\s()"]+')
+
+
+class _Parser:
+    def __init__(self, text: str):
+        self.tokens: List[Tuple[str, str]] = []
+        self.warnings: List[str] = []
+        for m in _TOKEN_RE.finditer(text or ""):
+            tok = m.group(0)
+            if tok.startswith('"'):
+                if not m.group(2):
+                    self.warnings.append("unterminated quote closed at end of query")
+                self.tokens.append(("TERM", m.group(1).strip()))
+            elif tok in ("(", ")"):
+                self.tokens.append((tok, tok))
+            elif tok.upper() in ("AND", "OR", "NOT", "ANDNOT", "AND_NOT"):
+                self.tokens.append((tok.upper().replace("_", ""), tok))
+            elif tok.upper().rstrip("(") in FIELD_GROUPS:
+                self.tokens.append(("FIELD", tok))
+            else:
+                self.tokens.append(("WORD", FIELD_PREFIX_RE.sub("", tok)))
+        self.pos = 0
+
+    def peek(self) -> Optional[str]:
+        return self.tokens[self.pos][0] if self.pos < len(self.tokens) else None
+
+    def take(self) -> Tuple[str, str]:
+        tok = self.tokens[self.pos]
+        self.pos += 1
+        return tok
+
+    def parse(self) -> Optional[Node]:
+        node = self.and_expr()
+        while self.pos < len(self.tokens):
+            kind, raw = self.take()
+            if kind == ")":
+                self.warnings.append("unmatched ')' ignored")
+            else:
+                self.warnings.append(f"unexpected '{raw}' ignored")
+            rest = self.and_expr()
+            node = _join("AND", node, rest)
+        return node
+
+    def and_expr(self) -> Optional[Node]:
+        node = self.or_expr()
+        while True:
+            kind = self.peek()
+            if kind in ("AND", "ANDNOT"):
+                self.take()
+                negate = kind == "ANDNOT"
+                if self.peek() == "NOT":
+                    self.take()
+                    negate = True
+                rhs = self.or_expr()
+                if rhs is None:
+                    self.warnings.append("dangling AND ignored")
+                    continue
+                node = _join("AND", node, {"type": "NOT", "child": rhs} if negate else rhs)
+            elif kind in ("NOT", "WORD", "TERM", "(", "FIELD"):
+                if node is not None and kind != "NOT":
+                    self.warnings.append("missing operator between terms read as AND")
+                rhs = self.or_expr()
+                if rhs is None:
+                    break
+                node = _join("AND", node, rhs)
+            else:
+                return node
+
+    def or_expr(self) -> Optional[Node]:
+        node = self.unary()
+        while self.peek() == "OR":
+            self.take()
+            rhs = self.unary()
+            if rhs is None:
+                self.warnings.append("dangling OR ignored")
+                continue
+            if node is None:
+                self.warnings.append("leading OR ignored")
+                node = rhs
+            else:
+                node = _join("OR", node, rhs)
+        return node
+
+    def unary(self) -> Optional[Node]:
+        if self.peek() == "NOT":
+            self.take()
+            child = self.unary()
+            return {"type": "NOT", "child": child} if child is not None else None
+        return self.primary()
+
+    def primary(self) -> Optional[Node]:
+        kind = self.peek()
+        if kind == "FIELD":
+            _, raw = self.take()
+            if not raw.endswith("(") and self.peek() != "(":
+                return None
+            if not raw.endswith("("):
+                self.take()
+            return self.group()
+        if kind == "(":
+            self.take()
+            return self.group()
+        if kind == "TERM":
+            value = self.take()[1]
+            return {"type": "term", "value": value} if value else None
+        if kind == "WORD":
+            # adjacent bare words are one multi-word term: (machine learning OR AI)
+            words = [self.take()[1]]
+            while self.peek() == "WORD":
+                words.append(self.take()[1])
+            return {"type": "term", "value": " ".join(w for w in words if w)}
+        return None
+
+    def group(self) -> Optional[Node]:
+        node = self.and_expr()
+        if self.peek() == ")":
+            self.take()
+        else:
+            self.warnings.append("missing ')' added")
+        if node is None:
+            self.warnings.append("empty group removed")
+        return node
+
+
+def _join(op: str, left: Optional[Node], right: Optional[Node]) -> Optional[Node]:
+    if left is None:
+        return right
+    if right is None:
+        return left
+    return {"type": op, "children": [left, right]}
+
+
+def parse(text: str) -> Tuple[Optional[Node], List[str]]:
+    """Returns (ast or None, warnings)."""
+    parser = _Parser(text)
+    return parser.parse(), parser.warnings
+
+
+# ---------- normalisation ----------
+
+def _key(node: Node) -> str:
+    return to_string(node).casefold()
+
+
+def normalize(node: Optional[Node], max_words: Optional[int] = None,
+              max_groups: Optional[int] = None) -> Optional[Node]:
+    """
+    Flattens nested AND/AND and OR/OR, removes duplicate and stopword-only
+    terms, collapses single-child groups, drops terms longer than max_words
+    and keeps at most max_groups top-level AND groups.
+    """
+    node = _normalize(node, max_words)
+    if node is not None and max_groups and node["type"] == "AND":
+        positives = [c for c in node["children"] if c["type"] != "NOT"]
+        negatives = [c for c in node["children"] if c["type"] == "NOT"]
+        node = _collapse("AND", positives[:max_groups] + negatives)
+    return node
+
+
+def _normalize(node: Optional[Node], max_words: Optional[int]) -> Optional[Node]:
+    if node is None:
+        return None
+    if node["type"] == "term":
+        value = re.sub(r"\s+", " ", node["value"]).strip()
+        words = value.split()
+        if not words or all(w.lower() in STOPWORDS for w in words):
+            return None
+        if max_words and len(words) > max_words:
+            return None
+        return {"type": "term", "value": value}
+    if node["type"] == "NOT":
+        child = _normalize(node["child"], max_words)
+        return {"type": "NOT", "child": child} if child is not None else None
+
+    children: List[Node] = []
+    seen = set()
+    for child in node["children"]:
+        child = _normalize(child, max_words)
+        if child is None:
+            continue
+        flat = child["children"] if child["type"] == node["type"] else [child]
+        for c in flat:
+            k = _key(c)
+            if k not in seen:
+                seen.add(k)
+                children.append(c)
+    return _collapse(node["type"], children)
+
+
+def _collapse(op: str, children: List[Node]) -> Optional[Node]:
+    if not children:
+        return None
+    if len(children) == 1:
+        return children[0]
+    return {"type": op, "children": children}
+
+
+def terms(node: Optional[Node]) -> List[str]:
+    if node is None:
+        return []
+    if node["type"] == "term":
+        return [node["value"]]
+    if node["type"] == "NOT":
+        return terms(node["child"])
+    return [t for c in node["children"] for t in terms(c)]
+
+
+def and_groups(node: Optional[Node]) -> List[Node]:
+    """Top-level conjuncts (a lone group or term counts as one)."""
+    if node is None:
+        return []
+    return list(node["children"]) if node["type"] == "AND" else [node]
+
+
+def fit_to_length(node: Optional[Node], max_chars: int, serializer=None) -> Optional[Node]:
+    """
+    Drops the last synonym from the largest OR group until the serialised
+    query fits; drops trailing AND groups only when no OR group has spares.
+    """
+    serializer = serializer or to_string
+    while node is not None and len(serializer(node)) > max_chars:
+        groups = and_groups(node)
+        widest = max(range(len(groups)), key=lambda i: len(groups[i].get("children", [])), default=None)
+        if widest is not None and groups[widest]["type"] == "OR" and len(groups[widest]["children"]) > 1:
+            groups[widest] = _collapse("OR", groups[widest]["children"][:-1])
+        elif len(groups) > 1:
+            groups = groups[:-1]
+        else:
+            break
+        node = _collapse("AND", groups)
+    return node
+
+
+def validate(text: str, max_chars: Optional[int] = None) -> List[str]:
+    """Problems a provider would reject or silently misread; empty list means OK."""
+    node, issues = parse(text)
+    issues = list(issues)
+    if node is None:
+        return issues + ["query has no search terms"]
+    if node["type"] == "NOT":
+        issues.append("query consists only of an exclusion")
+    for t in terms(node):
+        if t.startswith(("*", "?")):
+            issues.append(f"leading wildcard in '{t}' is not supported by Scopus")
+    if max_chars and len(to_string(node)) > max_chars:
+        issues.append(f"query is longer than {max_chars} characters")
+    return issues
+
+
+def normalize_search_string(text: str, max_words: Optional[int] = None, max_groups: Optional[int] = None,
+                            max_chars: Optional[int] = None) -> str:
+    """parse -> normalize -> fit_to_length -> to_string; returns the input unchanged if nothing parses."""
+    node, _ = parse(text)
+    node = normalize(node, max_words=max_words, max_groups=max_groups)
+    if node is not None and max_chars:
+        node = fit_to_length(node, max_chars)
+    return to_string(node) if node is not None else (text or "").strip()
+
+
+# ---------- serialisers ----------
+
+def _quote(value: str) -> str:
+    return f'"{value}"'
+
+
+def _ordered(node: Node) -> List[Node]:
+    # exclusions last: Scopus evaluates AND NOT after every AND and OR
+    if node["type"] != "AND":
+        return node["children"]
+    return ([c for c in node["children"] if c["type"] != "NOT"]
+            + [c for c in node["children"] if c["type"] == "NOT"])
+
+
+def _serialize(node: Node, term_fn, and_op: str, or_op: str, not_op: str, top: bool = True) -> str:
+    if node["type"] == "term":
+        return term_fn(node["value"])
+    if node["type"] == "NOT":
+        return f"{not_op}{_serialize(node['child'], term_fn, and_op, or_op, not_op, False)}"
+    op = and_op if node["type"] == "AND" else or_op
+    inner = op.join(_serialize(c, term_fn, and_op, or_op, not_op, False) for c in _ordered(node))
+    return inner if top else f"({inner})"
+
+
+def to_string(node: Optional[Node]) -> str:
+    """Canonical form used across the app: quoted terms, AND/OR/NOT, full parentheses."""
+    if node is None:
+        return ""
+    if node["type"] == "AND":
+        # top-level conjuncts stay parenthesised: ("a" OR "b") AND ("c")
+        return " AND ".join(
+            f"({to_string(c)})" if c["type"] in ("OR", "AND") else to_string(c) for c in _ordered(node))
+    return _serialize(node, _quote, " AND ", " OR ", "NOT ")
+
+
+def to_scopus(node: Optional[Node], field: str = "TITLE-ABS") -> str:
+    """Scopus advanced search: FIELD(...) with AND NOT for exclusions."""
+    if node is None:
+        return ""
+    return f"{field}({_serialize(node, _quote, ' AND ', ' OR ', 'NOT ')})"
+
+
+def _drop_arxiv_not(node: Node, warnings: List[str]) -> Optional[Node]:
+    if node["type"] == "term":
+        return node
+    if node["type"] == "NOT":
+        warnings.append(f"arXiv cannot express NOT {to_string(node['child'])} outside 'a ANDNOT b'")
+        return None
+    kept: List[Node] = []
+    for c in node["children"]:
+        if c["type"] == "NOT" and node["type"] == "AND":
+            child = _drop_arxiv_not(c["child"], warnings)
+            if child is not None:
+                kept.append({"type": "NOT", "child": child})
+        else:
+            c = _drop_arxiv_not(c, warnings)
+            if c is not None:
+                kept.append(c)
+    if node["type"] == "AND" and kept and all(c["type"] == "NOT" for c in kept):
+        warnings.extend(f"arXiv cannot express {to_string(c)} without a term to exclude it from" for c in kept)
+        return None
+    return _collapse(node["type"], kept)
+
+
+def drop_unsupported_not(node: Optional[Node], warnings: Optional[List[str]] = None) -> Optional[Node]:
+    """
+    Rewrites the query so to_arxiv can serialise it. arXiv has no unary NOT,
+    only `a ANDNOT b`, so an exclusion is kept only as a direct child of an
+    AND that also has a positive child; any other NOT (top level, inside an
+    OR, an AND of exclusions only) is removed and reported in `warnings`.
+    """
+    warnings = [] if warnings is None else warnings
+    return _drop_arxiv_not(node, warnings) if node is not None else None
+
+
+def to_arxiv(node: Optional[Node], field: str = "all") -> str:
+    """
+    arXiv API search_query: every term gets the field prefix, exclusions use
+    ANDNOT. Raises ValueError for a NOT that arXiv cannot express; pass the
+    node through drop_unsupported_not first to remove those.
+    """
+    problems: List[str] = []
+    drop_unsupported_not(node, problems)
+    if problems:
+        raise ValueError("; ".join(problems))
+
+    def term(value: str) -> str:
+        return f'{field}:"{value}"' if " " in value else f"{field}:{value}"
+
+    def ser(n: Node, top: bool) -> str:
+        if n["type"] == "term":
+            return term(n["value"])
+        if n["type"] == "OR":
+            inner = " OR ".join(ser(c, False) for c in n["children"])
+        else:
+            pos = [ser(c, False) for c in n["children"] if c["type"] != "NOT"]
+            neg = [ser(c["child"], False) for c in n["children"] if c["type"] == "NOT"]
+            inner = " AND ".join(pos) + "".join(f" ANDNOT {x}" for x in neg)
+        return inner if top else f"({inner})"
+
+    return ser(node, True) if node is not None else ""
+
+
+def to_semantic_scholar(node: Optional[Node], bulk: bool = False) -> str:
+    """
+    bulk=True: /paper/search/bulk syntax (+ AND, | OR, - NOT, quoted phrases).
+    bulk=False: /paper/search takes plain text only, so send the leading term
+    of each AND group - the concept list the relevance ranker expects.
+    """
+    if node is None:
+        return ""
+    if bulk:
+        def ser(n: Node, top: bool) -> str:
+            if n["type"] == "term":
+                return _quote(n["value"]) if " " in n["value"] else n["value"]
+            if n["type"] == "NOT":
+                return f"-{ser(n['child'], False)}"
+            op = " + " if n["type"] == "AND" else " | "
+            inner = op.join(ser(c, False) for c in n["children"])
+            return inner if top else f"({inner})"
+        return ser(node, True)
+    leading = []
+    for group in and_groups(node):
+        if group["type"] != "NOT":
+            group_terms = terms(group)
+            if group_terms:
+                leading.append(group_terms[0])
+    return " ".join(leading)
+
+
+# ---------- local evaluation ----------
+
+def _term_pattern(value: str) -> "re.Pattern":
+    # phrase match on word boundaries; * and ? are Scopus-style wildcards
+    parts = re.split(r"([*?])", value.lower())
+    body = "".join(r"\w*" if p == "*" else r"\w" if p == "?" else r"\s+".join(map(re.escape, p.split(" ")))
+                   for p in parts if p)
+    return re.compile(rf"(?<!\w){body}(?!\w)")
+
+
+def compile_matcher(node: Optional[Node]) -> Callable[[str], bool]:
+    """
+    Predicate text -> bool that evaluates the query against a (lower-cased)
+    title + abstract string, so a corpus can be counted without a provider.
+    Term regexes are compiled once; AND/OR short-circuit.
+    """
+    if node is None:
+        return lambda text: False
+    if node["type"] == "term":
+        search = _term_pattern(node["value"]).search
+        # cheap substring pre-check on the longest literal word before running the regex
+        needle = max(re.split(r"[\s*?]+", node["value"].lower()), key=len)
+        return lambda text: needle in text and search(text) is not None
+    if node["type"] == "NOT":
+        inner = compile_matcher(node["child"])
+        return lambda text: not inner(text)
+    children = [compile_matcher(c) for c in node["children"]]
+    if node["type"] == "AND":
+        return lambda text: all(m(text) for m in children)
+    return lambda text: any(m(text) for m in children)
+
+
+# ---------- local refinements ----------
+
+_LIST_SPLIT_RE = re.compile(r'\s*(?:,|;|\bor\b|\band\b)\s*', re.IGNORECASE)
+
+
+def _term_list(text: str) -> List[str]:
+    quoted = re.findall(r'"([^"]+)"', text)
+    if quoted:
+        return [q.strip() for q in quoted if q.strip()]
+    return [t.strip(" '.") for t in _LIST_SPLIT_RE.split(text) if t.strip(" '.")]
+
+
+def _group_index(groups: List[Node], target: str) -> Optional[int]:
+    target = target.strip().strip('"\'').casefold()
+    m = re.fullmatch(r"(?:group\s*)?#?(\d+)", target)
+    if m:
+        i = int(m.group(1)) - 1
+        return i if 0 <= i < len(groups) else None
+    for i, g in enumerate(groups):
+        if any(target == t.casefold() or target in t.casefold() for t in terms(g)):
+            return i
+    return None
+
+
+def _remove_terms(node: Optional[Node], doomed: set) -> Optional[Node]:
+    if node is None:
+        return None
+    if node["type"] == "term":
+        return None if node["value"].casefold() in doomed else node
+    if node["type"] == "NOT":
+        child = _remove_terms(node["child"], doomed)
+        return {"type": "NOT", "child": child} if child is not None else None
+    return _collapse(node["type"], [c for c in (_remove_terms(x, doomed) for x in node["children"]) if c])
+
+
+def apply_refinement(query: str, feedback: str) -> Optional[str]:
+    """
+    Applies simple structural feedback without an LLM call. Understands:
+      add X[, Y] to group N | to the "Z" group | as synonyms of Z
+      add (new) group X, Y  |  require X
+      remove / drop X[, Y]  |  exclude X
+      merge groups N and M
+    Returns the refined query, or None when the feedback needs an LLM.
+    """
+    node, _ = parse(query)
+    node = normalize(node)
+    if node is None:
+        return None
+    fb = feedback.strip().rstrip(".")
+    groups = and_groups(node)
+
+    m = re.fullmatch(r"(?:please\s+)?add\s+(.+?)\s+(?:to|into)\s+(?:the\s+)?(.+?)(?:\s+group)?", fb, re.I) \
+        or re.fullmatch(r"(?:please\s+)?add\s+(.+?)\s+as\s+(?:a\s+)?synonyms?\s+(?:of|for)\s+(.+)", fb, re.I)
+    if m:
+        i = _group_index(groups, m.group(2))
+        new_terms = _term_list(m.group(1))
+        if i is None or not new_terms:
+            return None
+        members = groups[i]["children"] if groups[i]["type"] == "OR" else [groups[i]]
+        groups[i] = {"type": "OR", "children": members + [{"type": "term", "value": t} for t in new_terms]}
+        return to_string(normalize(_collapse("AND", groups)))
+
+    m = re.fullmatch(r"(?:please\s+)?(?:add\s+(?:a\s+)?(?:new\s+)?(?:group|concept)(?:\s+for)?|require)\s*:?\s*(.+)", fb, re.I)
+    if m:
+        new_terms = _term_list(m.group(1).strip("()"))
+        if not new_terms:
+            return None
+        groups.append(_collapse("OR", [{"type": "term", "value": t} for t in new_terms]))
+        return to_string(normalize(_collapse("AND", groups)))
+
+    m = re.fullmatch(r"(?:please\s+)?(?:remove|drop|delete)\s+(?:the\s+)?(?:terms?\s+)?(.+)", fb, re.I)
+    if m:
+        doomed = {t.casefold() for t in _term_list(m.group(1))}
+        if not doomed or not doomed & {t.casefold() for t in terms(node)}:
+            return None
+        refined = normalize(_remove_terms(node, doomed))
+        return to_string(refined) if refined is not None else None
+
+    m = re.fullmatch(r"(?:please\s+)?exclude\s+(.+)", fb, re.I)
+    if m:
+        excluded = _term_list(m.group(1))
+        if not excluded:
+            return None
+        groups.append({"type": "NOT", "child": _collapse("OR", [{"type": "term", "value": t} for t in excluded])})
+        return to_string(normalize(_collapse("AND", groups)))
+
+    m = re.fullmatch(r"(?:please\s+)?merge\s+groups?\s+(\d+)\s+(?:and|with|&)\s+(\d+)", fb, re.I)
+    if m:
+        a, b = sorted({int(m.group(1)) - 1, int(m.group(2)) - 1})
+        if a == b or b >= len(groups):
+            return None
+        merged = {"type": "OR", "children": [groups[a], groups[b]]}
+        groups = [merged if i == a else g for i, g in enumerate(groups) if i != b]
+        return to_string(normalize(_collapse("AND", groups)))
+
+    return None
@@ -0,0 +1,151 @@
+# corpus_store.py
+import os
+import csv
+import glob
+import sqlite3
+from contextlib import closing
+from typing import List, Dict, Any, Iterable, Optional, Sequence
+
+from export_utils import record_key, normalize_doi
+
+CORPUS_DB = "corpus.db"
+CORPUS_COLUMNS = ("key", "title", "abstract", "year", "doi", "source")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS abstracts (
+    key      TEXT PRIMARY KEY,
+    title    TEXT NOT NULL DEFAULT '',
+    abstract TEXT NOT NULL DEFAULT '',
+    year     TEXT NOT NULL DEFAULT '',
+    doi      TEXT NOT NULL DEFAULT '',
+    source   TEXT NOT NULL DEFAULT '',
+    added_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS abstracts_source ON abstracts(source);
+CREATE TABLE IF NOT EXISTS meta (
+    name  TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+CSV_BACKFILL_MARKER = "csv_backfilled"
+
+
+def corpus_path(project_id: str, base_dir: str = "data") -> str:
+    return os.path.join(base_dir, project_id, CORPUS_DB)
+
+
+def _connect(project_id: str, base_dir: str = "data") -> sqlite3.Connection:
+    path = corpus_path(project_id, base_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def _as_row(record: Dict[str, Any], source: str) -> Optional[tuple]:
+    if not isinstance(record, dict) or "error" in record:
+        return None
+    key = record_key(record)
+    if not key:
+        return None
+    abstract = record.get("abstract") or ""
+    return (
+        key,
+        str(record.get("title") or ""),
+        str(abstract).strip(),
+        str(record.get("year") or ""),
+        normalize_doi(record.get("doi")),
+        source or str(record.get("source") or ""),
+    )
+
+
+def upsert_abstracts(project_id: str, records: Iterable[Dict[str, Any]],
+                     source: str = "", base_dir: str = "data") -> int:
+    """
+    Adds extracted records to the project's abstracts table, de-duplicated by
+    DOI/title. An existing row only has its abstract replaced when the new one
+    is non-empty. Returns the number of records written.
+    """
+    rows = [r for r in (_as_row(rec, source) for rec in records) if r]
+    if not rows:
+        return 0
+    with closing(_connect(project_id, base_dir)) as conn, conn:
+        conn.executemany(
+            """
+            INSERT INTO abstracts (key, title, abstract, year, doi, source)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(key) DO UPDATE SET
+                abstract = CASE WHEN excluded.abstract != '' THEN excluded.abstract ELSE abstracts.abstract END,
+                title    = CASE WHEN excluded.title    != '' THEN excluded.title    ELSE abstracts.title END,
+                year     = CASE WHEN excluded.year     != '' THEN excluded.year     ELSE abstracts.year END,
+                source   = CASE WHEN excluded.source   != '' THEN excluded.source   ELSE abstracts.source END
+            """,
+            rows,
+        )
+    return len(rows)
+
+
+def remove_source(project_id: str, source: str, base_dir: str = "data") -> int:
+    """Drops the abstracts ingested from one uploaded file."""
+    if not os.path.exists(corpus_path(project_id, base_dir)):
+        return 0
+    with closing(_connect(project_id, base_dir)) as conn, conn:
+        return conn.execute("DELETE FROM abstracts WHERE source = ?", (source,)).rowcount
+
+
+def _backfill_from_csv(project_id: str, base_dir: str = "data") -> None:
+    """
+    One-off import for projects whose abstracts only exist in exported CSVs.
+    Completion is recorded in the meta table rather than inferred from the
+    database file, which the first upload after this change already creates.
+    Rows already in the table win over the CSV copies.
+    """
+    with closing(_connect(project_id, base_dir)) as conn:
+        if conn.execute("SELECT 1 FROM meta WHERE name = ?", (CSV_BACKFILL_MARKER,)).fetchone():
+            return
+
+        records = []
+        for fp in glob.glob(os.path.join(base_dir, project_id, "*.csv")):
+            try:
+                with open(fp, newline="", encoding="utf-8") as f:
+                    for row in csv.DictReader(f):
+                        records.append({
+                            "title": row.get("Title", ""),
+                            "abstract": row.get("Abstract", ""),
+                            "year": row.get("Year", ""),
+                            "doi": row.get("DOI", ""),
+                        })
+            except Exception:
+                continue
+
+        rows = [r for r in (_as_row(rec, "") for rec in records) if r]
+        with conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO abstracts (key, title, abstract, year, doi, source) VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)", (CSV_BACKFILL_MARKER, "1"))
+
+
+def load_abstracts(project_id: str, columns: Sequence[str] = ("abstract",),
+                   limit: Optional[int] = None, sample: bool = False,
+                   base_dir: str = "data") -> List[Dict[str, Any]]:
+    """
+    Column-projected read of the project's abstracts (rows with an empty
+    abstract are skipped). With sample=True, `limit` rows are drawn at random
+    instead of taking the earliest ingested ones.
+    """
+    if not os.path.isdir(os.path.join(base_dir, project_id)):
+        return []
+    _backfill_from_csv(project_id, base_dir)
+
+    cols = [c for c in columns if c in CORPUS_COLUMNS] or ["abstract"]
+    sql = f"SELECT {', '.join(cols)} FROM abstracts WHERE abstract != ''"
+    sql += " ORDER BY random()" if sample else " ORDER BY rowid"
+    params: tuple = ()
+    if limit is not None:
+        sql += " LIMIT ?"
+        params = (int(limit),)
+    with closing(_connect(project_id, base_dir)) as conn:
+        return [dict(zip(cols, row)) for row in conn.execute(sql, params)]
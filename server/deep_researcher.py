@@ -2,24 +2,40 @@ import os
 import json
 import time
 import re
+import threading
 import requests
-from typing import List, Dict, Any
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import List, Dict, Any, Optional, Tuple
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
 import trafilatura
+from llm_gateway import chat_completion
+import page_cache
+from evidence_store import build_evidence_store, retrieve_evidence, CHUNK_CHARS
+from search_providers import SearchProvider, RecordingProvider, ProviderError, get_search_provider
 
-OPENAI_API_KEY = os.getenv("API-KEY")
 # DEEPRESEARCH_URL = os.getenv("DEEPRESEARCH_URL")
-TAVILY_API_KEY = os.getenv("TAVILY_API_KEY")
+
+MAX_SOURCES = 40
+RESULTS_PER_QUERY = 5
+FETCH_WORKERS = 16
+PER_HOST_LIMIT = 2            # concurrent fetches against one site
+DEADLINE_S = float(os.getenv("DEEP_RESEARCH_DEADLINE_S", "90"))
+PAGE_TIMEOUT = (5, 15)        # connect, read
+MAX_PAGE_BYTES = 5 * 1024 * 1024
+EVIDENCE_CHAR_BUDGET = 32_000  # all RQ passages together in the synthesis prompt
+# bump when extraction options change so cached text is re-derived from cached HTML
+EXTRACTOR = f"trafilatura-{getattr(trafilatura, '__version__', '?')}-nocomments-nolinks"
+
+_http = requests.Session()
+_http.mount("https://", HTTPAdapter(pool_connections=32, pool_maxsize=FETCH_WORKERS))
+_http.mount("http://", HTTPAdapter(pool_connections=32, pool_maxsize=FETCH_WORKERS))
+_http.headers["User-Agent"] = "Mozilla/5.0 (compatible; slr-deep-research/1.0)"
 
 
 def call_openai_chat(model: str, messages: List[Dict[str, str]], temperature=0.3, max_tokens=6000) -> str:
-    hdrs = {"Authorization": f"Bearer {OPENAI_API_KEY}",
-            "Content-Type": "application/json"}
-    data = {"model": model, "messages": messages,
-            "temperature": temperature, "max_tokens": max_tokens}
-    r = requests.post("https://api.openai.com/v1/chat/completions",
-                      headers=hdrs, data=json.dumps(data), timeout=120)
-    r.raise_for_status()
-    return r.json()["choices"][0]["message"]["content"]
+    return chat_completion(model, messages, temperature=temperature, max_tokens=max_tokens, timeout=120)
 
 
 # ---------- Option A: talk to MCP/DeepResearch server ----------
@@ -40,31 +56,154 @@ def call_openai_chat(model: str, messages: List[Dict[str, str]], temperature=0.3
 # ---------- Option B: fallback DIY deep research ----------
 
 
-def tavily_search(q: str, max_results=5) -> List[Dict[str, str]]:
-    if not TAVILY_API_KEY:
-        return []
-    r = requests.post(
-        "https://api.tavily.com/search",
-        headers={"Content-Type": "application/json"},
-        json={"api_key": TAVILY_API_KEY, "query": q,
-              "max_results": max_results, "include_answer": False},
-        timeout=45,
-    )
-    r.raise_for_status()
-    data = r.json()
-    return [{"url": it["url"], "title": it.get("title", "")} for it in data.get("results", [])]
+def download_page(url: str, stop: Optional[threading.Event] = None, deadline: Optional[float] = None,
+                  headers: Optional[Dict[str, str]] = None) -> Tuple[int, Optional[bytes], Dict[str, str]]:
+    """
+    Streams the page body on the shared session and returns (status, body, headers).
+    Gives up (body None) as soon as stop is set or the monotonic deadline
+    passes, so abandoned fetches release their connection instead of running
+    to completion.
+    """
+    with _http.get(url, stream=True, timeout=PAGE_TIMEOUT, headers=headers) as r:
+        if r.status_code != 200:
+            return r.status_code, None, r.headers
+        body = bytearray()
+        for block in r.iter_content(64 * 1024):
+            if (stop is not None and stop.is_set()) or (deadline is not None and time.monotonic() > deadline):
+                return r.status_code, None, r.headers
+            body.extend(block)
+            if len(body) > MAX_PAGE_BYTES:
+                break
+        return r.status_code, bytes(body), r.headers
+
 
+def _extract(html: bytes) -> str:
+    return trafilatura.extract(html, include_comments=False, include_links=False) or ""
 
-def fetch_clean_text(url: str) -> str:
+
+def fetch_clean_text(url: str, stop: Optional[threading.Event] = None,
+                     deadline: Optional[float] = None) -> str:
+    """
+    Extracted page text, served from page_cache when fresh. Stale entries are
+    revalidated with ETag/Last-Modified; unchanged HTML is never re-extracted.
+    A fresh entry from an older extractor is re-extracted from its cached HTML
+    without touching the network.
+    """
     try:
-        downloaded = trafilatura.fetch_url(url)
-        if not downloaded:
+        entry = page_cache.lookup(url)
+        if entry and entry["fresh"]:
+            if entry["text"] is not None and entry["extractor"] == EXTRACTOR:
+                return entry["text"]
+            if entry["html"] is not None:
+                text = _extract(entry["html"])
+                page_cache.store_text(url, text, EXTRACTOR)
+                return text
+
+        status, html, headers = download_page(url, stop, deadline, page_cache.revalidation_headers(entry))
+        if status == 304 and entry and entry["html"] is not None:
+            page_cache.mark_revalidated(url)
+            if entry["text"] is not None and entry["extractor"] == EXTRACTOR:
+                return entry["text"]
+            text = _extract(entry["html"])
+            page_cache.store_text(url, text, EXTRACTOR)
+            return text
+        if not html:
             return ""
-        return trafilatura.extract(downloaded, include_comments=False, include_links=False) or ""
+
+        if (entry and entry["html_sha"] == page_cache.content_hash(html)
+                and entry["text"] is not None and entry["extractor"] == EXTRACTOR):
+            text = entry["text"]  # server ignored the validators but the page hasn't changed
+        else:
+            text = _extract(html)
+        page_cache.store_page(url, html, text, EXTRACTOR,
+                              etag=headers.get("ETag"), last_modified=headers.get("Last-Modified"))
+        return text
     except Exception:
         return ""
 
 
+def _fetch_source(provider: SearchProvider, hit: Dict[str, Any], subq: str,
+                  stop: threading.Event, deadline: float) -> Optional[Dict[str, Any]]:
+    if stop.is_set() or time.monotonic() > deadline:
+        return None
+    text = provider.fetch_text(hit, stop, deadline)
+    if text is None:
+        text = fetch_clean_text(hit["url"], stop, deadline)
+    if not text:
+        return None
+    return {"url": hit["url"], "title": hit.get("title", ""), "snippet": text[:1500], "text": text, "subq": subq}
+
+
+def gather_sources(subquestions: List[str], provider: Optional[SearchProvider] = None,
+                   max_sources: int = MAX_SOURCES, deadline_s: float = DEADLINE_S) -> List[Dict[str, Any]]:
+    """
+    Searches every subquestion concurrently and fetches each hit as soon as
+    its search returns, at most PER_HOST_LIMIT at a time per site. Hits for a
+    busy site wait in a per-host queue here rather than in a pool worker, so
+    one site with many results cannot starve the others. Sources are kept in
+    arrival order; once max_sources is reached or the deadline passes, queued
+    fetches are cancelled and running ones abort at their next read.
+    """
+    provider = provider or get_search_provider()
+    started = time.monotonic()
+    deadline = started + deadline_s
+    stop = threading.Event()
+    host_active = defaultdict(int)
+    host_waiting = defaultdict(deque)
+    pool = ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix="deep-research")
+    pending = {pool.submit(provider.search, sq, RESULTS_PER_QUERY): ("search", sq, None) for sq in subquestions}
+    seen_urls, sources = set(), []
+
+    def submit_fetch(hit, sq):
+        host_active[urlsplit(hit["url"]).netloc.lower()] += 1
+        pending[pool.submit(_fetch_source, provider, hit, sq, stop, deadline)] = ("fetch", sq, hit)
+
+    try:
+        while pending and len(sources) < max_sources:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                print(f"deep research: deadline of {deadline_s:.0f}s hit with {len(sources)} sources")
+                break
+            done, _ = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for fut in done:
+                kind, sq, hit = pending.pop(fut)
+                if kind == "search":
+                    try:
+                        hits = fut.result()
+                    except ProviderError:
+                        raise
+                    except Exception as e:
+                        print(f"Search failed for '{sq}': {e}")
+                        continue
+                    for h in hits:
+                        if h["url"] in seen_urls:
+                            continue
+                        seen_urls.add(h["url"])
+                        host = urlsplit(h["url"]).netloc.lower()
+                        if host_active[host] < PER_HOST_LIMIT:
+                            submit_fetch(h, sq)
+                        else:
+                            host_waiting[host].append((h, sq))
+                else:
+                    host = urlsplit(hit["url"]).netloc.lower()
+                    host_active[host] -= 1
+                    try:
+                        source = fut.result()
+                    except Exception as e:
+                        print(f"Fetch failed for '{hit['url']}': {e}")
+                        source = None
+                    if source and len(sources) < max_sources:
+                        sources.append(source)
+                    if host_waiting[host] and len(sources) < max_sources:
+                        submit_fetch(*host_waiting[host].popleft())
+    finally:
+        stop.set()
+        pool.shutdown(wait=False, cancel_futures=True)
+    print(f"deep research ({provider.name}): {len(sources)} sources from {len(seen_urls)} urls "
+          f"in {time.monotonic() - started:.1f}s")
+    return sources
+
+
 def expand_subquestions(objective: str, questions: List[str], search_string: str) -> List[str]:
     msg = [
         {"role": "system", "content": "You decompose SLR research objectives into concrete web-search subquestions."},
@@ -83,8 +222,44 @@ def expand_subquestions(objective: str, questions: List[str], search_string: str
         return [s.strip("-*• ").strip() for s in txt.split("\n") if s.strip()][:8]
 
 
-def synthesize_report(objective: str, questions: List[str], search_string: str, notes: List[Dict[str, Any]]) -> str:
-    rq_list = "\n".join([f"- RQ{i+1}: {rq}" for i, rq in enumerate(questions)])
+def _rq_text(q: Any) -> str:
+    return q.get("question", "") if isinstance(q, dict) else str(q)
+
+
+def collect_evidence(questions: List[Any], sources: List[Dict[str, Any]]):
+    """
+    Chunks and embeds every fetched source, then retrieves the best passages
+    per RQ. Sources are renumbered by first use so the reference list only
+    holds what the prompt cites. Returns (references, evidence).
+    """
+    rq_texts = [_rq_text(q) for q in questions]
+    per_rq = max(3, min(8, EVIDENCE_CHAR_BUDGET // (max(1, len(rq_texts)) * CHUNK_CHARS)))
+    store = build_evidence_store(sources)
+    passages_by_rq = retrieve_evidence(store, rq_texts, per_query=per_rq)
+
+    numbers: Dict[int, int] = {}
+    for passages in passages_by_rq:
+        for p in passages:
+            numbers.setdefault(p["source"], len(numbers) + 1)
+    references = [{"n": n, "title": sources[pos]["title"], "url": sources[pos]["url"]}
+                  for pos, n in numbers.items()]
+    evidence = [{"rq": rq, "passages": [{"ref": numbers[p["source"]], "text": p["text"]} for p in passages]}
+                for rq, passages in zip(rq_texts, passages_by_rq)]
+    return references, evidence
+
+
+def _format_evidence(references: List[Dict[str, Any]], evidence: List[Dict[str, Any]]) -> str:
+    lines = ["Sources:"]
+    lines += [f"[{r['n']}] {r['title']} - {r['url']}" for r in references]
+    for i, block in enumerate(evidence, start=1):
+        lines.append(f"\nRQ{i}: {block['rq']}")
+        lines += [f"[{p['ref']}] {p['text']}" for p in block["passages"]] or ["(no passages retrieved)"]
+    return "\n".join(lines)
+
+
+def synthesize_report(objective: str, questions: List[str], search_string: str,
+                      references: List[Dict[str, Any]], evidence: List[Dict[str, Any]]) -> str:
+    rq_list = "\n".join([f"- RQ{i+1}: {_rq_text(rq)}" for i, rq in enumerate(questions)])
     msg = [
         {"role": "system", "content": (
             "You are an exacting SLR writer. Produce a rigorous, reproducible SLR per Kitchenham & Charters. "
@@ -111,10 +286,10 @@ def synthesize_report(objective: str, questions: List[str], search_string: str,
         6. Threats to Validity: selection bias, publication bias, construct/ internal/external validity; how mitigated.
         7. Limitations & Future Work.
         8. Conclusion.
-        9. References: numbered list [1]… with title and URL (map exactly to the order of sources supplied).
+        9. References: numbered list [1]… with title and URL (exactly the numbered Sources supplied).
 
         Constraints & style:
-        - Use only the evidence in the 'Evidence Notes' (ordered). Cite in-text with [#] that match that order.
+        - Use only the evidence in the 'Evidence Notes'. Each passage starts with its source number; cite in-text with that [#].
         - Be specific and descriptive; avoid generic statements. Prefer precise claims tied to sources.
         - If evidence conflicts, acknowledge and synthesize.
         - Use clear, academic tone; no marketing language.
@@ -127,40 +302,45 @@ def synthesize_report(objective: str, questions: List[str], search_string: str,
         Search String:
         {search_string}
 
-        Evidence Notes (ordered; cite as [1], [2], … in this exact order):
-        {json.dumps(notes, indent=2)}
+        Evidence Notes (passages retrieved per RQ; [#] refers to the Sources list):
+        {_format_evidence(references, evidence)}
         """}]
     return call_openai_chat("gpt-4o", msg, temperature=0.2, max_tokens=6000)
 
 
-def run_deepresearch_fallback(objective: str, questions: List[str], search_string: str, criteria: Dict[str, Any]) -> Dict[str, Any]:
+def run_deepresearch_fallback(objective: str, questions: List[str], search_string: str, criteria: Dict[str, Any],
+                              project_id: Optional[str] = None, search_provider: Optional[str] = None) -> Dict[str, Any]:
+    """search_provider: tavily | local | fixture | auto (see search_providers.get_search_provider)."""
+    provider = get_search_provider(search_provider, project_id)
+    record_path = os.getenv("DEEP_RESEARCH_RECORD")
+    if record_path:
+        provider = RecordingProvider(provider)
+
     # 1) expand subquestions
     subs = expand_subquestions(objective, questions, search_string)
 
-    # 2) for each subquestion → search → fetch
-    sources = []
-    for sq in subs:
-        # change to serpapi if you prefer
-        hits = tavily_search(sq, max_results=5)
-        for h in hits:
-            if len(sources) >= 40:
-                break
-            text = fetch_clean_text(h["url"])
-            if not text:
-                continue
-            snippet = text[:1500]  # keep it small
-            sources.append({"url": h["url"], "title": h.get(
-                "title", ""), "snippet": snippet, "subq": sq})
-        if len(sources) >= 40:
-            break
-
-    # 3) synthesize
-    report = synthesize_report(
-        objective, questions, search_string, sources[:25])
+    # 2) search all subquestions and fetch hits concurrently, first 40 to arrive win
+    sources = gather_sources(subs, provider)
+    if record_path:
+        provider.save(record_path, sources)
+
+    # 3) index the full pages and pull the best passages for each RQ
+    try:
+        references, evidence = collect_evidence(questions, sources)
+    except Exception as e:
+        # embedding failed: fall back to the leading snippet of the first 25 sources
+        print(f"Evidence retrieval failed, using page snippets: {e}")
+        references = [{"n": i, "title": s["title"], "url": s["url"]} for i, s in enumerate(sources[:25], start=1)]
+        evidence = [{"rq": "All research questions",
+                     "passages": [{"ref": i, "text": s["snippet"]} for i, s in enumerate(sources[:25], start=1)]}]
+
+    # 4) synthesize
+    report = synthesize_report(objective, questions, search_string, references, evidence)
 
     return {
         "report": report,
         "sources": [{"url": s["url"], "title": s["title"]} for s in sources],
         "subquestions": subs,
-        "criteria": criteria
+        "criteria": criteria,
+        "search_provider": provider.name
     }
@@ -1,18 +1,10 @@
-import os
-from openai import OpenAI
-import faiss
-import numpy as np
+from llm_gateway import embed_texts
+from llm_dispatcher import PRIORITY_BULK
 from pathlib import Path
 from dotenv import load_dotenv
-from tqdm import tqdm
 import tiktoken
 
-# Load OpenAI API key from .env file
 load_dotenv()
-openai_key = os.getenv("API-KEY")
-api_key = openai_key
-
-client = OpenAI(api_key=api_key)
  
 
 # Define input and output directories
@@ -33,11 +25,7 @@ def split_into_chunks(text, max_tokens=MAX_TOKENS):
 
 def create_embedding(text):
     try:
-        response = client.embeddings.create(
-            input=text,
-            model="text-embedding-ada-002"
-        )
-        return response.data[0].embedding
+        return embed_texts([text], model="text-embedding-ada-002", priority=PRIORITY_BULK)[0]
     except Exception as e:
         print(f"Embedding error: {e}")
         return None
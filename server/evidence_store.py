@@ -0,0 +1,94 @@
+# evidence_store.py
+"""
+Per-run vector store for deep-research sources. Fetched pages are chunked in
+full (instead of keeping the first 1500 characters), embedded in batches and
+held in an in-memory inner-product index; each research question then pulls
+its own top passages with the same MMR / per-document cap used for PDFs.
+"""
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any
+
+import numpy as np
+import faiss
+
+from llm_gateway import embed_texts
+from retrieval_utils import normalize_rows, mmr_select
+
+EMBED_MODEL = "text-embedding-ada-002"
+CHUNK_CHARS = 1200
+CHUNK_OVERLAP = 200
+MAX_CHUNKS_PER_SOURCE = 40
+EMBED_BATCH = 128
+EMBED_WORKERS = 4
+
+
+def chunk_text(text: str, size: int = CHUNK_CHARS, overlap: int = CHUNK_OVERLAP) -> List[str]:
+    """Packs paragraphs into ~size-character chunks; long paragraphs are split with overlap."""
+    chunks: List[str] = []
+    current = ""
+    for para in (p.strip() for p in re.split(r"\n\s*\n", text or "")):
+        if not para:
+            continue
+        if len(para) > size and current:
+            para, current = f"{current}\n\n{para}", ""
+        while len(para) > size:
+            cut = para.rfind(" ", 0, size)
+            cut = cut if cut > size // 2 else size
+            chunks.append(para[:cut])
+            para = para[max(cut - overlap, 1):].lstrip()
+        if current and len(current) + len(para) + 2 > size:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n\n{para}" if current else para
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _embed_batched(texts: List[str]) -> np.ndarray:
+    batches = [texts[i:i + EMBED_BATCH] for i in range(0, len(texts), EMBED_BATCH)]
+    with ThreadPoolExecutor(max_workers=EMBED_WORKERS) as pool:
+        rows = [row for batch in pool.map(lambda b: embed_texts(b, model=EMBED_MODEL), batches) for row in batch]
+    return normalize_rows(np.array(rows, dtype="float32"))
+
+
+def build_evidence_store(sources: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    sources: [{"url", "title", "text", ...}] in citation order.
+    Returns {"index", "vectors", "chunks"} where chunks[i] = {"source": position in sources, "text"}.
+    """
+    chunks: List[Dict[str, Any]] = []
+    for pos, src in enumerate(sources):
+        for text in chunk_text(src.get("text", ""))[:MAX_CHUNKS_PER_SOURCE]:
+            chunks.append({"source": pos, "text": text})
+    if not chunks:
+        return {"index": None, "vectors": None, "chunks": []}
+
+    vectors = _embed_batched([c["text"] for c in chunks])
+    index = faiss.IndexFlatIP(vectors.shape[1])
+    index.add(vectors)
+    return {"index": index, "vectors": vectors, "chunks": chunks}
+
+
+def retrieve_evidence(store: Dict[str, Any], queries: List[str], per_query: int = 8,
+                      candidates: int = 40, max_per_source: int = 2, mmr_lambda: float = 0.7,
+                      dup_threshold: float = 0.95) -> List[List[Dict[str, Any]]]:
+    """
+    One batched embedding request and one search for all queries.
+    Returns, per query, up to per_query passages {"source", "text", "score"}.
+    """
+    if store["index"] is None or not queries:
+        return [[] for _ in queries]
+    qvecs = normalize_rows(np.array(embed_texts(queries, model=EMBED_MODEL), dtype="float32"))
+    D, I = store["index"].search(qvecs, min(candidates, store["index"].ntotal))
+
+    results = []
+    for scores, rows in zip(D, I):
+        keep = rows >= 0
+        scores, rows = scores[keep], rows[keep]
+        groups = np.array([store["chunks"][r]["source"] for r in rows])
+        picks = mmr_select(store["vectors"][rows], scores, per_query, lambda_mult=mmr_lambda,
+                           dup_threshold=dup_threshold, groups=groups, max_per_group=max_per_source)
+        results.append([{**store["chunks"][rows[i]], "score": float(scores[i])} for i in picks])
+    return results
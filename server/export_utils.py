@@ -0,0 +1,141 @@
+# export_utils.py
+import os
+import re
+import csv
+import tempfile
+from typing import List, Dict, Any, Iterable, Iterator, Optional
+
+EXPORT_COLUMNS = ["Title", "Abstract", "Year", "Publisher", "Authors", "DOI"]
+EXPORT_CSV = "extracted_data.csv"
+EXPORT_PARQUET = "extracted_data.parquet"
+
+# record field -> default used when the extractor did not return it
+_FIELDS = [
+    ("title", "Unknown Title"),
+    ("abstract", ""),
+    ("year", "Unknown Year"),
+    ("publisher", "Unknown Publisher"),
+    ("authors", "Unknown Author"),
+    ("doi", "N/A"),
+]
+
+_MISSING_DOIS = {"", "n/a", "na", "none", "not available", "unknown"}
+
+
+def normalize_doi(doi: Any) -> str:
+    doi = str(doi or "").strip().lower()
+    doi = re.sub(r"^(https?://(dx\.)?doi\.org/|doi:\s*)", "", doi)
+    return "" if doi in _MISSING_DOIS else doi
+
+
+def normalize_title(title: Any) -> str:
+    title = re.sub(r"[^\w\s]", " ", str(title or "").lower())
+    return " ".join(title.split())
+
+
+def record_key(record: Dict[str, Any]) -> str:
+    """
+    Identity of an extracted record: its DOI when known, otherwise its title.
+    Returns "" when neither is usable.
+    """
+    doi = normalize_doi(record.get("doi"))
+    if doi:
+        return f"doi:{doi}"
+    title = normalize_title(record.get("title"))
+    return f"title:{title}" if title else ""
+
+
+def iter_export_rows(records: Iterable[Dict[str, Any]]) -> Iterator[List[str]]:
+    """Yields one CSV row per unique record, skipping failed extractions."""
+    seen = set()
+    for record in records:
+        if not isinstance(record, dict) or "error" in record:
+            continue
+        key = record_key(record)
+        if key and key in seen:
+            continue
+        seen.add(key)
+        row = []
+        for field, default in _FIELDS:
+            value = record.get(field, default)
+            row.append(str(value) if isinstance(value, list) else ("" if value is None else str(value)))
+        yield row
+
+
+def _atomic_target(path: str):
+    """Opens a temp file next to `path` so it can be swapped in with os.replace."""
+    folder = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp_", suffix=os.path.splitext(path)[1], dir=folder)
+    return fd, tmp_path
+
+
+def write_export_snapshot(records: Iterable[Dict[str, Any]], project_id: str,
+                          with_parquet: bool = False, base_dir: str = "data") -> Dict[str, Any]:
+    """
+    Writes a fresh, de-duplicated snapshot of the project's extracted records to
+    data/<project_id>/extracted_data.csv (and optionally .parquet).
+    Readers never see a partially written file: each output is written to a temp
+    file in the same folder and renamed over the previous snapshot.
+    Returns {"csv": path, "parquet": path|None, "rows": n}
+    """
+    folder = os.path.join(base_dir, project_id)
+    os.makedirs(folder, exist_ok=True)
+    csv_path = os.path.join(folder, EXPORT_CSV)
+
+    kept_rows: Optional[List[List[str]]] = [] if with_parquet else None
+    n_rows = 0
+    fd, tmp_path = _atomic_target(csv_path)
+    try:
+        with os.fdopen(fd, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(EXPORT_COLUMNS)
+            for row in iter_export_rows(records):
+                writer.writerow(row)
+                n_rows += 1
+                if kept_rows is not None:
+                    kept_rows.append(row)
+        os.replace(tmp_path, csv_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    parquet_path = None
+    if kept_rows is not None:
+        parquet_path = _write_parquet(kept_rows, os.path.join(folder, EXPORT_PARQUET))
+
+    return {"csv": csv_path, "parquet": parquet_path, "rows": n_rows}
+
+
+def _write_parquet(rows: List[List[str]], path: str) -> Optional[str]:
+    try:
+        import pandas as pd
+        df = pd.DataFrame(rows, columns=EXPORT_COLUMNS)
+        fd, tmp_path = _atomic_target(path)
+        os.close(fd)
+        try:
+            df.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return path
+    except ImportError as e:
+        # pyarrow/fastparquet are optional; the CSV snapshot is still valid
+        print(f"⚠️ Parquet export skipped: {e}")
+        return None
+
+
+def stream_file(path: str, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+    """
+    Yields the file in fixed-size chunks. The handle is opened on the first
+    chunk and held until the last, so a snapshot swapped in mid-download does
+    not affect the response being sent, and a response that is never iterated
+    leaves no open file behind.
+    """
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(chunk_size)
+            if not block:
+                break
+            yield block
@@ -0,0 +1,158 @@
+# hit_estimator.py
+"""
+Result-count estimates for a search string without harvesting any results.
+
+Each provider is asked for a single record and only the total is read
+(Scopus `opensearch:totalResults`, arXiv's OpenSearch `totalResults`); the
+calls run concurrently and totals are kept for HIT_COUNT_TTL_S, so refining a
+query and flipping back costs nothing. The same Boolean AST is also evaluated
+against the project's stored abstracts, which needs no network at all.
+"""
+import os
+import time
+import threading
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from agents3 import api_key, build_elsevier_query, build_arxiv_query, parse_search_string
+from boolean_query import compile_matcher, to_string
+from corpus_store import load_abstracts
+
+TTL_S = float(os.getenv("HIT_COUNT_TTL_S", str(6 * 3600)))
+TIMEOUT_S = float(os.getenv("HIT_COUNT_TIMEOUT_S", "3"))
+LOCAL_SAMPLE = 5
+MAX_CACHED = 2048
+SOURCES = ("Elsevier", "arXiv")
+
+_OPENSEARCH_NS = "{http://a9.com/-/spec/opensearch/1.1/}"
+
+_session = requests.Session()
+_session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+_session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="hit-count")
+
+_cache: Dict[tuple, tuple] = {}
+_cache_lock = threading.Lock()
+
+
+def count_elsevier(query: str, timeout: float = TIMEOUT_S) -> int:
+    r = _session.get(
+        "https://api.elsevier.com/content/search/scopus",
+        headers={"X-ELS-APIKey": api_key, "Accept": "application/json"},
+        params={"query": query, "count": 1, "field": "dc:identifier"},
+        timeout=timeout,
+    )
+    r.raise_for_status()
+    return int(r.json().get("search-results", {}).get("opensearch:totalResults", 0))
+
+
+def count_arxiv(query: str, timeout: float = TIMEOUT_S) -> int:
+    r = _session.get(
+        "http://export.arxiv.org/api/query",
+        params={"search_query": query, "start": 0, "max_results": 1},
+        timeout=timeout,
+    )
+    r.raise_for_status()
+    total = ET.fromstring(r.content).find(f"{_OPENSEARCH_NS}totalResults")
+    return int(total.text) if total is not None and total.text else 0
+
+
+_COUNTERS = {"Elsevier": count_elsevier, "arXiv": count_arxiv}
+
+
+def provider_query(source: str, search_string: str, start_year, end_year, is_english: bool) -> str:
+    """The exact query /api/search_papers sends, so the estimate matches the harvest."""
+    if source == "Elsevier":
+        return build_elsevier_query(search_string, start_year, end_year, is_english)
+    return build_arxiv_query(search_string, start_year, end_year)
+
+
+def _cached_count(source: str, query: str) -> Dict[str, Any]:
+    key = (source, query)
+    with _cache_lock:
+        hit = _cache.get(key)
+    if hit and time.time() - hit[1] < TTL_S:
+        return {"count": hit[0], "query": query, "cached": True, "ms": 0}
+
+    t0 = time.perf_counter()
+    count = _COUNTERS[source](query)
+    now = time.time()
+    with _cache_lock:
+        if len(_cache) >= MAX_CACHED:
+            for stale in [k for k, (_, ts) in _cache.items() if now - ts >= TTL_S]:
+                del _cache[stale]
+        _cache[key] = (count, now)
+    return {"count": count, "query": query, "cached": False,
+            "ms": round((time.perf_counter() - t0) * 1000)}
+
+
+def count_local(project_id: str, node, start_year=None, end_year=None) -> Dict[str, Any]:
+    """
+    Evaluates the query over title + abstract of the project's stored corpus,
+    keeping papers from start_year to end_year inclusive (just start_year
+    without an end year), the same range the provider queries use.
+    Papers without a usable year are kept.
+    """
+    t0 = time.perf_counter()
+    rows = load_abstracts(project_id, columns=("title", "abstract", "year"))
+    lo = int(start_year) if str(start_year or "").isdigit() else None
+    hi = int(end_year) if str(end_year or "").isdigit() else lo
+    if lo is not None:
+        rows = [r for r in rows if not str(r["year"])[:4].isdigit() or lo <= int(str(r["year"])[:4]) <= hi]
+
+    matches = compile_matcher(node)
+    matched: List[str] = []
+    count = 0
+    for r in rows:
+        if matches(f"{r['title']}\n{r['abstract']}".lower()):
+            count += 1
+            if len(matched) < LOCAL_SAMPLE:
+                matched.append(r["title"])
+    return {"count": count, "total": len(rows), "sample": matched,
+            "ms": round((time.perf_counter() - t0) * 1000)}
+
+
+def estimate_hits(search_string: str, start_year, end_year=None, is_english: bool = False,
+                  sources: Optional[List[str]] = None, project_id: Optional[str] = None,
+                  timeout: float = TIMEOUT_S) -> Dict[str, Any]:
+    """
+    {"query": canonical search string, "providers": {source: {"count", "query", "cached", "ms"}
+    or {"error"}}, "local": {"count", "total", "sample", "ms"} | None, "ms"}.
+    A provider that has not answered within `timeout` is reported as an error
+    rather than holding up the others.
+    """
+    t0 = time.perf_counter()
+    node = parse_search_string(search_string)
+    sources = [s for s in (sources or SOURCES) if s in _COUNTERS]
+
+    futures = {}
+    for source in sources:
+        query = provider_query(source, search_string, start_year, end_year, is_english)
+        futures[source] = _pool.submit(_cached_count, source, query)
+
+    local = None
+    if project_id and node is not None:
+        try:
+            local = count_local(project_id, node, start_year, end_year)
+        except Exception as e:
+            print(f"⚠️ Local hit count failed for project {project_id}: {e}")
+
+    wait(futures.values(), timeout=max(timeout - (time.perf_counter() - t0), 0))
+    providers = {}
+    for source, future in futures.items():
+        if not future.done():
+            # the call keeps running and still fills the cache for the next estimate
+            providers[source] = {"error": f"no answer within {timeout:g}s"}
+            continue
+        try:
+            providers[source] = future.result()
+        except Exception as e:
+            print(f"⚠️ {source} hit count failed: {e}")
+            providers[source] = {"error": str(e)}
+
+    return {"query": to_string(node) if node else search_string, "providers": providers,
+            "local": local, "ms": round((time.perf_counter() - t0) * 1000)}
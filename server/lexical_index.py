@@ -0,0 +1,128 @@
+# lexical_index.py
+import os
+import re
+import math
+import sqlite3
+from collections import Counter
+from contextlib import closing
+from typing import List, Tuple, Iterable
+
+LEXICAL_DB = "bm25.db"
+
+# BM25 parameters (Robertson/Sparck Jones defaults)
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-_.+][a-z0-9]+)*")
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has", "have", "in",
+    "is", "it", "its", "of", "on", "or", "that", "the", "this", "to", "was", "were",
+    "which", "with", "we", "our", "can", "these", "those", "not", "but", "been", "also",
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    doc_id    INTEGER PRIMARY KEY,
+    stem      TEXT NOT NULL,
+    chunk_idx INTEGER NOT NULL,
+    length    INTEGER NOT NULL,
+    UNIQUE (stem, chunk_idx)
+);
+CREATE TABLE IF NOT EXISTS postings (
+    term   TEXT NOT NULL,
+    doc_id INTEGER NOT NULL,
+    tf     INTEGER NOT NULL,
+    PRIMARY KEY (term, doc_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS postings_doc ON postings(doc_id);
+"""
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased terms; keeps hyphenated/dotted names like 'bert-base' or 'gpt-4o' intact."""
+    return [t for t in _TOKEN_RE.findall((text or "").lower()) if t not in _STOPWORDS]
+
+
+def lexical_path(project_id: str, base_dir: str = "dataembedding") -> str:
+    return os.path.join(base_dir, project_id, LEXICAL_DB)
+
+
+def has_lexical_index(project_id: str, base_dir: str = "dataembedding") -> bool:
+    return os.path.exists(lexical_path(project_id, base_dir))
+
+
+def _connect(project_id: str, base_dir: str = "dataembedding") -> sqlite3.Connection:
+    path = lexical_path(project_id, base_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def _delete_stem(conn: sqlite3.Connection, stem: str) -> None:
+    conn.execute("DELETE FROM postings WHERE doc_id IN (SELECT doc_id FROM docs WHERE stem = ?)", (stem,))
+    conn.execute("DELETE FROM docs WHERE stem = ?", (stem,))
+
+
+def add_document_chunks(project_id: str, stem: str, texts: Iterable[str],
+                        base_dir: str = "dataembedding") -> int:
+    """
+    (Re)indexes the chunks of one uploaded file. Chunk positions must match the
+    rows of <stem>_embeddings.npy / <stem>_faiss.index so hits can be fused.
+    Returns the number of chunks indexed.
+    """
+    with closing(_connect(project_id, base_dir)) as conn, conn:
+        _delete_stem(conn, stem)
+        n = 0
+        for chunk_idx, text in enumerate(texts):
+            terms = Counter(tokenize(text))
+            cur = conn.execute(
+                "INSERT INTO docs (stem, chunk_idx, length) VALUES (?, ?, ?)",
+                (stem, chunk_idx, sum(terms.values())),
+            )
+            conn.executemany(
+                "INSERT INTO postings (term, doc_id, tf) VALUES (?, ?, ?)",
+                [(term, cur.lastrowid, tf) for term, tf in terms.items()],
+            )
+            n += 1
+    return n
+
+
+def remove_document(project_id: str, stem: str, base_dir: str = "dataembedding") -> None:
+    if not has_lexical_index(project_id, base_dir):
+        return
+    with closing(_connect(project_id, base_dir)) as conn, conn:
+        _delete_stem(conn, stem)
+
+
+def search(project_id: str, query: str, top_k: int = 20,
+           base_dir: str = "dataembedding") -> List[Tuple[str, int, float]]:
+    """
+    BM25 search over the project's chunks. Needs no embedding call.
+    Returns [(stem, chunk_idx, score)] sorted by descending score.
+    """
+    terms = list(dict.fromkeys(tokenize(query)))
+    if not terms or not has_lexical_index(project_id, base_dir):
+        return []
+    with closing(_connect(project_id, base_dir)) as conn:
+        n_docs, avg_len = conn.execute("SELECT COUNT(*), AVG(length) FROM docs").fetchone()
+        if not n_docs:
+            return []
+        avg_len = avg_len or 1.0
+        marks = ",".join("?" * len(terms))
+        df = dict(conn.execute(
+            f"SELECT term, COUNT(*) FROM postings WHERE term IN ({marks}) GROUP BY term", terms))
+        rows = conn.execute(
+            f"""SELECT p.term, p.doc_id, p.tf, d.length, d.stem, d.chunk_idx
+                FROM postings p JOIN docs d ON d.doc_id = p.doc_id
+                WHERE p.term IN ({marks})""", terms).fetchall()
+
+    scores, keys = {}, {}
+    for term, doc_id, tf, length, stem, chunk_idx in rows:
+        idf = math.log(1 + (n_docs - df[term] + 0.5) / (df[term] + 0.5))
+        norm = tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_len))
+        scores[doc_id] = scores.get(doc_id, 0.0) + idf * norm
+        keys[doc_id] = (stem, chunk_idx)
+    best = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)[:top_k]
+    return [(keys[d][0], keys[d][1], s) for d, s in best]
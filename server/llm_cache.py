@@ -0,0 +1,148 @@
+# llm_cache.py
+"""
+Disk cache for idempotent chat completions, keyed by a hash of the request
+payload (model, messages, temperature, max_tokens and any other options).
+
+Responses live zlib-compressed in SQLite; a small in-process LRU holds the raw
+bytes of recent hits so repeated calls skip both the API and the database.
+The file is trimmed to LLM_CACHE_MAX_MB, least recently used first.
+"""
+import os
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join("data", ".llm_cache", "responses.db"))
+ENABLED = os.getenv("LLM_CACHE", "1") != "0"
+MAX_BYTES = int(float(os.getenv("LLM_CACHE_MAX_MB", "256")) * 1024 * 1024)
+MEMORY_ENTRIES = 256
+TOUCH_INTERVAL = 600  # seconds between last_used updates for the same entry
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key       TEXT PRIMARY KEY,
+    model     TEXT NOT NULL,
+    body      BLOB NOT NULL,
+    size      INTEGER NOT NULL,
+    created   REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_last_used ON responses(last_used);
+"""
+
+_local = threading.local()
+_memory: "OrderedDict[str, bytes]" = OrderedDict()
+_memory_lock = threading.Lock()
+_counters = {"hits": 0, "misses": 0}
+
+# request options that change how a response is delivered, not what it says
+_TRANSPORT_KEYS = ("stream", "stream_options", "user")
+
+
+def cache_key(payload: Dict[str, Any]) -> str:
+    canonical = {k: v for k, v in payload.items() if k not in _TRANSPORT_KEYS}
+    blob = json.dumps(canonical, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def should_cache(payload: Dict[str, Any], cache: Optional[bool] = None) -> bool:
+    """cache=None means automatic: on for temperature-0 requests only. Streams are never cached."""
+    if not ENABLED or payload.get("stream"):
+        return False
+    if cache is not None:
+        return cache
+    return payload.get("temperature") == 0
+
+
+def _connect() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(CACHE_PATH) or ".", exist_ok=True)
+        conn = sqlite3.connect(CACHE_PATH, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        _local.conn = conn
+    return conn
+
+
+def _remember(key: str, content: bytes) -> None:
+    with _memory_lock:
+        _memory[key] = content
+        _memory.move_to_end(key)
+        while len(_memory) > MEMORY_ENTRIES:
+            _memory.popitem(last=False)
+
+
+def get(key: str) -> Optional[bytes]:
+    """Raw response body for key, or None."""
+    with _memory_lock:
+        content = _memory.get(key)
+        if content is not None:
+            _memory.move_to_end(key)
+            _counters["hits"] += 1
+            return content
+
+    conn = _connect()
+    row = conn.execute("SELECT body, last_used FROM responses WHERE key = ?", (key,)).fetchone()
+    if row is None:
+        _counters["misses"] += 1
+        return None
+    now = time.time()
+    if now - row[1] > TOUCH_INTERVAL:
+        with conn:
+            conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+    content = zlib.decompress(row[0])
+    _remember(key, content)
+    _counters["hits"] += 1
+    return content
+
+
+def put(key: str, model: str, content: bytes) -> None:
+    body = zlib.compress(content, 6)
+    now = time.time()
+    conn = _connect()
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO responses (key, model, body, size, created, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+            (key, model, body, len(body), now, now),
+        )
+    _remember(key, content)
+    _evict(conn)
+
+
+def _evict(conn: sqlite3.Connection) -> None:
+    total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+    if total <= MAX_BYTES:
+        return
+    target = int(MAX_BYTES * 0.9)  # trim below the limit so we don't evict on every put
+    doomed = []
+    for key, size in conn.execute("SELECT key, size FROM responses ORDER BY last_used"):
+        if total <= target:
+            break
+        doomed.append((key,))
+        total -= size
+    with conn:
+        conn.executemany("DELETE FROM responses WHERE key = ?", doomed)
+    with _memory_lock:
+        for (key,) in doomed:
+            _memory.pop(key, None)
+    print(f"LLM cache trimmed {len(doomed)} entries")
+
+
+def clear() -> None:
+    conn = _connect()
+    with conn:
+        conn.execute("DELETE FROM responses")
+    with _memory_lock:
+        _memory.clear()
+
+
+def stats() -> Dict[str, Any]:
+    entries, size = _connect().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+    return {"enabled": ENABLED, "entries": entries, "bytes": size, "max_bytes": MAX_BYTES, **_counters}
@@ -0,0 +1,207 @@
+# llm_dispatcher.py
+"""
+Admission control for LLM calls: one token bucket pair (requests/min and
+tokens/min) per model, a global cap on requests in flight, and priority
+classes so interactive traffic is admitted before bulk jobs.
+
+The scheduler runs on its own asyncio loop in a daemon thread. Async callers
+await admit_async(); synchronous Flask handlers use the rate_limited() context
+manager, which blocks the calling thread until the request is admitted.
+"""
+import os
+import json
+import time
+import asyncio
+import itertools
+import threading
+from contextlib import contextmanager, asynccontextmanager
+from typing import Dict, List, Optional
+
+PRIORITY_INTERACTIVE = 0   # RAG chat, streamed answers
+PRIORITY_DEFAULT = 1       # generation steps a user is waiting on
+PRIORITY_BULK = 2          # screening, extraction, ingestion
+
+# Per-model limits; override with LLM_RATE_LIMITS='{"gpt-4o": {"rpm": 500, "tpm": 30000}}'
+DEFAULT_LIMITS = {
+    "gpt-4o": {"rpm": 500, "tpm": 30_000},
+    "gpt-4o-mini": {"rpm": 500, "tpm": 200_000},
+    "gpt-4-turbo": {"rpm": 500, "tpm": 30_000},
+    "gpt-3.5-turbo": {"rpm": 3_500, "tpm": 200_000},
+    "text-embedding-ada-002": {"rpm": 3_000, "tpm": 1_000_000},
+}
+FALLBACK_LIMITS = {"rpm": 500, "tpm": 30_000}
+MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "16"))
+DEFAULT_COMPLETION_TOKENS = 512
+
+_dispatcher = None
+_lock = threading.Lock()
+
+
+def model_limits(model: str) -> Dict[str, int]:
+    limits = dict(DEFAULT_LIMITS)
+    try:
+        limits.update(json.loads(os.getenv("LLM_RATE_LIMITS", "{}")))
+    except json.JSONDecodeError:
+        print("⚠️ LLM_RATE_LIMITS is not valid JSON, using defaults")
+    return {**FALLBACK_LIMITS, **limits.get(model, {})}
+
+
+def estimate_tokens(messages: Optional[List[Dict[str, str]]] = None, max_tokens: Optional[int] = None,
+                    texts: Optional[List[str]] = None) -> int:
+    """
+    Rough upfront cost: ~4 characters per prompt token plus the completion
+    allowance, which is how the provider charges TPM before the call runs.
+    """
+    chars = sum(len(m.get("content") or "") for m in messages or [])
+    chars += sum(len(t) for t in texts or [])
+    completion = 0 if texts is not None else (max_tokens or DEFAULT_COMPLETION_TOKENS)
+    return max(1, chars // 4) + completion
+
+
+class TokenBucket:
+    """Refills continuously at per_minute / 60 per second up to per_minute."""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.stamp = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def wait_time(self, amount: float) -> float:
+        self._refill()
+        amount = min(amount, self.capacity)  # an oversized request still gets through once full
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount: float) -> None:
+        self.level -= min(amount, self.capacity)
+
+    def credit(self, amount: float) -> None:
+        """Positive refunds an overestimate; negative charges an underestimate."""
+        self._refill()
+        self.level = min(self.capacity, self.level + amount)
+
+
+class _Lane:
+    """Priority queue and buckets for one model; admits one waiter at a time."""
+
+    def __init__(self, dispatcher: "Dispatcher", model: str):
+        limits = model_limits(model)
+        self.model = model
+        self.rpm = TokenBucket(limits["rpm"])
+        self.tpm = TokenBucket(limits["tpm"])
+        self.queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        self.dispatcher = dispatcher
+        self.task = asyncio.ensure_future(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            _, _, tokens, waiter = await self.queue.get()
+            if waiter.done():
+                continue
+            while True:
+                wait = max(self.rpm.wait_time(1), self.tpm.wait_time(tokens))
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+            await self.dispatcher.slots.acquire()
+            if waiter.done():  # caller gave up while we were waiting
+                self.dispatcher.slots.release()
+                continue
+            self.rpm.take(1)
+            self.tpm.take(tokens)
+            waiter.set_result(None)
+
+
+class Lease:
+    """An admitted request. settle() reconciles TPM with actual usage; release() frees the slot."""
+
+    def __init__(self, dispatcher: "Dispatcher", lane: _Lane, estimate: int):
+        self._dispatcher = dispatcher
+        self._lane = lane
+        self.estimate = estimate
+        self._released = False
+
+    def settle(self, used_tokens: Optional[int]) -> None:
+        if used_tokens is not None:
+            self._dispatcher.loop.call_soon_threadsafe(self._lane.tpm.credit, self.estimate - used_tokens)
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._dispatcher.loop.call_soon_threadsafe(self._dispatcher.slots.release)
+
+
+class Dispatcher:
+    def __init__(self, max_in_flight: int = MAX_IN_FLIGHT):
+        self.loop = asyncio.new_event_loop()
+        self._lanes: Dict[str, _Lane] = {}
+        self._seq = itertools.count()
+        self.slots = None
+        ready = threading.Event()
+
+        def _serve():
+            asyncio.set_event_loop(self.loop)
+            self.slots = asyncio.Semaphore(max_in_flight)
+            ready.set()
+            self.loop.run_forever()
+
+        threading.Thread(target=_serve, name="llm-dispatcher", daemon=True).start()
+        ready.wait()
+
+    async def admit(self, model: str, tokens: int, priority: int = PRIORITY_DEFAULT) -> Lease:
+        """Runs on the dispatcher loop; resolves once the model's lane admits the request."""
+        lane = self._lanes.get(model)
+        if lane is None:
+            lane = self._lanes[model] = _Lane(self, model)
+        waiter = self.loop.create_future()
+        # seq keeps FIFO order within a priority class
+        lane.queue.put_nowait((priority, next(self._seq), tokens, waiter))
+        await waiter
+        return Lease(self, lane, tokens)
+
+    def admit_sync(self, model: str, tokens: int, priority: int = PRIORITY_DEFAULT) -> Lease:
+        return asyncio.run_coroutine_threadsafe(self.admit(model, tokens, priority), self.loop).result()
+
+    async def admit_async(self, model: str, tokens: int, priority: int = PRIORITY_DEFAULT) -> Lease:
+        """Awaitable from any event loop, not only the dispatcher's."""
+        future = asyncio.run_coroutine_threadsafe(self.admit(model, tokens, priority), self.loop)
+        return await asyncio.wrap_future(future)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        return {model: {"queued": lane.queue.qsize(),
+                        "rpm_available": round(lane.rpm.level, 1),
+                        "tpm_available": round(lane.tpm.level, 1)}
+                for model, lane in list(self._lanes.items())}
+
+
+def get_dispatcher() -> Dispatcher:
+    global _dispatcher
+    if _dispatcher is None:
+        with _lock:
+            if _dispatcher is None:
+                _dispatcher = Dispatcher()
+    return _dispatcher
+
+
+@contextmanager
+def rate_limited(model: str, tokens: int, priority: int = PRIORITY_DEFAULT):
+    """Sync facade: blocks until admitted, yields the Lease, frees the slot on exit."""
+    lease = get_dispatcher().admit_sync(model, tokens, priority)
+    try:
+        yield lease
+    finally:
+        lease.release()
+
+
+@asynccontextmanager
+async def arate_limited(model: str, tokens: int, priority: int = PRIORITY_DEFAULT):
+    lease = await get_dispatcher().admit_async(model, tokens, priority)
+    try:
+        yield lease
+    finally:
+        lease.release()
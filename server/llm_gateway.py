@@ -0,0 +1,215 @@
+# llm_gateway.py
+"""
+Single entry point for OpenAI-compatible calls.
+
+Every agent goes through here so that connections are pooled and kept alive,
+timeouts are consistent, 429/5xx responses are retried with jittered backoff,
+and the API can be pointed at a local stub with OPENAI_BASE_URL. Calls are
+admitted through llm_dispatcher's per-model RPM/TPM limiter; idempotent
+chat completions are answered from llm_cache when possible.
+"""
+import os
+import json
+import time
+import random
+import asyncio
+import threading
+from typing import List, Dict, Any, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+from llm_dispatcher import rate_limited, arate_limited, estimate_tokens, PRIORITY_DEFAULT
+import llm_cache
+
+load_dotenv()
+
+API_KEY = os.getenv("API-KEY")
+BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1").rstrip("/")
+
+CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "10"))
+READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "180"))
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+BACKOFF_BASE = 0.5   # seconds; doubled per attempt
+BACKOFF_CAP = 20.0
+POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "32"))
+
+RETRY_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+
+_session: Optional[requests.Session] = None
+_client = None
+_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """Process-wide keep-alive session (one TLS handshake per pooled connection)."""
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                session.headers.update({
+                    "Authorization": f"Bearer {API_KEY}",
+                    "Content-Type": "application/json",
+                })
+                _session = session
+    return _session
+
+
+def get_openai_client():
+    """Shared OpenAI SDK client on a pooled httpx transport, same base URL and timeouts."""
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                import httpx
+                from openai import OpenAI
+                _client = OpenAI(
+                    api_key=API_KEY,
+                    base_url=BASE_URL,
+                    max_retries=MAX_RETRIES,  # the SDK backs off with jitter on 429/5xx
+                    timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+                    http_client=httpx.Client(limits=httpx.Limits(
+                        max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE)),
+                )
+    return _client
+
+
+def _backoff_delay(attempt: int, retry_after: Optional[str] = None) -> float:
+    if retry_after:
+        try:
+            return min(float(retry_after), BACKOFF_CAP)
+        except ValueError:
+            pass
+    # full jitter: uniform in [0, base * 2^attempt]
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * (2 ** attempt)))
+
+
+def post(path: str, payload: Dict[str, Any], timeout: Optional[float] = None,
+         stream: bool = False) -> requests.Response:
+    """
+    POSTs JSON to BASE_URL + path, retrying connection errors and RETRY_STATUSES.
+    Returns the final response (callers check status_code as before).
+    """
+    session = get_session()
+    url = f"{BASE_URL}/{path.lstrip('/')}"
+    timeouts = (CONNECT_TIMEOUT, timeout or READ_TIMEOUT)
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            response = session.post(url, json=payload, timeout=timeouts, stream=stream)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt == MAX_RETRIES:
+                raise
+            delay = _backoff_delay(attempt)
+            print(f"⚠️ LLM request failed ({e.__class__.__name__}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+            continue
+        if response.status_code not in RETRY_STATUSES or attempt == MAX_RETRIES:
+            return response
+        delay = _backoff_delay(attempt, response.headers.get("Retry-After"))
+        print(f"⚠️ LLM request returned {response.status_code}, retrying in {delay:.1f}s")
+        response.close()
+        time.sleep(delay)
+    return response
+
+
+def _total_tokens(response: requests.Response) -> Optional[int]:
+    if response.status_code != 200:
+        return None
+    try:
+        return response.json().get("usage", {}).get("total_tokens")
+    except ValueError:
+        return None
+
+
+def _cached_response(content: bytes) -> requests.Response:
+    response = requests.Response()
+    response.status_code = 200
+    response._content = content
+    response.headers["Content-Type"] = "application/json"
+    response.headers["X-Cache"] = "hit"
+    return response
+
+
+def post_chat_completion(data: Dict[str, Any], timeout: Optional[float] = None,
+                         priority: int = PRIORITY_DEFAULT, cache: Optional[bool] = None) -> requests.Response:
+    """
+    Drop-in for requests.post(".../v1/chat/completions", ...) with pooling, retries and rate limiting.
+    cache=True/False forces the response cache on/off; None caches temperature-0 requests only.
+    """
+    key = llm_cache.cache_key(data) if llm_cache.should_cache(data, cache) else None
+    if key:
+        content = llm_cache.get(key)
+        if content is not None:
+            return _cached_response(content)
+
+    tokens = estimate_tokens(data.get("messages"), data.get("max_tokens"))
+    with rate_limited(data["model"], tokens, priority) as lease:
+        response = post("chat/completions", data, timeout=timeout)
+        lease.settle(_total_tokens(response))
+    if key and response.status_code == 200:
+        llm_cache.put(key, data["model"], response.content)
+    return response
+
+
+def _chat_payload(model, messages, temperature, max_tokens, extra) -> Dict[str, Any]:
+    data: Dict[str, Any] = {"model": model, "messages": messages, **extra}
+    if temperature is not None:
+        data["temperature"] = temperature
+    if max_tokens is not None:
+        data["max_tokens"] = max_tokens
+    return data
+
+
+def chat_completion(model: str, messages: List[Dict[str, str]], temperature: Optional[float] = None,
+                    max_tokens: Optional[int] = None, timeout: Optional[float] = None,
+                    priority: int = PRIORITY_DEFAULT, cache: Optional[bool] = None, **extra) -> str:
+    """Returns the first choice's content; raises requests.HTTPError on a non-2xx final response."""
+    data = _chat_payload(model, messages, temperature, max_tokens, extra)
+    response = post_chat_completion(data, timeout=timeout, priority=priority, cache=cache)
+    response.raise_for_status()
+    return response.json()["choices"][0]["message"]["content"]
+
+
+async def achat_completion(model: str, messages: List[Dict[str, str]], temperature: Optional[float] = None,
+                           max_tokens: Optional[int] = None, timeout: Optional[float] = None,
+                           priority: int = PRIORITY_DEFAULT, cache: Optional[bool] = None, **extra) -> str:
+    """Async chat_completion: waits for admission without blocking the loop, sends on the pooled session."""
+    data = _chat_payload(model, messages, temperature, max_tokens, extra)
+    key = llm_cache.cache_key(data) if llm_cache.should_cache(data, cache) else None
+    if key:
+        content = await asyncio.to_thread(llm_cache.get, key)
+        if content is not None:
+            return json.loads(content)["choices"][0]["message"]["content"]
+    async with arate_limited(model, estimate_tokens(messages, max_tokens), priority) as lease:
+        response = await asyncio.to_thread(post, "chat/completions", data, timeout)
+        lease.settle(_total_tokens(response))
+    response.raise_for_status()
+    if key:
+        await asyncio.to_thread(llm_cache.put, key, model, response.content)
+    return response.json()["choices"][0]["message"]["content"]
+
+
+def _embedding_rows(response: requests.Response) -> List[List[float]]:
+    response.raise_for_status()
+    return [d["embedding"] for d in sorted(response.json()["data"], key=lambda d: d["index"])]
+
+
+def embed_texts(texts: List[str], model: str = "text-embedding-ada-002",
+                priority: int = PRIORITY_DEFAULT) -> List[List[float]]:
+    """One embeddings request for all texts; rows come back in input order."""
+    with rate_limited(model, estimate_tokens(texts=texts), priority) as lease:
+        response = post("embeddings", {"model": model, "input": texts})
+        lease.settle(_total_tokens(response))
+    return _embedding_rows(response)
+
+
+async def aembed_texts(texts: List[str], model: str = "text-embedding-ada-002",
+                       priority: int = PRIORITY_DEFAULT) -> List[List[float]]:
+    async with arate_limited(model, estimate_tokens(texts=texts), priority) as lease:
+        response = await asyncio.to_thread(post, "embeddings", {"model": model, "input": texts})
+        lease.settle(_total_tokens(response))
+    return _embedding_rows(response)
@@ -0,0 +1,136 @@
+# page_cache.py
+"""
+URL-keyed store for deep-research page fetches. The raw HTML (zlib) and the
+trafilatura text are kept in separate columns so that:
+
+- a fresh entry (younger than PAGE_CACHE_TTL_S) needs no network at all,
+- a stale one is revalidated with If-None-Match / If-Modified-Since and a 304
+  reuses the stored text,
+- a changed extractor re-extracts from the cached HTML without refetching.
+"""
+import os
+import time
+import zlib
+import sqlite3
+import hashlib
+import threading
+from typing import Any, Dict, Optional
+
+CACHE_PATH = os.getenv("PAGE_CACHE_PATH", os.path.join("data", ".page_cache", "pages.db"))
+TTL_S = float(os.getenv("PAGE_CACHE_TTL_S", str(7 * 24 * 3600)))
+MAX_BYTES = int(float(os.getenv("PAGE_CACHE_MAX_MB", "512")) * 1024 * 1024)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    url           TEXT PRIMARY KEY,
+    etag          TEXT,
+    last_modified TEXT,
+    fetched_at    REAL NOT NULL,
+    html          BLOB,
+    html_sha      TEXT,
+    text          BLOB,
+    extractor     TEXT,
+    size          INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS pages_fetched_at ON pages(fetched_at);
+"""
+
+_local = threading.local()
+
+
+def _connect() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(CACHE_PATH) or ".", exist_ok=True)
+        conn = sqlite3.connect(CACHE_PATH, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        _local.conn = conn
+    return conn
+
+
+def content_hash(html: bytes) -> str:
+    return hashlib.sha1(html).hexdigest()
+
+
+def _unpack(blob: Optional[bytes]) -> Optional[bytes]:
+    return zlib.decompress(blob) if blob is not None else None
+
+
+def lookup(url: str) -> Optional[Dict[str, Any]]:
+    row = _connect().execute(
+        "SELECT etag, last_modified, fetched_at, html, html_sha, text, extractor FROM pages WHERE url = ?",
+        (url,)).fetchone()
+    if row is None:
+        return None
+    etag, last_modified, fetched_at, html, html_sha, text, extractor = row
+    return {
+        "etag": etag,
+        "last_modified": last_modified,
+        "fetched_at": fetched_at,
+        "fresh": time.time() - fetched_at < TTL_S,
+        "html": _unpack(html),
+        "html_sha": html_sha,
+        "text": _unpack(text).decode("utf-8") if text is not None else None,
+        "extractor": extractor,
+    }
+
+
+def revalidation_headers(entry: Optional[Dict[str, Any]]) -> Dict[str, str]:
+    headers = {}
+    if entry and entry.get("html") is not None:
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
+
+def store_page(url: str, html: bytes, text: str, extractor: str,
+               etag: Optional[str] = None, last_modified: Optional[str] = None) -> None:
+    html_blob = zlib.compress(html, 6)
+    text_blob = zlib.compress(text.encode("utf-8"), 6)
+    conn = _connect()
+    with conn:
+        conn.execute(
+            """INSERT OR REPLACE INTO pages
+               (url, etag, last_modified, fetched_at, html, html_sha, text, extractor, size)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            (url, etag, last_modified, time.time(), html_blob, content_hash(html), text_blob,
+             extractor, len(html_blob) + len(text_blob)),
+        )
+    _evict(conn)
+
+
+def store_text(url: str, text: str, extractor: str) -> None:
+    """Re-extraction from cached HTML; the fetch metadata is unchanged."""
+    text_blob = zlib.compress(text.encode("utf-8"), 6)
+    conn = _connect()
+    with conn:
+        conn.execute(
+            "UPDATE pages SET text = ?, extractor = ?, size = LENGTH(html) + ? WHERE url = ?",
+            (text_blob, extractor, len(text_blob), url))
+
+
+def mark_revalidated(url: str) -> None:
+    """A 304 restarts the TTL."""
+    conn = _connect()
+    with conn:
+        conn.execute("UPDATE pages SET fetched_at = ? WHERE url = ?", (time.time(), url))
+
+
+def _evict(conn: sqlite3.Connection) -> None:
+    total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+    if total <= MAX_BYTES:
+        return
+    target = int(MAX_BYTES * 0.9)
+    doomed = []
+    for url, size in conn.execute("SELECT url, size FROM pages ORDER BY fetched_at"):
+        if total <= target:
+            break
+        doomed.append((url,))
+        total -= size
+    with conn:
+        conn.executemany("DELETE FROM pages WHERE url = ?", doomed)
+    print(f"Page cache trimmed {len(doomed)} entries")
@@ -1,60 +1,116 @@
 import os
-from openai import OpenAI
 import numpy as np
 import faiss
-import glob
+import time
+from retrieval_utils import fuse_scores, normalize_rows, search_all, top_k_hits
+from lexical_index import has_lexical_index, search as lexical_search
+from vector_index import load_project_index, locate, list_project_files, current_stems, covered_rows
+from llm_gateway import get_openai_client, embed_texts, chat_completion
+from llm_dispatcher import rate_limited, estimate_tokens, PRIORITY_INTERACTIVE
 
-openai_key = os.getenv("API-KEY")
-api_key = openai_key
-
-client = OpenAI(api_key=api_key)
+client = get_openai_client()
 
 def embed_query(query):
-    response = client.embeddings.create(
-        input=query,
-        model="text-embedding-ada-002"
-    )
-    return np.array(response.data[0].embedding, dtype='float32')
+    embedding = embed_texts([query], model="text-embedding-ada-002", priority=PRIORITY_INTERACTIVE)[0]
+    return np.array(embedding, dtype='float32')
 
-def load_all_embeddings(project_id):
+def load_file_indexes(project_id, stems):
+    """Per-file FAISS indexes for the given stems (files without an index are skipped)."""
     folder = os.path.join("dataembedding", project_id)
-    chunks_list = []
-    embeddings_list = []
-    index_list = []
-
-    for chunk_file in glob.glob(os.path.join(folder, "*_chunks.npy")):
-        prefix = chunk_file.replace("_chunks.npy", "")
-        emb_file = f"{prefix}_embeddings.npy"
-        index_file = f"{prefix}_faiss.index"
-
-        if not (os.path.exists(emb_file) and os.path.exists(index_file)):
-            continue
-
-        chunks = np.load(chunk_file, allow_pickle=True)
-        index = faiss.read_index(index_file)
-
-        chunks_list.append((chunks, index))
-
-    return chunks_list
-
-def query_rag_system(project_id, user_query, top_k=5):
-    query_vec = embed_query(user_query).reshape(1, -1)
-    all_chunks = load_all_embeddings(project_id)
-
-    matched = []
-    for chunks, index in all_chunks:
-        if index.d != query_vec.shape[1]:
-            continue  # Skip mismatched dimensionality
-
-        D, I = index.search(query_vec, top_k)
-        for dist, idx in zip(D[0], I[0]):
-            if 0 <= idx < len(chunks):
-                matched.append((dist, chunks[idx]))
-
-    # Sort all results by distance
-    matched = sorted(matched, key=lambda x: x[0])[:top_k]
-    retrieved_chunks = [chunk for _, chunk in matched]
-
+    indexes = []
+    for stem in stems:
+        index_file = os.path.join(folder, f"{stem}_faiss.index")
+        if os.path.exists(index_file):
+            indexes.append((stem, faiss.read_index(index_file)))
+    return indexes
+
+def retrieve_context(project_id, user_query, top_k=5, mode="hybrid", hybrid_alpha=0.5, min_score=None):
+    """Returns the text of the top_k chunks for the query (see retrieve_scored_chunks)."""
+    hits = retrieve_scored_chunks(project_id, user_query, top_k, mode, hybrid_alpha, min_score)
+    return [h["text"] for h in hits]
+
+def _vector_scores(project_id, query_vec, files, top_k, min_score):
+    """
+    {(stem, row): cosine} for the top_k vector hits. Uses the consolidated ANN
+    index when there is one and only opens per-file indexes for files it does
+    not cover yet (uploaded or re-uploaded since its last background update)
+    or without it.
+    """
+    project_index = load_project_index(project_id)
+    scores = {}
+    stems = [stem for stem, _ in files]
+    if project_index is not None and project_index["index"].d == query_vec.shape[1]:
+        # large corpora: one search over the consolidated ANN index
+        S, O, R = search_all([project_index["index"]], query_vec, top_k)
+        _, rows, hit_scores = top_k_hits(S[0], O[0], covered_rows(project_index, R[0]), top_k, min_score)
+        for row, score in zip(rows, hit_scores):
+            scores[locate(project_index, int(row))] = float(score)
+        indexed = current_stems(project_index)
+        stems = [stem for stem in stems if stem not in indexed]
+    if stems:
+        searchable = [(stem, index) for stem, index in load_file_indexes(project_id, stems)
+                      if index.d == query_vec.shape[1]]  # Skip mismatched dimensionality
+        # all indexes searched up front; only the top_k survivors become Python objects
+        S, O, R = search_all([index for _, index in searchable], query_vec, top_k)
+        owners, rows, hit_scores = top_k_hits(S[0], O[0], R[0], top_k, min_score)
+        for owner, row, score in zip(owners, rows, hit_scores):
+            scores[(searchable[owner][0], int(row))] = float(score)
+    return dict(sorted(scores.items(), key=lambda kv: kv[1], reverse=True)[:top_k])
+
+def retrieve_scored_chunks(project_id, user_query, top_k=5, mode="hybrid", hybrid_alpha=0.5, min_score=None):
+    """
+    Returns the top_k chunks for the query as [{"stem", "chunk_idx", "score", "text"}].
+    mode: "vector" (FAISS only), "lexical" (BM25 only, no embedding call) or
+    "hybrid" (both, fused with fuse_scores). Falls back to vector search when
+    the project has no lexical index yet. Vector hits are scored by cosine
+    similarity; min_score drops weaker ones. Chunk texts are only read for
+    the files that made the final top_k.
+    """
+    folder = os.path.join("dataembedding", project_id)
+    files = list_project_files(folder)
+    n_chunks = dict(files)
+    use_lexical = mode in ("hybrid", "lexical") and has_lexical_index(project_id)
+    use_vector = mode in ("hybrid", "vector") or not use_lexical
+
+    vector_scores = {}
+    if use_vector and files:
+        query_vec = normalize_rows(embed_query(user_query))
+        vector_scores = _vector_scores(project_id, query_vec, files, top_k, min_score)
+
+    lexical_scores = {}
+    if use_lexical:
+        for stem, idx, score in lexical_search(project_id, user_query, top_k=top_k * 4):
+            if idx < n_chunks.get(stem, 0):
+                lexical_scores[(stem, idx)] = score
+
+    fused = fuse_scores(vector_scores, lexical_scores, alpha=hybrid_alpha)
+    matched = sorted(fused.items(), key=lambda x: x[1], reverse=True)[:top_k]
+
+    chunks_by_stem = {}
+    results = []
+    for (stem, idx), score in matched:
+        if stem not in chunks_by_stem:
+            chunk_file = os.path.join(folder, f"{stem}_chunks.npy")
+            chunks_by_stem[stem] = np.load(chunk_file, allow_pickle=True) if os.path.exists(chunk_file) else []
+        if idx < len(chunks_by_stem[stem]):
+            results.append({"stem": stem, "chunk_idx": idx, "score": score,
+                            "text": chunk_text(stem, idx, chunks_by_stem[stem])})
+    return results
+
+def chunk_text(stem, idx, chunks):
+    """
+    Text of chunk idx. Files uploaded before chunk texts were stored only have
+    the chunk's name ("<stem>_chunk_<n>") in <stem>_chunks.npy; those need a re-upload.
+    """
+    text = str(chunks[idx])
+    if is_chunk_name(stem, idx, text):
+        print(f"⚠️ {stem} was indexed without its chunk text; re-upload it to use it as RAG context")
+    return text
+
+def is_chunk_name(stem, idx, text):
+    return text == f"{stem}_chunk_{idx + 1}"
+
+def build_rag_messages(user_query, retrieved_chunks):
     context = "\n\n".join(retrieved_chunks)
 
     prompt = f"""
@@ -69,16 +125,65 @@ Question:
 Answer:
 """
 
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        messages=[
-            {"role": "system", "content": "You are a helpful research assistant."},
-            {"role": "user", "content": prompt}
-        ],
-        temperature=0.3
-    )
+    return [
+        {"role": "system", "content": "You are a helpful research assistant."},
+        {"role": "user", "content": prompt}
+    ]
+
+def query_rag_system(project_id, user_query, top_k=5, mode="hybrid", hybrid_alpha=0.5, min_score=None):
+    retrieved_chunks = retrieve_context(project_id, user_query, top_k, mode, hybrid_alpha, min_score)
+
+    answer = chat_completion("gpt-4o", build_rag_messages(user_query, retrieved_chunks),
+                             temperature=0.3, priority=PRIORITY_INTERACTIVE)
 
     return {
-        "answer": response.choices[0].message.content.strip(),
+        "answer": answer.strip(),
         "context": retrieved_chunks
     }
+
+
+def stream_rag_answer(project_id, user_query, top_k=5, mode="hybrid", hybrid_alpha=0.5, min_score=None):
+    """
+    Streaming form of query_rag_system. Yields event dicts:
+      {"event": "sources", "context": [...]}   once retrieval is done
+      {"event": "token", "text": "..."}        per completion delta
+      {"event": "done", "answer", "usage", "ttft_ms", "total_ms"}
+    """
+    started = time.perf_counter()
+    retrieved_chunks = retrieve_context(project_id, user_query, top_k, mode, hybrid_alpha, min_score)
+    yield {"event": "sources", "context": retrieved_chunks}
+
+    messages = build_rag_messages(user_query, retrieved_chunks)
+    parts, usage, ttft_ms = [], None, None
+    with rate_limited("gpt-4o", estimate_tokens(messages), PRIORITY_INTERACTIVE) as lease:
+        stream = client.chat.completions.create(
+            model="gpt-4o",
+            messages=messages,
+            temperature=0.3,
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        for chunk in stream:
+            if chunk.usage is not None:
+                usage = chunk.usage.model_dump()
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if not delta:
+                continue
+            if ttft_ms is None:
+                ttft_ms = (time.perf_counter() - started) * 1000
+                print(f"rag_chat time-to-first-token: {ttft_ms:.0f} ms (project {project_id})")
+            parts.append(delta)
+            yield {"event": "token", "text": delta}
+        lease.settle(usage["total_tokens"] if usage else None)
+
+    total_ms = (time.perf_counter() - started) * 1000
+    print(f"rag_chat stream finished in {total_ms:.0f} ms, usage={usage}")
+    yield {
+        "event": "done",
+        "answer": "".join(parts).strip(),
+        "usage": usage,
+        "ttft_ms": ttft_ms,
+        "total_ms": total_ms,
+    }
@@ -0,0 +1,134 @@
+# retrieval_utils.py
+from typing import List, Dict, Optional, Sequence, Tuple
+import numpy as np
+import faiss
+
+
+def normalize_rows(x: np.ndarray) -> np.ndarray:
+    """L2-normalises each row (float32); zero rows are left as zeros."""
+    x = np.asarray(x, dtype="float32")
+    if x.ndim == 1:
+        x = x.reshape(1, -1)
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return x / norms
+
+
+def similarity_scores(index, distances: np.ndarray) -> np.ndarray:
+    """
+    Shared scoring convention for both retrieval paths: cosine similarity, higher is
+    better. Inner-product indexes over unit vectors already return cosine; legacy
+    IndexFlatL2 indexes return squared L2, which for unit vectors is 2 - 2*cosine.
+    """
+    distances = np.asarray(distances, dtype="float32")
+    if index.metric_type == faiss.METRIC_INNER_PRODUCT:
+        return distances
+    return 1.0 - distances / 2.0
+
+
+def search_all(indexes: Sequence, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Runs the same (n_queries, d) query matrix against every index and concatenates
+    the results column-wise. Returns (scores, owners, rows), each (n_queries, total):
+    cosine scores, position of the source index in `indexes`, and row within it
+    (-1 for padding).
+    """
+    n_queries = queries.shape[0]
+    scores, owners, rows = [], [], []
+    for owner, index in enumerate(indexes):
+        D, I = index.search(queries, k)
+        scores.append(similarity_scores(index, D))
+        rows.append(I)
+        owners.append(np.full(I.shape, owner, dtype="int32"))
+    if not rows:
+        empty = np.empty((n_queries, 0))
+        return empty.astype("float32"), empty.astype("int32"), empty.astype("int64")
+    return np.concatenate(scores, axis=1), np.concatenate(owners, axis=1), np.concatenate(rows, axis=1)
+
+
+def top_k_hits(scores: np.ndarray, owners: np.ndarray, rows: np.ndarray, k: int,
+               min_score: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Best-first top-k of one query's concatenated hits (one row of search_all's
+    output) using argpartition, so only k survivors are ever sorted.
+    Returns (owners, rows, scores) of the survivors.
+    """
+    valid = rows >= 0
+    if min_score is not None:
+        valid &= scores >= min_score
+    pos = np.flatnonzero(valid)
+    if len(pos) > k:
+        pos = pos[np.argpartition(-scores[pos], k - 1)[:k]] if k > 0 else pos[:0]
+    pos = pos[np.argsort(-scores[pos], kind="stable")]
+    return owners[pos], rows[pos], scores[pos]
+
+
+def mmr_select(candidates: np.ndarray, relevance: np.ndarray, k: int,
+               lambda_mult: float = 0.7, dup_threshold: Optional[float] = None,
+               groups: Optional[np.ndarray] = None, max_per_group: Optional[int] = None) -> List[int]:
+    """
+    Maximal marginal relevance over L2-normalised candidate vectors.
+    Each step picks argmax(lambda * relevance - (1 - lambda) * max_sim_to_selected).
+    Candidates whose cosine similarity to an already selected one is >= dup_threshold
+    are dropped as near-duplicates. If `groups` (one label per candidate) and
+    `max_per_group` are given, a group stops contributing once it hits the cap.
+    Returns selected row indices in pick order.
+    """
+    n = len(candidates)
+    k = min(k, n)
+    if k <= 0:
+        return []
+    relevance = np.asarray(relevance, dtype="float32")
+    max_sim = np.full(n, -1.0, dtype="float32")
+    available = np.ones(n, dtype=bool)
+    selected: List[int] = []
+    group_counts: dict = {}
+
+    for step in range(k):
+        if step == 0:
+            scores = relevance.copy()
+        else:
+            scores = lambda_mult * relevance - (1.0 - lambda_mult) * max_sim
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        if not np.isfinite(scores[best]):
+            break
+        selected.append(best)
+        available[best] = False
+        sims = candidates @ candidates[best]
+        np.maximum(max_sim, sims, out=max_sim)
+        if dup_threshold is not None:
+            available &= sims < dup_threshold
+        if groups is not None and max_per_group is not None:
+            g = groups[best]
+            group_counts[g] = group_counts.get(g, 0) + 1
+            if group_counts[g] >= max_per_group:
+                available &= groups != g
+    return selected
+
+
+
+def _minmax(scores: Dict) -> Dict:
+    if not scores:
+        return {}
+    lo, hi = min(scores.values()), max(scores.values())
+    span = (hi - lo) or 1.0
+    return {key: (v - lo) / span for key, v in scores.items()}
+
+
+def fuse_scores(vector_scores: Dict, lexical_scores: Dict, alpha: float = 0.5) -> Dict:
+    """
+    Convex combination of min-max normalised vector (cosine) and lexical (BM25)
+    scores: alpha * vec + (1 - alpha) * lex, with 0 for a key missing from one side.
+    With only one signal present its scores are returned as they are
+    (BM25 divided by its maximum), so single-mode retrieval keeps its scale.
+    Returns {key: fused_score}.
+    """
+    if not lexical_scores:
+        return dict(vector_scores)
+    if not vector_scores:
+        top = max(lexical_scores.values()) or 1.0
+        return {key: v / top for key, v in lexical_scores.items()}
+    vec, lex = _minmax(vector_scores), _minmax(lexical_scores)
+    return {key: alpha * vec.get(key, 0.0) + (1.0 - alpha) * lex.get(key, 0.0)
+            for key in set(vec) | set(lex)}
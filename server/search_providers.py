@@ -0,0 +1,203 @@
+# search_providers.py
+"""
+Web-search backends for deep research. Every provider answers
+
+    search(query, max_results) -> [{"url", "title", optional "text"}]
+    fetch_text(hit, stop, deadline) -> str | None
+
+fetch_text returning None means "download hit['url'] from the web"; offline
+providers return the text themselves, so the whole fan-out / fetch /
+synthesis path runs without network access.
+
+    tavily   - Tavily API (TAVILY_API_KEY)
+    local    - the project's own FAISS/BM25 indexes (uploaded PDFs)
+    fixture  - replays a recorded JSON fixture, with optional simulated latency
+"""
+import os
+import json
+import random
+import hashlib
+import threading
+from typing import List, Dict, Any, Optional
+
+import requests
+
+from rag_engine import retrieve_scored_chunks, is_chunk_name
+
+TAVILY_API_KEY = os.getenv("TAVILY_API_KEY")
+PROVIDER_NAMES = ("tavily", "local", "fixture")
+
+
+class ProviderError(RuntimeError):
+    """The provider itself cannot serve results; aborts the run instead of skipping one query."""
+
+
+class SearchProvider:
+    name = "base"
+
+    def search(self, query: str, max_results: int = 5) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def fetch_text(self, hit: Dict[str, Any], stop: Optional[threading.Event] = None,
+                   deadline: Optional[float] = None) -> Optional[str]:
+        return hit.get("text")
+
+
+class TavilyProvider(SearchProvider):
+    name = "tavily"
+
+    def __init__(self, api_key: Optional[str] = TAVILY_API_KEY):
+        self.api_key = api_key
+        self.session = requests.Session()
+
+    def search(self, query: str, max_results: int = 5) -> List[Dict[str, Any]]:
+        if not self.api_key:
+            # an empty result would let deep research synthesise a report from no sources
+            raise ProviderError("TAVILY_API_KEY is not set; configure it or choose the local or fixture provider")
+        r = self.session.post(
+            "https://api.tavily.com/search",
+            headers={"Content-Type": "application/json"},
+            json={"api_key": self.api_key, "query": query,
+                  "max_results": max_results, "include_answer": False},
+            timeout=45,
+        )
+        r.raise_for_status()
+        data = r.json()
+        return [{"url": it["url"], "title": it.get("title", "")} for it in data.get("results", [])]
+
+
+class LocalCorpusProvider(SearchProvider):
+    """
+    Searches the project's uploaded documents; each chunk is one 'page'.
+    Raises instead of returning a hit without its chunk text (files indexed
+    before chunk texts were stored), which would otherwise reach the
+    evidence store and the synthesis prompt as a bare chunk name.
+    """
+    name = "local"
+
+    def __init__(self, project_id: str, mode: str = "hybrid"):
+        self.project_id = project_id
+        self.mode = mode
+
+    def search(self, query: str, max_results: int = 5) -> List[Dict[str, Any]]:
+        hits = retrieve_scored_chunks(self.project_id, query, top_k=max_results, mode=self.mode)
+        for h in hits:
+            if not h["text"].strip() or is_chunk_name(h["stem"], h["chunk_idx"], h["text"]):
+                raise ProviderError(f"Local corpus chunk {h['stem']}#{h['chunk_idx']} has no stored text; "
+                                   f"re-upload {h['stem']} to use it for deep research")
+        return [{"url": f"local://{self.project_id}/{h['stem']}#{h['chunk_idx']}",
+                 "title": h["stem"], "text": h["text"]} for h in hits]
+
+
+class FixtureProvider(SearchProvider):
+    """
+    Replays {"queries": {query: [hits]}, "pages": {url: text}, "latency_ms": {"search", "fetch"}}.
+    Queries not in the fixture get a deterministic slice of all recorded hits,
+    so runs with freshly generated subquestions still exercise the pipeline.
+    """
+    name = "fixture"
+
+    def __init__(self, fixture: Dict[str, Any]):
+        self.queries = fixture.get("queries", {})
+        self.pages = fixture.get("pages", {})
+        latency = fixture.get("latency_ms", {})
+        self.search_latency = latency.get("search", 0) / 1000
+        self.fetch_latency = latency.get("fetch", 0) / 1000
+        self.all_hits = [h for hits in self.queries.values() for h in hits]
+
+    @classmethod
+    def from_file(cls, path: str) -> "FixtureProvider":
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    @classmethod
+    def synthetic(cls, n_hits: int = 400, n_hosts: int = 20, page_chars: int = 8000,
+                  search_ms: int = 800, fetch_ms: int = 1500, seed: int = 0) -> "FixtureProvider":
+        """Generated fixture for load tests: n_hits pages spread over n_hosts sites."""
+        rng = random.Random(seed)
+        words = ["model", "review", "evidence", "method", "study", "result", "bias", "sample",
+                 "outcome", "trial", "dataset", "accuracy", "protocol", "survey", "effect"]
+        hits, pages = [], {}
+        for i in range(n_hits):
+            url = f"https://site{i % n_hosts}.example/paper/{i}"
+            hits.append({"url": url, "title": f"Synthetic paper {i}"})
+            paras = [" ".join(rng.choice(words) for _ in range(120)) for _ in range(page_chars // 800)]
+            pages[url] = "\n\n".join(paras)
+        return cls({"queries": {"*": hits}, "pages": pages,
+                    "latency_ms": {"search": search_ms, "fetch": fetch_ms}})
+
+    def search(self, query: str, max_results: int = 5) -> List[Dict[str, Any]]:
+        if self.search_latency:
+            threading.Event().wait(self.search_latency)
+        hits = self.queries.get(query)
+        if hits is None and self.all_hits:
+            start = int(hashlib.sha1(query.encode("utf-8")).hexdigest(), 16) % len(self.all_hits)
+            hits = (self.all_hits[start:] + self.all_hits[:start])
+        return [dict(h) for h in (hits or [])[:max_results]]
+
+    def fetch_text(self, hit: Dict[str, Any], stop: Optional[threading.Event] = None,
+                   deadline: Optional[float] = None) -> Optional[str]:
+        if self.fetch_latency and (stop or threading.Event()).wait(self.fetch_latency):
+            return ""  # cancelled while "downloading"
+        return hit.get("text") or self.pages.get(hit["url"], "")
+
+
+class RecordingProvider(SearchProvider):
+    """Wraps a live provider and writes what it saw as a fixture for FixtureProvider."""
+
+    def __init__(self, inner: SearchProvider):
+        self.inner = inner
+        self.name = f"recording:{inner.name}"
+        self.queries: Dict[str, List[Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+    def search(self, query: str, max_results: int = 5) -> List[Dict[str, Any]]:
+        hits = self.inner.search(query, max_results)
+        with self._lock:
+            self.queries[query] = [{"url": h["url"], "title": h.get("title", "")} for h in hits]
+        return hits
+
+    def fetch_text(self, hit, stop=None, deadline=None):
+        return self.inner.fetch_text(hit, stop, deadline)
+
+    def save(self, path: str, sources: List[Dict[str, Any]]) -> None:
+        fixture = {"queries": self.queries, "pages": {s["url"]: s.get("text", "") for s in sources}}
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(fixture, f, ensure_ascii=False)
+        print(f"Recorded deep research fixture to {path}")
+
+
+def get_search_provider(name: Optional[str] = None, project_id: Optional[str] = None) -> SearchProvider:
+    """
+    name (or DEEP_RESEARCH_SEARCH): tavily | local | fixture | auto.
+    auto picks Tavily when a key is configured, otherwise the project's local
+    corpus, otherwise the fixture in DEEP_RESEARCH_FIXTURE. Raises
+    ProviderError when the chosen provider (or, for auto, every provider) is
+    not configured.
+    """
+    name = (name or os.getenv("DEEP_RESEARCH_SEARCH", "auto")).lower()
+    fixture_path = os.getenv("DEEP_RESEARCH_FIXTURE")
+    if name == "auto":
+        if TAVILY_API_KEY:
+            name = "tavily"
+        elif project_id:
+            name = "local"
+        elif fixture_path:
+            name = "fixture"
+        else:
+            raise ProviderError("No search provider is configured: set TAVILY_API_KEY, pass a project_id "
+                                "or point DEEP_RESEARCH_FIXTURE to a fixture file")
+    if name == "tavily":
+        if not TAVILY_API_KEY:
+            raise ProviderError("TAVILY_API_KEY is not set; configure it or choose the local or fixture provider")
+        return TavilyProvider()
+    if name == "local":
+        if not project_id:
+            raise ValueError("The local search provider needs a project_id")
+        return LocalCorpusProvider(project_id)
+    if name == "fixture":
+        if not fixture_path:
+            raise ValueError("DEEP_RESEARCH_FIXTURE must point to a fixture JSON file")
+        return FixtureProvider.from_file(fixture_path)
+    raise ValueError(f"Unknown search provider '{name}', expected one of {PROVIDER_NAMES}")
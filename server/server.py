@@ -1,42 +1,43 @@
 from dotenv import load_dotenv
 import os
-from flask import Flask, render_template, send_file, send_from_directory, request, jsonify
+from flask import Flask, render_template, send_file, send_from_directory, request, jsonify, Response, stream_with_context
+from werkzeug.utils import safe_join
 import datetime
-from agents import generate_research_questions_and_purpose_with_gpt, generate_abstract_with_openai, generate_summary_conclusion, generate_introduction_summary_with_openai, generate_research_objective_with_gpt, generate_research_report
+from agents import generate_research_questions_and_purpose_with_gpt, generate_abstract_with_openai, generate_summary_conclusion, generate_introduction_summary_with_openai, generate_research_objective_with_gpt, generate_research_report, iter_research_report
 import json
 from agents2 import generate_search_string_with_gpt, refine_search_string_with_gpt
 from agents3 import fetch_papers, save_papers_to_csv, search_elsevier, search_arxiv, search_ieee_xplore, search_semantic_scholar
 from agents4 import filter_papers_with_gpt_turbo, generate_response_gpt4_turbo, extract_structured_data_from_ai
 from flask_cors import CORS, cross_origin # type: ignore
-from rag_engine import query_rag_system
+from rag_engine import query_rag_system, stream_rag_answer
 from datetime import datetime
 from flask_socketio import SocketIO, emit # type: ignore
-from worlflow import research_workflow, ResearchState
+from worlflow import start_run, execute_run, submit_run, resume_run
+from workflow_runs import get_run, load_state, claim_for_resume, mark_interrupted
 from flask_pymongo import PyMongo
 from bson import ObjectId
 import fitz
-import csv
 import pandas as pd
 import json
 from pdf_utils import extract_text_from_pdf
 from embedding_utils import generate_embeddings_from_text
 import numpy as np
-import faiss
-from openai import OpenAI
+from llm_gateway import embed_texts
 import shutil
+import uuid
 from flask_sqlalchemy import SQLAlchemy
 from werkzeug.security import generate_password_hash, check_password_hash
 from deep_researcher import run_deepresearch_fallback
+from hit_estimator import estimate_hits
+from export_utils import write_export_snapshot, stream_file
+from corpus_store import upsert_abstracts, remove_source
+from lexical_index import add_document_chunks, remove_document
+from vector_index import schedule_project_index_update, current_index_type, save_file_vectors, remove_file_vectors, project_footprint, INDEX_TYPES, STORAGE_CODECS
 
 load_dotenv()
 
-openai_key = os.getenv("API-KEY")
-api_key = openai_key
-
 key = os.getenv("ELSEVIER_API_KEY")
 
-client = OpenAI(api_key = api_key)
-
 app = Flask(__name__, static_folder='dist')
 CORS(app, resources={r"/*": {"origins": "*"}})
 socketio = SocketIO(app, cors_allowed_origins="*")
@@ -56,6 +57,10 @@ class User(db.Model):
 with app.app_context():
     db.create_all()
 
+# Workflow runs left queued/running by a previous process become resumable. Done at
+# import so it also happens under gunicorn and other launchers, not only __main__.
+mark_interrupted()
+
 # MongoDB configuration
 app.config["MONGO_URI"] = os.getenv("MONGO_URI")
 mongo = PyMongo(app)
@@ -285,7 +290,7 @@ def get_csv():
     if not os.path.exists(project_path):
         return jsonify({"error": "No data found for this project"}), 404
 
-    files = [f for f in os.listdir(project_path) if f.endswith(".csv")]
+    files = [f for f in os.listdir(project_path) if f.endswith(".csv") and not f.startswith(".")]
     return jsonify({"files": files})
 
 @app.route("/api/download_csv", methods=["GET"])
@@ -299,15 +304,22 @@ def download_csv():
 
     project_path = os.path.join("data", project_id)
 
-    if not os.path.exists(os.path.join(project_path, file_name)):
+    file_path = safe_join(project_path, file_name)
+    if not file_path or not os.path.isfile(file_path):
         return jsonify({"error": "File not found"}), 404
 
-    return send_from_directory(project_path, file_name, as_attachment=True)
+    mimetype = "text/csv" if file_name.endswith(".csv") else "application/octet-stream"
+    return Response(
+        stream_file(file_path),
+        mimetype=mimetype,
+        headers={
+            "Content-Disposition": f'attachment; filename="{os.path.basename(file_path)}"',
+            "Content-Length": str(os.path.getsize(file_path)),
+        },
+    )
 
 def generate_embedding(text, model="text-embedding-ada-002"):
-    response = client.embeddings.create(input=text,
-    model=model)
-    return response.data[0].embedding
+    return embed_texts([text], model=model)[0]
 
 @app.route("/api/upload_pdf", methods=["POST"])
 def upload_pdf():
@@ -320,6 +332,12 @@ def upload_pdf():
 
     # Metadata
     project_id = request.form.get("project_id", "default_project")
+    index_type = request.form.get("index_type")  # optional override of the auto ANN tier
+    if index_type and index_type not in INDEX_TYPES:
+        return jsonify({"error": f"index_type must be one of {', '.join(INDEX_TYPES)}"}), 400
+    storage = request.form.get("storage")  # fp32 / fp16 / sq8, defaults to EMBEDDING_STORAGE
+    if storage and storage not in STORAGE_CODECS:
+        return jsonify({"error": f"storage must be one of {', '.join(STORAGE_CODECS)}"}), 400
 
     # Save file
     project_folder = os.path.join(UPLOAD_FOLDER, project_id)
@@ -343,29 +361,45 @@ def upload_pdf():
     embed_dir = os.path.join("dataembedding", project_id)
     os.makedirs(embed_dir, exist_ok=True)
 
-    embeddings_np = np.array(all_embeddings).astype('float32')
-    chunk_names_np = np.array(chunk_names)
+    # the chunk text itself, row-aligned with the vectors; retrieval returns it as context
+    chunk_texts_np = np.array(chunk_texts, dtype=object)
+    np.save(os.path.join(embed_dir, f"{file.filename}_chunks.npy"), chunk_texts_np)
 
-    np.save(os.path.join(embed_dir, f"{file.filename}_embeddings.npy"), embeddings_np)
-    np.save(os.path.join(embed_dir, f"{file.filename}_chunks.npy"), chunk_names_np)
+    # unit-length vectors in an inner-product index (scores are cosine similarities),
+    # stored with the configured codec and optional rerank copy
+    save_file_vectors(embed_dir, file.filename, np.array(all_embeddings), storage=storage)
 
-    index = faiss.IndexFlatL2(embeddings_np.shape[1])
-    index.add(embeddings_np)
-    faiss.write_index(index, os.path.join(embed_dir, f"{file.filename}_faiss.index"))
+    # BM25 postings for the same chunks, so exact terms are searchable without embeddings
+    add_document_chunks(project_id, file.filename, chunk_texts)
+
+    # Consolidated ANN index once the project outgrows per-file flat search; built in the
+    # background, and files it does not cover yet are searched through their own indexes
+    schedule_project_index_update(project_id, index_type=index_type, storage=storage)
 
     # Save to in-memory store if needed
     if project_id not in extracted_data_store:
         extracted_data_store[project_id] = []
     extracted_data_store[project_id].append(structured_data)
     save_data_to_json()
+    upsert_abstracts(project_id, [structured_data], source=file.filename)
 
     return jsonify({
         "message": "File uploaded, processed, and embedded successfully!",
         "data": structured_data,
         "filename": file.filename,
-        "project_id": project_id
+        "project_id": project_id,
+        # the tier in use until the scheduled update finishes, which may change it
+        "current_index_type": current_index_type(project_id),
+        "index_update": "pending"
     })
 
+@app.route("/api/storage_stats/<project_id>", methods=["GET"])
+def storage_stats(project_id):
+    """Reports the on-disk footprint of a project's embeddings and indexes."""
+    if not os.path.isdir(os.path.join("dataembedding", project_id)):
+        return jsonify({"error": "No embeddings found for this project"}), 404
+    return jsonify(project_footprint(project_id))
+
 @app.route('/api/uploads/<project_id>/<filename>')
 def uploaded_file(project_id, filename):
     return send_from_directory(os.path.join(UPLOAD_FOLDER, project_id), filename)
@@ -382,26 +416,6 @@ def list_uploaded_pdfs(project_id):
     ]
     return jsonify(pdfs)
 
-def save_to_csv(data_list, project_id):
-    """Saves extracted data to a CSV file."""
-    folder_path = os.path.join("data", project_id)
-    os.makedirs(folder_path, exist_ok=True)  # Ensure folder exists
-    csv_file = os.path.join(folder_path, f"extracted_data.csv")
-
-    # Open the CSV file in append mode ('a') so that new rows are added without overwriting
-    with open(csv_file, "a", newline="", encoding="utf-8") as file:
-        writer = csv.writer(file)
-
-        # If file is empty (no header written), write the header first
-        if file.tell() == 0:
-            writer.writerow(["Title", "Abstract", "Year", "Publisher", "Authors", "DOI"])
-
-        # Convert list elements to strings if they are lists
-        formatted_data = [str(item) if isinstance(item, list) else item for item in data_list]
-
-        # Write extracted data as a new row
-        writer.writerow(formatted_data)
-
 @app.route("/api/extract_data", methods=["POST"])
 def extract_data():
     data = request.get_json()
@@ -416,19 +430,17 @@ def extract_data():
     if not structured_data_list:
         return jsonify({"error": "No extracted data available in the list"}), 400
 
-    for structured_data in structured_data_list:
-        save_to_csv([
-            structured_data.get("title", "Unknown Title"),
-            structured_data.get("abstract", ""),
-            structured_data.get("year", "Unknown Year"),
-            structured_data.get("publisher", "Unknown Publisher"),
-            structured_data.get("authors", "Unknown Author"),
-            structured_data.get("doi", "N/A"),
-        ], project_id)
+    # Keep the abstracts table in sync for projects ingested before it existed
+    upsert_abstracts(project_id, structured_data_list)
+
+    # Rewrite the export as a de-duplicated snapshot instead of appending to it
+    export = write_export_snapshot(structured_data_list, project_id, with_parquet=bool(data.get("parquet", False)))
 
     return jsonify({
         "message": "Data extracted and saved to CSV successfully!",
         "data": structured_data_list,
+        "rows": export["rows"],
+        "parquet": os.path.basename(export["parquet"]) if export["parquet"] else None,
         "project_id": project_id
     })
 
@@ -467,6 +479,11 @@ def delete_pdf():
 
     try:
         os.remove(file_path)
+        remove_source(project_id, file_name)
+        # drop the file's chunks from retrieval as well: BM25 postings and per-file vectors
+        remove_document(project_id, file_name)
+        remove_file_vectors(os.path.join("dataembedding", project_id), file_name)
+        schedule_project_index_update(project_id)
 
         # Remove document entry from MongoDB
         # result = projects_collection.update_one(
@@ -503,6 +520,40 @@ def generate_ai_report():
 
     return jsonify(report_result)
 
+def _run_report_job(sid, job_id, project_id, research_questions, objective, model):
+    """Background task: forwards each report stage to the requesting client as report_<event>."""
+    try:
+        for event in iter_research_report(project_id, research_questions, objective, model):
+            name = event.pop("event")
+            socketio.emit(f"report_{name}", {"job_id": job_id, **event}, to=sid)
+    except Exception as e:
+        socketio.emit("report_error", {"job_id": job_id, "error": str(e)}, to=sid)
+
+@socketio.on('generate_report')
+def handle_generate_report(data):
+    """
+    Streaming counterpart of /api/generate_report. Acknowledges with report_started,
+    then emits report_rq_retrieved, report_rq_synthesis, report_token, report_done
+    (or report_error) from a background task so no worker is held for the duration.
+    """
+    data = data or {}
+    project_id = data.get("project_id")
+    research_questions = data.get("research_questions", [])
+    objective = data.get("objective", "")
+    model = data.get("model", "gpt-4o")
+
+    if not project_id:
+        emit('report_error', {"error": "Project ID is required"})
+        return
+    if not research_questions or not isinstance(research_questions, list):
+        emit('report_error', {"error": "Valid research questions are required"})
+        return
+
+    job_id = uuid.uuid4().hex
+    emit('report_started', {"job_id": job_id, "n_questions": len(research_questions)})
+    socketio.start_background_task(_run_report_job, request.sid, job_id,
+                                   project_id, research_questions, objective, model)
+
 @app.route("/api/refine_report", methods=["POST"])
 def refine_report():
     data = request.json
@@ -519,48 +570,79 @@ def refine_report():
 
 # Compile the graph
 
+WORKFLOW_RESULT_KEYS = ("objective", "research_questions", "search_string", "fetched_papers",
+                        "filtered_papers", "abstract", "conclusion", "introduction", "timings",
+                        "partial_nodes")
+
+
 @app.route('/api/run_workflow', methods=['POST'])
 def run_workflow():
+    """
+    Runs the workflow synchronously as a checkpointed run. Pass the run_id of
+    a failed run (or of a completed one with partial_nodes) to resume it: only
+    the nodes that did not finish, or finished with partial output, are re-run.
+    """
     data = request.json
     prompt = data.get('prompt', '')
     model = data.get('model', 'gpt-3.5-turbo')
-
-    if not prompt:
+    search_strategy = data.get('search_strategy', 'PICO')
+    run_id = data.get('run_id')
+
+    if run_id:
+        if not claim_for_resume(run_id):
+            run = get_run(run_id)
+            if run is None:
+                return jsonify({"error": "Workflow run not found"}), 404
+            return jsonify({"error": f"Workflow run is {run['status']}", "run_id": run_id}), 409
+    elif not prompt:
         return jsonify({"error": "Prompt is required"}), 400
-
-    # Initialize the state as a dictionary
-    initial_state = {
-        "prompt": prompt,
-        "model": model,
-        "objective": None,
-        "research_questions": [],
-        "search_string": None,
-        "fetched_papers": [],
-        "filtered_papers": [],
-        "abstract": None,
-        "conclusion": None,
-        "introduction": None
-    }
+    else:
+        run_id = start_run(prompt, model, search_strategy)
 
     # Run the workflow
     try:
-        final_state = research_workflow.invoke(initial_state)
+        final_state = execute_run(run_id)
     except Exception as e:
         # Log the error message for debugging
         print(f"Error occurred during workflow: {e}")
-        return jsonify({"error": "Internal server error", "details": str(e)}), 500
+        return jsonify({"error": "Internal server error", "details": str(e), "run_id": run_id}), 500
 
     # Return the results
-    return jsonify({
-        "objective": final_state.get("objective"),
-        "research_questions": final_state.get("research_questions"),
-        "search_string": final_state.get("search_string"),
-        "fetched_papers": final_state.get("fetched_papers"),
-        "filtered_papers": final_state.get("filtered_papers"),
-        "abstract": final_state.get("abstract"),
-        "conclusion": final_state.get("conclusion"),
-        "introduction": final_state.get("introduction")
-    })
+    return jsonify({"run_id": run_id, **{key: final_state.get(key) for key in WORKFLOW_RESULT_KEYS}})
+
+
+@app.route('/api/workflow_runs', methods=['POST'])
+def submit_workflow_run():
+    """Queues a checkpointed workflow run in the background; poll GET /api/workflow_runs/<run_id>."""
+    data = request.json
+    prompt = data.get('prompt', '')
+    if not prompt:
+        return jsonify({"error": "Prompt is required"}), 400
+
+    run_id = start_run(prompt, data.get('model', 'gpt-3.5-turbo'), data.get('search_strategy', 'PICO'))
+    submit_run(run_id)
+    return jsonify({"run_id": run_id, "status": "queued"}), 202
+
+
+@app.route('/api/workflow_runs/<run_id>', methods=['GET'])
+def workflow_run_status(run_id):
+    run = get_run(run_id)
+    if run is None:
+        return jsonify({"error": "Workflow run not found"}), 404
+    # partial results are available as soon as their node has finished
+    state = load_state(run_id)
+    run["result"] = {key: state.get(key) for key in WORKFLOW_RESULT_KEYS if key in state}
+    return jsonify(run)
+
+
+@app.route('/api/workflow_runs/<run_id>/resume', methods=['POST'])
+def resume_workflow_run(run_id):
+    if not resume_run(run_id):
+        run = get_run(run_id)
+        if run is None:
+            return jsonify({"error": "Workflow run not found"}), 404
+        return jsonify({"error": f"Workflow run is {run['status']}", "run_id": run_id}), 409
+    return jsonify({"run_id": run_id, "status": "queued"}), 202
 
 @app.route('/api/generate_objective', methods=['POST'])
 def generate_objective_route():
@@ -667,7 +749,8 @@ def generate_research_questions_and_purpose():
     if not model:
         return jsonify({"error": "Model is required"}), 400
 
-    questions_and_purposes = generate_research_questions_and_purpose_with_gpt(objective, model)
+    regenerate = bool(data.get('regenerate', False))
+    questions_and_purposes = generate_research_questions_and_purpose_with_gpt(objective, model, cache=not regenerate)
     print(questions_and_purposes)
     return jsonify({"research_questions": questions_and_purposes})
 
@@ -716,18 +799,63 @@ def generate_elsevier_gpt4_response(question, papers_info, model):
 def generate_arxiv_gpt4_response(question, papers_info, model):
     return generate_response_gpt4_turbo(question, papers_info, model, "arXiv")
 
-@app.route("/api/rag_chat", methods=["POST"])
-def rag_chat():
-    data = request.json
+def _rag_chat_args(data):
+    """Validates a rag_chat payload; returns (kwargs, error message)."""
     project_id = data.get("project_id")
     query = data.get("query")
+    mode = data.get("mode", "hybrid")
+    min_score = data.get("min_score")
 
     if not project_id or not query:
-        return jsonify({"error": "project_id and query are required"}), 400
+        return None, "project_id and query are required"
+    if mode not in ("hybrid", "vector", "lexical"):
+        return None, "mode must be one of hybrid, vector, lexical"
+    try:
+        min_score = float(min_score) if min_score is not None else None
+    except (TypeError, ValueError):
+        return None, "min_score must be a number"
+    return {"project_id": project_id, "user_query": query, "mode": mode, "min_score": min_score}, None
 
-    result = query_rag_system(project_id, query)
+@app.route("/api/rag_chat", methods=["POST"])
+def rag_chat():
+    args, error = _rag_chat_args(request.json or {})
+    if error:
+        return jsonify({"error": error}), 400
+
+    result = query_rag_system(**args)
     return jsonify(result)
 
+@app.route("/api/rag_chat_stream", methods=["POST"])
+def rag_chat_stream():
+    """Server-sent events: `sources`, then `token` per delta, then `done` with usage stats."""
+    args, error = _rag_chat_args(request.json or {})
+    if error:
+        return jsonify({"error": error}), 400
+
+    def events():
+        try:
+            for event in stream_rag_answer(**args):
+                name = event.pop("event")
+                yield f"event: {name}\ndata: {json.dumps(event)}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+
+    return Response(stream_with_context(events()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@socketio.on('rag_chat')
+def handle_rag_chat(data):
+    """Socket.IO variant: emits rag_sources, rag_token (per delta) and rag_done."""
+    args, error = _rag_chat_args(data or {})
+    if error:
+        emit('rag_error', {"error": error})
+        return
+    try:
+        for event in stream_rag_answer(**args):
+            emit(f"rag_{event.pop('event')}", event)
+    except Exception as e:
+        emit('rag_error', {"error": str(e)})
+
 
 @app.route('/')
 def index():
@@ -795,6 +923,26 @@ def search_papers():
     return jsonify(combined_results)
 
 
+@app.route('/api/estimate_hits', methods=['POST'])
+def estimate_search_hits():
+    """Result counts per data source (and in the project's corpus) without fetching any papers."""
+    data = request.json
+    search_string = data.get('search_string', '')
+    start_year = data.get('start_year', '')
+    if not search_string or not start_year:
+        return jsonify({'error': 'Search string and start year are required.'}), 400
+
+    estimate = estimate_hits(
+        search_string,
+        start_year,
+        data.get('end_year', ''),
+        is_english=data.get('isEnglish', False),
+        sources=data.get('selectedDataSources') or None,
+        project_id=data.get('project_id'),
+    )
+    return jsonify(estimate)
+
+
 @app.route("/api/deep_research", methods=["POST"])
 def deep_research():
     try:
@@ -807,14 +955,12 @@ def deep_research():
         if not objective or not questions:
             return jsonify({"error":"objective and research_questions are required"}), 400
 
-        # Prefer MCP if configured, else fallback
-        try:
-            result = run_deepresearch_fallback(objective, questions, search_string, criteria)
-            print(result)
-        except Exception as ex:
-            # If MCP not available, auto fallback
-            result = run_deepresearch_fallback(objective, questions, search_string, criteria)
-            print(result)
+        # No retry without project_id/search_provider: that would silently turn a
+        # local-corpus run into a web search. Provider errors go to the handler below.
+        result = run_deepresearch_fallback(objective, questions, search_string, criteria,
+                                           project_id=data.get("project_id"),
+                                           search_provider=data.get("search_provider"))
+        print(result)
 
         # Optional: persist in Mongo under the project
         project_id = data.get("project_id")
@@ -0,0 +1,133 @@
+import unittest
+
+from boolean_query import (
+    parse, normalize, to_string, to_scopus, to_arxiv, to_semantic_scholar,
+    drop_unsupported_not, apply_refinement, fit_to_length,
+)
+
+QUERY = '("deep learning" OR CNN) AND (radiology OR "medical imaging") AND NOT review'
+
+
+def ast(text):
+    return normalize(parse(text)[0])
+
+
+class ParserTest(unittest.TestCase):
+    def test_or_binds_tighter_than_and(self):
+        node, warnings = parse("x OR y AND z")
+        self.assertEqual(warnings, [])
+        self.assertEqual(node["type"], "AND")
+        self.assertEqual(node["children"][0]["type"], "OR")
+
+    def test_adjacent_words_are_one_term(self):
+        node, _ = parse("(machine learning OR AI)")
+        self.assertEqual([c["value"] for c in node["children"]], ["machine learning", "AI"])
+
+    def test_recovers_from_llm_slips(self):
+        node, warnings = parse('(x OR y AND "z')
+        self.assertEqual(to_string(node), '("x" OR "y") AND "z"')
+        self.assertIn("unterminated quote closed at end of query", warnings)
+        self.assertIn("missing ')' added", warnings)
+        node, warnings = parse("x OR y) AND")
+        self.assertEqual(to_string(node), '"x" OR "y"')
+        self.assertEqual(warnings, ["unmatched ')' ignored", "dangling AND ignored"])
+
+    def test_field_groups_and_and_not(self):
+        node, _ = parse("TITLE-ABS-KEY(x) AND_NOT y")
+        self.assertEqual(to_string(node), '"x" AND NOT "y"')
+
+    def test_normalize_flattens_and_dedupes(self):
+        node = ast('(x OR (y OR X)) AND (z AND "the")')
+        self.assertEqual(to_string(node), '("x" OR "y") AND "z"')
+
+
+class SerializerTest(unittest.TestCase):
+    def setUp(self):
+        self.node = ast(QUERY)
+
+    def test_to_string(self):
+        self.assertEqual(to_string(self.node),
+                         '("deep learning" OR "CNN") AND ("radiology" OR "medical imaging") AND NOT "review"')
+
+    def test_to_scopus(self):
+        self.assertEqual(to_scopus(self.node, field="TITLE-ABS-KEY"),
+                         'TITLE-ABS-KEY(("deep learning" OR "CNN") AND ("radiology" OR "medical imaging") '
+                         'AND NOT "review")')
+
+    def test_to_arxiv(self):
+        self.assertEqual(to_arxiv(self.node),
+                         '(all:"deep learning" OR all:CNN) AND (all:radiology OR all:"medical imaging") '
+                         'ANDNOT all:review')
+
+    def test_to_arxiv_rejects_unsupported_not(self):
+        for text in ("NOT x", "x AND (NOT y OR z)"):
+            with self.assertRaises(ValueError):
+                to_arxiv(ast(text))
+
+    def test_drop_unsupported_not(self):
+        warnings = []
+        node = drop_unsupported_not(ast("x AND (NOT y OR z) AND NOT w"), warnings)
+        self.assertEqual(to_arxiv(node), "all:x AND all:z ANDNOT all:w")
+        self.assertEqual(len(warnings), 1)
+        self.assertIsNone(drop_unsupported_not(ast("NOT x")))
+
+    def test_to_semantic_scholar(self):
+        self.assertEqual(to_semantic_scholar(self.node), "deep learning radiology")
+        self.assertEqual(to_semantic_scholar(self.node, bulk=True),
+                         '("deep learning" | CNN) + (radiology | "medical imaging") + -review')
+
+
+class RefinementTest(unittest.TestCase):
+    query = '("deep learning" OR CNN) AND radiology'
+
+    def test_add_to_group(self):
+        self.assertEqual(apply_refinement(self.query, "add transformer to group 1"),
+                         '("deep learning" OR "CNN" OR "transformer") AND "radiology"')
+        self.assertEqual(apply_refinement(self.query, 'add "x-ray" as synonyms of radiology'),
+                         '("deep learning" OR "CNN") AND ("radiology" OR "x-ray")')
+
+    def test_require_remove_exclude_merge(self):
+        self.assertEqual(apply_refinement(self.query, "require explainability"),
+                         '("deep learning" OR "CNN") AND "radiology" AND "explainability"')
+        self.assertEqual(apply_refinement(self.query, "remove CNN"), '"deep learning" AND "radiology"')
+        self.assertEqual(apply_refinement(self.query, "exclude review"),
+                         '("deep learning" OR "CNN") AND "radiology" AND NOT "review"')
+        self.assertEqual(apply_refinement(self.query, "merge groups 1 and 2"),
+                         '"deep learning" OR "CNN" OR "radiology"')
+
+    def test_exclude_then_require_keeps_exclusion_last(self):
+        query = apply_refinement('"machine learning" AND healthcare', "exclude review")
+        query = apply_refinement(query, "require explainability")
+        # Scopus applies AND NOT last, so anything after it would be excluded too
+        self.assertEqual(query, '"machine learning" AND "healthcare" AND "explainability" AND NOT "review"')
+        self.assertEqual(to_string(ast(query)), query)
+
+    def test_unnormalised_exclusion_stays_scoped(self):
+        node, _ = parse("x AND NOT y AND z")
+        self.assertEqual(to_string(node), '("x" AND NOT "y") AND "z"')
+        self.assertEqual(to_scopus(node), 'TITLE-ABS(("x" AND NOT "y") AND "z")')
+
+    def test_unknown_feedback_needs_llm(self):
+        self.assertIsNone(apply_refinement(self.query, "make it more specific"))
+        self.assertIsNone(apply_refinement(self.query, "remove transformer"))
+
+
+class FitToLengthTest(unittest.TestCase):
+    def test_drops_synonyms_before_groups(self):
+        node = ast("(alpha OR beta OR gamma) AND (delta OR epsilon) AND zeta")
+        fitted = to_string(fit_to_length(node, 50))
+        self.assertLessEqual(len(fitted), 50)
+        self.assertEqual(fitted, '"alpha" AND ("delta" OR "epsilon") AND "zeta"')
+
+    def test_drops_trailing_groups_last(self):
+        node = ast("(alpha OR beta) AND zeta")
+        self.assertEqual(to_string(fit_to_length(node, 10)), '"alpha"')
+
+    def test_uses_given_serializer(self):
+        node = ast("(alpha OR beta) AND zeta")
+        self.assertEqual(fit_to_length(node, 100, serializer=to_arxiv), node)
+        self.assertEqual(to_arxiv(fit_to_length(node, 25, serializer=to_arxiv)), "all:alpha AND all:zeta")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+import csv
+import os
+import tempfile
+import unittest
+
+from corpus_store import load_abstracts, upsert_abstracts, remove_source
+
+
+def _write_csv(path, rows):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=["Title", "Abstract", "Year", "DOI"])
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+class CsvBackfillTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.base = self.tmp.name
+        os.makedirs(os.path.join(self.base, "p1"))
+        _write_csv(os.path.join(self.base, "p1", "export.csv"), [
+            {"Title": "Old paper", "Abstract": "old abstract", "Year": "2020", "DOI": "10.1/old"},
+            {"Title": "Shared paper", "Abstract": "csv abstract", "Year": "2021", "DOI": "10.1/shared"},
+        ])
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_upload_before_first_read_still_backfills(self):
+        upsert_abstracts("p1", [{"title": "New paper", "abstract": "new abstract", "doi": "10.1/new"},
+                                {"title": "Shared paper", "abstract": "fresh abstract", "doi": "10.1/shared"}],
+                         source="new.xlsx", base_dir=self.base)
+        rows = load_abstracts("p1", columns=("title", "abstract"), base_dir=self.base)
+        by_title = {r["title"]: r["abstract"] for r in rows}
+        self.assertEqual(set(by_title), {"Old paper", "New paper", "Shared paper"})
+        # rows written by an upload are not overwritten by the CSV copy
+        self.assertEqual(by_title["Shared paper"], "fresh abstract")
+
+    def test_backfill_runs_once(self):
+        self.assertEqual(len(load_abstracts("p1", base_dir=self.base)), 2)
+        _write_csv(os.path.join(self.base, "p1", "later.csv"),
+                   [{"Title": "Later", "Abstract": "later abstract", "Year": "2022", "DOI": ""}])
+        self.assertEqual(len(load_abstracts("p1", base_dir=self.base)), 2)
+
+    def test_remove_source(self):
+        upsert_abstracts("p1", [{"title": "A", "abstract": "a"}], source="a.xlsx", base_dir=self.base)
+        self.assertEqual(remove_source("p1", "a.xlsx", base_dir=self.base), 1)
+        titles = {r["title"] for r in load_abstracts("p1", columns=("title",), base_dir=self.base)}
+        self.assertNotIn("A", titles)
+
+
+if __name__ == "__main__":
+    unittest.main()
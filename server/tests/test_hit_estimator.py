@@ -0,0 +1,32 @@
+import unittest
+from unittest import mock
+
+import hit_estimator
+from agents3 import parse_search_string
+
+ROWS = [{"title": f"Deep learning in {y}", "abstract": "radiology", "year": str(y)} for y in range(2018, 2024)]
+
+
+class YearBoundsTest(unittest.TestCase):
+    def count(self, start_year, end_year):
+        with mock.patch.object(hit_estimator, "load_abstracts", return_value=ROWS):
+            return hit_estimator.count_local("p1", parse_search_string("deep learning"), start_year, end_year)
+
+    def test_local_count_is_inclusive(self):
+        self.assertEqual(self.count("2019", "2021")["count"], 3)
+        self.assertEqual(self.count("2020", None)["count"], 1)
+
+    def test_elsevier_query_uses_the_same_years(self):
+        query = hit_estimator.provider_query("Elsevier", "deep learning", "2019", "2021", False)
+        self.assertIn("PUBYEAR > 2018", query)
+        self.assertIn("PUBYEAR < 2022", query)
+        query = hit_estimator.provider_query("Elsevier", "deep learning", "2020", "2020", False)
+        self.assertIn("PUBYEAR = 2020", query)
+
+    def test_arxiv_query_uses_the_same_years(self):
+        query = hit_estimator.provider_query("arXiv", "deep learning", "2019", "2021", False)
+        self.assertIn("submittedDate:[201901010000 TO 202112312359]", query)
+
+
+if __name__ == "__main__":
+    unittest.main()
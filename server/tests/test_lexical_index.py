@@ -0,0 +1,48 @@
+import tempfile
+import unittest
+
+from lexical_index import add_document_chunks, remove_document, search, tokenize, has_lexical_index
+
+
+class LexicalIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.base = self.tmp.name
+        add_document_chunks("p1", "a.pdf", [
+            "Transformer models for clinical text classification",
+            "We fine-tune bert-base on discharge summaries",
+        ], base_dir=self.base)
+        add_document_chunks("p1", "b.pdf", [
+            "Random forests for tabular clinical data",
+        ], base_dir=self.base)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_tokenize_keeps_model_names(self):
+        self.assertEqual(tokenize("The BERT-base and GPT-4o models"), ["bert-base", "gpt-4o", "models"])
+
+    def test_search_ranks_exact_terms(self):
+        hits = search("p1", "bert-base discharge", base_dir=self.base)
+        self.assertEqual(hits[0][:2], ("a.pdf", 1))
+        stems = {stem for stem, _, _ in search("p1", "clinical", base_dir=self.base)}
+        self.assertEqual(stems, {"a.pdf", "b.pdf"})
+
+    def test_reindex_replaces_chunks(self):
+        add_document_chunks("p1", "a.pdf", ["Only gradient boosting now"], base_dir=self.base)
+        self.assertEqual(search("p1", "bert-base", base_dir=self.base), [])
+        self.assertEqual(search("p1", "gradient", base_dir=self.base)[0][:2], ("a.pdf", 0))
+
+    def test_remove_document(self):
+        remove_document("p1", "a.pdf", base_dir=self.base)
+        stems = {stem for stem, _, _ in search("p1", "clinical", base_dir=self.base)}
+        self.assertEqual(stems, {"b.pdf"})
+
+    def test_missing_index(self):
+        self.assertFalse(has_lexical_index("nope", base_dir=self.base))
+        self.assertEqual(search("nope", "clinical", base_dir=self.base), [])
+        remove_document("nope", "a.pdf", base_dir=self.base)  # no-op, no error
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+import threading
+import unittest
+from unittest import mock
+
+import agents3
+
+
+def _paper(i):
+    return {"bib": {"title": f"Paper {i}"}}
+
+
+class FakeScholar:
+    def __init__(self, count, release=None, fail_after=None):
+        self.count, self.release, self.fail_after = count, release, fail_after
+        self.calls = 0
+
+    def search_pubs(self, search_string):
+        self.calls += 1
+        for i in range(self.count):
+            if self.fail_after is not None and i == self.fail_after:
+                raise RuntimeError("blocked by captcha")
+            if i == 1 and self.release is not None:
+                self.release.wait(5)
+            yield _paper(i)
+
+
+class FetchPapersTest(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(agents3, "_scholar_results", {})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def fetch(self, scholar, deadline_s=2):
+        with mock.patch.object(agents3, "setup_proxy", return_value=scholar):
+            return agents3.fetch_papers_with_status("deep learning", min_results=3, deadline_s=deadline_s)
+
+    def test_complete_result_is_cached(self):
+        scholar = FakeScholar(3)
+        papers, complete = self.fetch(scholar)
+        self.assertTrue(complete)
+        self.assertEqual(len(papers), 3)
+        self.assertEqual(self.fetch(scholar), (papers, True))
+        self.assertEqual(scholar.calls, 1)
+
+    def test_deadline_returns_truncated_result(self):
+        release = threading.Event()
+        scholar = FakeScholar(3, release=release)
+        papers, complete = self.fetch(scholar, deadline_s=0.2)
+        self.assertFalse(complete)
+        self.assertEqual([p["title"] for p in papers], ["Paper 0"])
+        release.set()
+        papers, complete = self.fetch(scholar)
+        self.assertTrue(complete)
+        self.assertEqual(len(papers), 3)
+        self.assertEqual(scholar.calls, 1)
+
+    def test_failed_scrape_is_not_cached(self):
+        papers, complete = self.fetch(FakeScholar(3, fail_after=1))
+        self.assertFalse(complete)
+        self.assertEqual(len(papers), 1)
+        self.assertEqual(agents3._scholar_results, {})
+        scholar = FakeScholar(3)
+        self.assertEqual(len(self.fetch(scholar)[0]), 3)
+        self.assertEqual(scholar.calls, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,40 @@
+import unittest
+from unittest import mock
+
+try:
+    import search_providers
+except ImportError as e:
+    search_providers = None
+    IMPORT_ERROR = str(e)
+else:
+    IMPORT_ERROR = ""
+
+
+@unittest.skipIf(search_providers is None, f"search provider dependencies missing: {IMPORT_ERROR}")
+class GetSearchProviderTest(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(search_providers, "TAVILY_API_KEY", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.dict("os.environ", {"DEEP_RESEARCH_SEARCH": "auto"})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        search_providers.os.environ.pop("DEEP_RESEARCH_FIXTURE", None)
+
+    def test_auto_without_any_provider_raises(self):
+        with self.assertRaises(search_providers.ProviderError):
+            search_providers.get_search_provider()
+
+    def test_auto_prefers_local_corpus_without_key(self):
+        provider = search_providers.get_search_provider(project_id="p1")
+        self.assertIsInstance(provider, search_providers.LocalCorpusProvider)
+
+    def test_tavily_without_key_raises(self):
+        with self.assertRaises(search_providers.ProviderError):
+            search_providers.get_search_provider("tavily")
+        with self.assertRaises(search_providers.ProviderError):
+            search_providers.TavilyProvider(api_key=None).search("query")
+
+
+if __name__ == "__main__":
+    unittest.main()
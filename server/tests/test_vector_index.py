@@ -0,0 +1,77 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from vector_index import (covered_rows, current_stems, list_project_files, load_project_index, locate,
+                          remove_file_vectors, save_file_vectors, update_project_index,
+                          PROJECT_INDEX, FILES_MANIFEST)
+
+
+class VectorIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.base = self.tmp.name
+        self.folder = os.path.join(self.base, "p1")
+        os.makedirs(self.folder)
+        rng = np.random.default_rng(0)
+        for stem, n in (("a.pdf", 30), ("b.pdf", 20)):
+            self._add_file(stem, rng.normal(size=(n, 16)).astype("float32"))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _add_file(self, stem, vectors):
+        np.save(os.path.join(self.folder, f"{stem}_chunks.npy"),
+                np.array([f"text {i}" for i in range(len(vectors))], dtype=object))
+        save_file_vectors(self.folder, stem, vectors)
+
+    def test_manifest_tracks_files(self):
+        self.assertEqual(list_project_files(self.folder), [("a.pdf", 30), ("b.pdf", 20)])
+        remove_file_vectors(self.folder, "a.pdf")
+        self.assertEqual(list_project_files(self.folder), [("b.pdf", 20)])
+        self.assertFalse(os.path.exists(os.path.join(self.folder, "a.pdf_chunks.npy")))
+
+    def test_legacy_project_builds_manifest_once(self):
+        os.remove(os.path.join(self.folder, FILES_MANIFEST))
+        self.assertEqual(list_project_files(self.folder), [("a.pdf", 30), ("b.pdf", 20)])
+        self.assertTrue(os.path.exists(os.path.join(self.folder, FILES_MANIFEST)))
+
+    def test_small_project_stays_flat(self):
+        self.assertIsNone(update_project_index("p1", base_dir=self.base))
+        self.assertFalse(os.path.exists(os.path.join(self.folder, PROJECT_INDEX)))
+
+    def test_pinned_index_appends_and_rebuilds_after_removal(self):
+        config = update_project_index("p1", base_dir=self.base, index_type="hnsw")
+        self.assertEqual(config["stems"], [["a.pdf", 0, 30], ["b.pdf", 30, 20]])
+
+        self._add_file("c.pdf", np.ones((5, 16), dtype="float32"))
+        config = update_project_index("p1", base_dir=self.base)
+        self.assertEqual(config["type"], "hnsw")
+        self.assertEqual(config["stems"][-1], ["c.pdf", 50, 5])
+        self.assertEqual(locate(load_project_index("p1", base_dir=self.base), 52), ("c.pdf", 2))
+
+        remove_file_vectors(self.folder, "a.pdf")
+        config = update_project_index("p1", base_dir=self.base)
+        self.assertEqual(config["stems"], [["b.pdf", 0, 20], ["c.pdf", 20, 5]])
+
+    def test_reupload_with_same_chunk_count_is_rebuilt(self):
+        update_project_index("p1", base_dir=self.base, index_type="hnsw")
+        new = np.zeros((20, 16), dtype="float32")
+        new[:, 3] = 1.0
+        self._add_file("b.pdf", new)
+
+        # until the update runs, b.pdf must be served from its own index
+        project_index = load_project_index("p1", base_dir=self.base)
+        self.assertEqual(current_stems(project_index), {"a.pdf"})
+        self.assertEqual(covered_rows(project_index, np.array([[5, 35, -1]])).tolist(), [[5, -1, -1]])
+
+        update_project_index("p1", base_dir=self.base)
+        project_index = load_project_index("p1", base_dir=self.base)
+        self.assertEqual(current_stems(project_index), {"a.pdf", "b.pdf"})
+        np.testing.assert_allclose(project_index["index"].reconstruct(30)[3], 1.0, rtol=1e-5)
+
+
+if __name__ == "__main__":
+    unittest.main()
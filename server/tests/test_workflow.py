@@ -0,0 +1,84 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+# the agents modules build their OpenAI clients at import time
+os.environ.setdefault("OPENAI_API_KEY", "test")
+try:
+    import worlflow
+except ImportError as e:
+    worlflow = None
+    IMPORT_ERROR = str(e)
+else:
+    IMPORT_ERROR = ""
+
+PAPERS = [{"title": "Deep learning for radiology"}, {"title": "A survey of cooking"}]
+
+
+def _relevant(title, search_string, model):
+    return "radiology" in title
+
+
+@unittest.skipIf(worlflow is None, f"workflow dependencies missing: {IMPORT_ERROR}")
+class WorkflowGraphTest(unittest.TestCase):
+    def setUp(self):
+        stubs = {
+            "generate_research_objective_with_gpt": lambda prompt, model: "objective",
+            "generate_research_questions_and_purpose_with_gpt": lambda objective, model: ["RQ1"],
+            "generate_search_string_with_gpt": lambda objective, questions, model, strategy: '"deep learning"',
+            "fetch_papers_with_status": lambda search_string: (list(PAPERS), True),
+            "generate_abstract_with_openai": lambda prompt, model: "abstract",
+            "generate_summary_conclusion": lambda papers: f"conclusion over {len(papers)}",
+            "generate_introduction_summary_with_openai": lambda prompt, model: prompt,
+        }
+        for name, stub in stubs.items():
+            patcher = mock.patch.object(worlflow, name, side_effect=stub)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch("agents4.check_paper_relevance_and_keywords", side_effect=_relevant)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_graph_runs_every_node_once(self):
+        state = worlflow.research_workflow.invoke(worlflow.initial_state("prompt", "model"))
+        self.assertEqual(state["fetched_papers"], PAPERS)
+        # fetch_papers returns one flat list; the filter must keep its shape
+        self.assertEqual(state["filtered_papers"], [PAPERS[0]])
+        self.assertEqual(state["conclusion"], "conclusion over 1")
+        self.assertTrue(state["introduction"].startswith("This document synthesizes 1 papers."))
+        self.assertIn("Findings: abstract", state["introduction"])
+        self.assertEqual(sorted(state["completed_nodes"]), sorted(state["timings"]))
+        self.assertEqual(len(state["completed_nodes"]), 8)
+        worlflow.generate_introduction_summary_with_openai.assert_called_once()
+
+    def test_resume_reruns_partial_fetch_and_its_consumers(self):
+        import workflow_runs
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        for patcher in (mock.patch.object(workflow_runs, "RUNS_PATH", os.path.join(tmp.name, "runs.db")),
+                        mock.patch.object(workflow_runs, "_local", threading.local())):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        worlflow.fetch_papers_with_status.side_effect = [(PAPERS[:1], False), (list(PAPERS), True)]
+
+        run_id = worlflow.start_run("prompt", "model")
+        state = worlflow.execute_run(run_id)
+        self.assertEqual(state["partial_nodes"], ["fetch_papers"])
+        self.assertEqual(workflow_runs.get_run(run_id)["partial_nodes"], ["fetch_papers"])
+
+        self.assertTrue(worlflow.claim_for_resume(run_id))
+        state = worlflow.execute_run(run_id)
+        self.assertEqual(state["fetched_papers"], PAPERS)
+        self.assertEqual(state["partial_nodes"], [])
+        self.assertEqual(workflow_runs.get_run(run_id)["partial_nodes"], [])
+        # the nodes before the fetch and the parallel abstract ran once
+        worlflow.generate_research_objective_with_gpt.assert_called_once()
+        worlflow.generate_abstract_with_openai.assert_called_once()
+        self.assertEqual(worlflow.generate_summary_conclusion.call_count, 2)
+        self.assertEqual(worlflow.generate_introduction_summary_with_openai.call_count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
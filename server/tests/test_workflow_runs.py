@@ -0,0 +1,70 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import workflow_runs
+from workflow_runs import (
+    create_run, set_status, claim_for_resume, save_node_output, load_state, get_run,
+)
+
+
+class WorkflowRunsTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "runs.db")
+        for patcher in (mock.patch.object(workflow_runs, "RUNS_PATH", self.path),
+                        mock.patch.object(workflow_runs, "_local", threading.local())):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.run_id = create_run({"prompt": "p", "model": "m"})
+
+    def tearDown(self):
+        conn = getattr(workflow_runs._local, "conn", None)
+        if conn is not None:
+            conn.close()
+        self.tmp.cleanup()
+
+    def test_rejects_non_serialisable_output(self):
+        with self.assertRaises(TypeError):
+            save_node_output(self.run_id, "fetch_papers", {"fetched_papers": {object()}}, 1.0)
+        self.assertEqual(get_run(self.run_id)["completed_nodes"], [])
+
+    def test_partial_node_is_not_completed(self):
+        save_node_output(self.run_id, "generate_objective", {"objective": "o"}, 1.0)
+        save_node_output(self.run_id, "fetch_papers", {"fetched_papers": [{"title": "t"}]}, 2.0, partial=True)
+        state = load_state(self.run_id)
+        self.assertEqual(state["completed_nodes"], ["generate_objective"])
+        self.assertEqual(state["partial_nodes"], ["fetch_papers"])
+        self.assertEqual(state["fetched_papers"], [{"title": "t"}])
+        self.assertEqual(get_run(self.run_id)["partial_nodes"], ["fetch_papers"])
+
+    def test_completed_run_is_resumable_only_with_partial_nodes(self):
+        save_node_output(self.run_id, "generate_objective", {"objective": "o"}, 1.0)
+        set_status(self.run_id, "completed")
+        self.assertFalse(claim_for_resume(self.run_id))
+        save_node_output(self.run_id, "fetch_papers", {"fetched_papers": []}, 2.0, partial=True)
+        self.assertTrue(claim_for_resume(self.run_id))
+        self.assertEqual(get_run(self.run_id)["status"], "queued")
+
+    def test_adds_partial_column_to_existing_store(self):
+        legacy = os.path.join(self.tmp.name, "legacy.db")
+        conn = sqlite3.connect(legacy)
+        conn.executescript("""
+            CREATE TABLE run_nodes (run_id TEXT NOT NULL, node TEXT NOT NULL, output TEXT NOT NULL,
+                                    seconds REAL NOT NULL, finished REAL NOT NULL, PRIMARY KEY (run_id, node));
+            INSERT INTO run_nodes VALUES ('r1', 'generate_objective', '{"objective": "o"}', 1.0, 0.0);
+        """)
+        conn.close()
+        with mock.patch.object(workflow_runs, "RUNS_PATH", legacy), \
+                mock.patch.object(workflow_runs, "_local", threading.local()):
+            conn = workflow_runs._connect()
+            self.assertEqual(workflow_runs._node_rows(conn, "r1"),
+                             [("generate_objective", '{"objective": "o"}', 1.0, 0)])
+            conn.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
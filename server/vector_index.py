@@ -0,0 +1,457 @@
+# vector_index.py
+import os
+import json
+import hashlib
+import glob
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+import faiss
+
+from retrieval_utils import normalize_rows
+
+# Corpus-size tiers (number of stored chunk vectors)
+FLAT_MAX_VECTORS = 20_000       # exact search is fast enough below this
+IVF_FLAT_MAX_VECTORS = 200_000  # beyond this IVF-Flat memory/scan cost grows, switch to PQ codes
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+
+PROJECT_INDEX = "project_faiss.index"
+PROJECT_CONFIG = "project_faiss.json"
+FILES_MANIFEST = "project_files.json"  # {stem: n_chunks} of every file with an index
+FILE_VERSIONS = "project_file_versions.json"  # {stem: hash of its vectors}, rewritten on every upload
+
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 80
+HNSW_EF_SEARCH = 64
+TRAIN_POINTS_PER_LIST = 64      # faiss wants >= 39 training points per IVF list
+RETRAIN_GROWTH = 4              # retrain once the corpus is 4x what the quantizer saw
+
+# How vectors are stored inside per-file and IVF indexes (bytes per dimension: 4 / 2 / 1).
+# PQ codes are used by the ivf_pq tier; a single paper has too few chunks to train them.
+STORAGE_CODECS = {"fp32": "Flat", "fp16": "SQfp16", "sq8": "SQ8"}
+# Copy of the vectors kept in <stem>_embeddings.npy for MMR/reranking and index rebuilds.
+# "none" drops it; vectors are then decoded from the index when needed.
+RERANK_COPIES = {"fp32": "float32", "fp16": "float16", "none": None}
+
+
+def storage_settings(storage: Optional[str] = None, rerank_copy: Optional[str] = None) -> Tuple[str, str]:
+    """Resolves the vector codec and rerank copy, defaulting to EMBEDDING_STORAGE / EMBEDDING_RERANK_COPY."""
+    storage = (storage or os.getenv("EMBEDDING_STORAGE", "fp32")).strip().lower()
+    rerank_copy = (rerank_copy or os.getenv("EMBEDDING_RERANK_COPY", "fp32")).strip().lower()
+    if storage not in STORAGE_CODECS:
+        storage = "fp32"
+    if rerank_copy not in RERANK_COPIES:
+        rerank_copy = "fp32"
+    return storage, rerank_copy
+
+
+def choose_index_type(n_vectors: int) -> str:
+    """Auto tier by corpus size; FAISS_INDEX_TYPE overrides it (e.g. 'hnsw')."""
+    forced = os.getenv("FAISS_INDEX_TYPE", "").strip().lower()
+    if forced in INDEX_TYPES:
+        return forced
+    if n_vectors <= FLAT_MAX_VECTORS:
+        return "flat"
+    if n_vectors <= IVF_FLAT_MAX_VECTORS:
+        return "ivf_flat"
+    return "ivf_pq"
+
+
+def _pq_subquantizers(dim: int, target: int = 64) -> int:
+    # PQ needs m to divide the dimension; take the largest divisor <= target
+    for m in range(min(target, dim), 0, -1):
+        if dim % m == 0:
+            return m
+    return 1
+
+
+def build_config(n_vectors: int, dim: int, index_type: Optional[str] = None,
+                 metric: str = "ip", storage: str = "fp32") -> Dict[str, Any]:
+    index_type = index_type or choose_index_type(n_vectors)
+    if index_type == "ivf_pq" and n_vectors < 39 * 256:
+        index_type = "ivf_flat"  # too few points to train 8-bit PQ codebooks
+    config: Dict[str, Any] = {"type": index_type, "dim": dim, "metric": metric,
+                              "storage": storage, "n_vectors": n_vectors, "params": {}}
+    if index_type == "flat":
+        config["factory"] = STORAGE_CODECS[storage]
+    elif index_type == "hnsw":
+        config["factory"] = f"HNSW{HNSW_M}"
+        config["params"] = {"efSearch": HNSW_EF_SEARCH}
+    else:
+        nlist = int(min(65536, max(16, 4 * math.sqrt(max(n_vectors, 1)))))
+        nlist = max(1, min(nlist, n_vectors // 39))
+        config["nlist"] = nlist
+        config["params"] = {"nprobe": min(nlist, max(8, nlist // 32))}
+        if index_type == "ivf_flat":
+            config["factory"] = f"IVF{nlist},{STORAGE_CODECS[storage]}"
+        else:
+            m = _pq_subquantizers(dim)
+            config["pq_m"] = m
+            config["factory"] = f"IVF{nlist},PQ{m}x8"
+    return config
+
+
+def _faiss_metric(metric: str) -> int:
+    return faiss.METRIC_INNER_PRODUCT if metric == "ip" else faiss.METRIC_L2
+
+
+def apply_search_params(index, config: Dict[str, Any]) -> None:
+    ps = faiss.ParameterSpace()
+    for name, value in (config.get("params") or {}).items():
+        ps.set_index_parameter(index, name, value)
+
+
+def build_index(vectors: np.ndarray, index_type: Optional[str] = None,
+                metric: str = "ip", seed: int = 1234, storage: str = "fp32") -> Tuple[Any, Dict[str, Any]]:
+    """
+    Builds a FAISS index of the requested (or auto-chosen) tier over `vectors`
+    (expected L2-normalised for the default inner-product metric).
+    IVF quantizers are trained on a random sample of at most
+    TRAIN_POINTS_PER_LIST * nlist vectors. Returns (index, build_config).
+    """
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    n, dim = vectors.shape
+    config = build_config(n, dim, index_type, metric, storage)
+    index = faiss.index_factory(dim, config["factory"], _faiss_metric(metric))
+    if config["type"] == "hnsw":
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    if not index.is_trained:
+        n_train = min(n, TRAIN_POINTS_PER_LIST * config.get("nlist", n))
+        rng = np.random.default_rng(seed)
+        sample = vectors[rng.choice(n, n_train, replace=False)] if n_train < n else vectors
+        index.train(sample)
+        config["trained_on"] = int(n_train)
+    index.add(vectors)
+    apply_search_params(index, config)
+    return index, config
+
+
+_locks: Dict[str, threading.RLock] = {}
+_locks_guard = threading.Lock()
+
+
+def project_lock(folder: str) -> threading.RLock:
+    """Serialises writes to one project's manifest and consolidated index."""
+    key = os.path.abspath(folder)
+    with _locks_guard:
+        return _locks.setdefault(key, threading.RLock())
+
+
+def read_index_with_config(index_path: str, config_path: str) -> Tuple[Any, Dict[str, Any]]:
+    index = faiss.read_index(index_path)
+    config = {}
+    if os.path.exists(config_path):
+        with open(config_path, "r", encoding="utf-8") as f:
+            config = json.load(f)
+        apply_search_params(index, config)
+    return index, config
+
+
+def _write_index_with_config(index, config: Dict[str, Any], index_path: str, config_path: str) -> None:
+    # write to temp names first so loaders never pair a new index with an old config
+    faiss.write_index(index, index_path + ".tmp")
+    with open(config_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(config, f, indent=2)
+    os.replace(index_path + ".tmp", index_path)
+    os.replace(config_path + ".tmp", config_path)
+
+
+def _read_manifest(folder: str) -> Optional[Dict[str, int]]:
+    path = os.path.join(folder, FILES_MANIFEST)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_manifest(folder: str, manifest: Dict[str, Any], name: str = FILES_MANIFEST) -> None:
+    path = os.path.join(folder, name)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def file_versions(folder: str) -> Dict[str, str]:
+    """{stem: version} of the uploaded vectors; files from before versions were recorded are absent."""
+    path = os.path.join(folder, FILE_VERSIONS)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _load_manifest(folder: str) -> Dict[str, int]:
+    """The files manifest; projects from before it existed count their chunk arrays once."""
+    with project_lock(folder):
+        manifest = _read_manifest(folder)
+        if manifest is None:
+            manifest = {}
+            for chunk_file in glob.glob(os.path.join(folder, "*_chunks.npy")):
+                stem = os.path.basename(chunk_file)[:-len("_chunks.npy")]
+                if os.path.exists(os.path.join(folder, f"{stem}_faiss.index")):
+                    manifest[stem] = len(np.load(chunk_file, allow_pickle=True))
+            if manifest:
+                _write_manifest(folder, manifest)
+        return manifest
+
+
+def save_file_vectors(embed_dir: str, stem: str, vectors: np.ndarray,
+                      storage: Optional[str] = None, rerank_copy: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Writes one uploaded file's <stem>_faiss.index (inner product, `storage` codec)
+    and, unless rerank_copy is "none", its <stem>_embeddings.npy copy.
+    Returns {"storage", "rerank_copy", "bytes"}.
+    """
+    storage, rerank_copy = storage_settings(storage, rerank_copy)
+    vectors = normalize_rows(vectors)
+    index = faiss.index_factory(vectors.shape[1], STORAGE_CODECS[storage], faiss.METRIC_INNER_PRODUCT)
+    if not index.is_trained:
+        index.train(vectors)  # SQ8 only learns per-dimension ranges
+    index.add(vectors)
+    idx_path = os.path.join(embed_dir, f"{stem}_faiss.index")
+    faiss.write_index(index, idx_path)
+
+    emb_path = os.path.join(embed_dir, f"{stem}_embeddings.npy")
+    dtype = RERANK_COPIES[rerank_copy]
+    if dtype:
+        np.save(emb_path, vectors.astype(dtype))
+    elif os.path.exists(emb_path):
+        os.remove(emb_path)  # a re-upload must not leave a stale copy behind
+    size = os.path.getsize(idx_path) + (os.path.getsize(emb_path) if dtype else 0)
+    with project_lock(embed_dir):
+        manifest = _load_manifest(embed_dir)
+        manifest[stem] = int(vectors.shape[0])
+        _write_manifest(embed_dir, manifest)
+        # a re-upload under the same name gets a new version, so the project index rebuilds it
+        versions = file_versions(embed_dir)
+        versions[stem] = hashlib.sha1(np.ascontiguousarray(vectors).tobytes()).hexdigest()
+        _write_manifest(embed_dir, versions, FILE_VERSIONS)
+    return {"storage": storage, "rerank_copy": rerank_copy, "bytes": size}
+
+
+def remove_file_vectors(embed_dir: str, stem: str) -> None:
+    """Deletes one file's chunk array, index and vector copy; the project index drops it on its next update."""
+    with project_lock(embed_dir):
+        manifest = _load_manifest(embed_dir)
+        if manifest.pop(stem, None) is not None:
+            _write_manifest(embed_dir, manifest)
+        versions = file_versions(embed_dir)
+        if versions.pop(stem, None) is not None:
+            _write_manifest(embed_dir, versions, FILE_VERSIONS)
+        for suffix in ("_chunks.npy", "_faiss.index", "_embeddings.npy"):
+            path = os.path.join(embed_dir, f"{stem}{suffix}")
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def load_chunk_vectors(folder: str, stem: str, mmap: bool = False) -> Optional[np.ndarray]:
+    """
+    A file's chunk vectors: the stored copy when there is one (float16 copies are
+    returned as stored when mmap=True), otherwise decoded from its FAISS index.
+    """
+    emb_path = os.path.join(folder, f"{stem}_embeddings.npy")
+    if os.path.exists(emb_path):
+        emb = np.load(emb_path, mmap_mode="r" if mmap else None)
+        return emb if mmap else emb.astype("float32")
+    idx_path = os.path.join(folder, f"{stem}_faiss.index")
+    if not os.path.exists(idx_path):
+        return None
+    index = faiss.read_index(idx_path)
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def list_project_files(folder: str) -> List[Tuple[str, int]]:
+    """(stem, n_chunks) for every uploaded file with an index, in a stable order. Reads no vectors."""
+    return sorted((stem, n) for stem, n in _load_manifest(folder).items()
+                  if os.path.exists(os.path.join(folder, f"{stem}_faiss.index")))
+
+
+def update_project_index(project_id: str, base_dir: str = "dataembedding",
+                         index_type: Optional[str] = None, storage: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Keeps dataembedding/<project_id>/project_faiss.index in step with the per-file
+    embeddings. Small corpora stay on the per-file flat indexes (no project index).
+    Once the corpus crosses FLAT_MAX_VECTORS a consolidated ANN index is built;
+    new files are appended to it until the corpus outgrows its training sample
+    (RETRAIN_GROWTH), the tier changes or an indexed file was re-uploaded
+    (its recorded version differs), which triggers a rebuild.
+    Returns the persisted build config, or None when no project index is used.
+    Updates of one project are serialised; uploads should normally go through
+    schedule_project_index_update so a rebuild does not block the request.
+    """
+    folder = os.path.join(base_dir, project_id)
+    with project_lock(folder):
+        return _update_project_index(folder, index_type, storage)
+
+
+def _update_project_index(folder: str, index_type: Optional[str], storage: Optional[str]) -> Optional[Dict[str, Any]]:
+    index_path = os.path.join(folder, PROJECT_INDEX)
+    config_path = os.path.join(folder, PROJECT_CONFIG)
+    files = list_project_files(folder)
+    sizes = dict(files)
+    versions = file_versions(folder)
+    n_total = sum(sizes.values())
+    storage, _ = storage_settings(storage)
+
+    previous: Dict[str, Any] = {}
+    if os.path.exists(config_path):
+        with open(config_path, "r", encoding="utf-8") as f:
+            previous = json.load(f)
+    if index_type is None and previous.get("pinned"):
+        index_type = previous["type"]  # an explicit choice sticks across uploads
+    wanted = index_type or choose_index_type(n_total)
+
+    if wanted == "flat" or not n_total:
+        for path in (index_path, config_path):
+            if os.path.exists(path):
+                os.remove(path)
+        return None
+
+    config: Dict[str, Any] = {}
+    if os.path.exists(index_path) and os.path.exists(config_path):
+        index, config = read_index_with_config(index_path, config_path)
+        indexed = {stem for stem, _, _ in config.get("stems", [])}
+        same_files = indexed <= set(sizes) and all(
+            sizes[stem] == n and config.get("versions", {}).get(stem) == versions.get(stem)
+            for stem, _, n in config.get("stems", []))
+        fresh = n_total <= RETRAIN_GROWTH * max(config.get("trained_on", n_total), 1)
+        same_build = (config.get("type") == wanted and config.get("metric") == "ip"
+                      and config.get("storage", "fp32") == storage)
+        if same_build and same_files and fresh:
+            new = [stem for stem, _ in files if stem not in indexed]
+            if not new:
+                return config
+            start = index.ntotal
+            for stem in new:
+                vecs = normalize_rows(load_chunk_vectors(folder, stem))
+                index.add(vecs)
+                config["stems"].append([stem, start, int(vecs.shape[0])])
+                config["versions"][stem] = versions.get(stem)
+                start += vecs.shape[0]
+            config["n_vectors"] = int(index.ntotal)
+            _write_index_with_config(index, config, index_path, config_path)
+            return config
+
+    # (re)build from scratch
+    stems, blocks, start = [], [], 0
+    for stem, _ in files:
+        vecs = normalize_rows(load_chunk_vectors(folder, stem))  # legacy files were stored unnormalised
+        blocks.append(vecs)
+        stems.append([stem, start, int(vecs.shape[0])])
+        start += vecs.shape[0]
+    index, config = build_index(np.vstack(blocks), wanted, metric="ip", storage=storage)
+    config["stems"] = stems
+    config["versions"] = {stem: versions.get(stem) for stem, _, _ in stems}
+    config["pinned"] = index_type is not None
+    _write_index_with_config(index, config, index_path, config_path)
+    return config
+
+
+_index_worker = ThreadPoolExecutor(max_workers=2, thread_name_prefix="project-index")
+_pending: Dict[Tuple[str, str], Dict[str, Any]] = {}
+_pending_lock = threading.Lock()
+
+
+def schedule_project_index_update(project_id: str, base_dir: str = "dataembedding",
+                                  index_type: Optional[str] = None, storage: Optional[str] = None) -> None:
+    """
+    Runs update_project_index in the background. Requests for a project that
+    already has an update queued are folded into it (it lists the files when
+    it runs); an explicit index_type is kept over a later default.
+    """
+    key = (base_dir, project_id)
+    with _pending_lock:
+        queued = _pending.get(key)
+        _pending[key] = {"index_type": index_type or (queued or {}).get("index_type"),
+                         "storage": storage or (queued or {}).get("storage")}
+    if queued is None:
+        _index_worker.submit(_run_pending_update, key)
+
+
+def _run_pending_update(key: Tuple[str, str]) -> None:
+    with _pending_lock:
+        kwargs = _pending.pop(key)
+    base_dir, project_id = key
+    try:
+        config = update_project_index(project_id, base_dir=base_dir, **kwargs)
+        print(f"Project index for {project_id}: {config['type'] if config else 'flat'}")
+    except Exception as e:
+        print(f"❌ Project index update failed for {project_id}: {e}")
+
+
+def current_index_type(project_id: str, base_dir: str = "dataembedding") -> str:
+    config_path = os.path.join(base_dir, project_id, PROJECT_CONFIG)
+    if not os.path.exists(config_path):
+        return "flat"
+    with open(config_path, "r", encoding="utf-8") as f:
+        return json.load(f).get("type", "flat")
+
+
+def load_project_index(project_id: str, base_dir: str = "dataembedding") -> Optional[Dict[str, Any]]:
+    """
+    Returns {"index", "config", "starts", "stems", "current"} for the
+    consolidated index, or None when the project is small enough to use
+    per-file flat indexes. current[i] is False when stems[i] was re-uploaded
+    or deleted since the index was built; search those files' own indexes
+    instead (see covered_rows).
+    """
+    folder = os.path.join(base_dir, project_id)
+    index_path = os.path.join(folder, PROJECT_INDEX)
+    config_path = os.path.join(folder, PROJECT_CONFIG)
+    if not (os.path.exists(index_path) and os.path.exists(config_path)):
+        return None
+    index, config = read_index_with_config(index_path, config_path)
+    stems = config.get("stems", [])
+    indexed_versions = config.get("versions", {})
+    versions = file_versions(folder)
+    sizes = dict(list_project_files(folder))
+    return {
+        "index": index,
+        "config": config,
+        "starts": np.array([s[1] for s in stems], dtype="int64"),
+        "stems": [s[0] for s in stems],
+        "current": np.array([sizes.get(s[0]) == s[2] and indexed_versions.get(s[0]) == versions.get(s[0])
+                             for s in stems], dtype=bool),
+    }
+
+
+def current_stems(project_index: Dict[str, Any]) -> set:
+    """Stems whose vectors in the consolidated index match the file on disk."""
+    return {stem for stem, ok in zip(project_index["stems"], project_index["current"]) if ok}
+
+
+def covered_rows(project_index: Dict[str, Any], rows: np.ndarray) -> np.ndarray:
+    """Copy of search rows with hits on stale files replaced by -1 (padding)."""
+    rows = np.array(rows, copy=True)
+    hit = rows >= 0
+    pos = np.searchsorted(project_index["starts"], rows[hit], side="right") - 1
+    rows[hit] = np.where(project_index["current"][pos], rows[hit], -1)
+    return rows
+
+
+def locate(project_index: Dict[str, Any], row: int) -> Tuple[str, int]:
+    """Maps a row of the consolidated index back to (stem, chunk position)."""
+    pos = int(np.searchsorted(project_index["starts"], row, side="right")) - 1
+    return project_index["stems"][pos], int(row - project_index["starts"][pos])
+
+
+def project_footprint(project_id: str, base_dir: str = "dataembedding") -> Dict[str, Any]:
+    """On-disk bytes of a project's vector data, split by kind, plus bytes per chunk vector."""
+    folder = os.path.join(base_dir, project_id)
+    kinds = {"embeddings": "*_embeddings.npy", "file_indexes": "*_faiss.index",
+             "chunks": "*_chunks.npy", "lexical": "bm25.db*"}
+    footprint = {kind: sum(os.path.getsize(p) for p in glob.glob(os.path.join(folder, pattern)))
+                 for kind, pattern in kinds.items()}
+    project_index = os.path.join(folder, PROJECT_INDEX)
+    footprint["project_index"] = os.path.getsize(project_index) if os.path.exists(project_index) else 0
+    footprint["file_indexes"] -= footprint["project_index"]  # the glob above also matched it
+    n_vectors = sum(n for _, n in list_project_files(folder))
+    footprint["total"] = sum(footprint.values())
+    footprint["n_vectors"] = n_vectors
+    footprint["bytes_per_vector"] = (
+        (footprint["embeddings"] + footprint["file_indexes"] + footprint["project_index"]) / n_vectors
+        if n_vectors else 0.0)
+    return footprint
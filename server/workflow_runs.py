@@ -0,0 +1,162 @@
+# workflow_runs.py
+"""
+Checkpoint store for research workflow runs.
+
+A run is its inputs plus one row per finished node holding that node's
+output. Rows are written the moment a node returns, so when a later node
+fails (or the server restarts) the paid LLM steps before it are kept and a
+resumed run only executes the nodes that have no row yet. A node whose
+output is incomplete (e.g. a paper fetch cut off by its deadline) is saved
+with partial=1 and is executed again on resume.
+"""
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional
+
+RUNS_PATH = os.getenv("WORKFLOW_RUNS_PATH", os.path.join("data", ".workflow_runs", "runs.db"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id  TEXT PRIMARY KEY,
+    status  TEXT NOT NULL,
+    inputs  TEXT NOT NULL,
+    error   TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS run_nodes (
+    run_id   TEXT NOT NULL,
+    node     TEXT NOT NULL,
+    output   TEXT NOT NULL,
+    seconds  REAL NOT NULL,
+    finished REAL NOT NULL,
+    partial  INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (run_id, node)
+);
+"""
+
+_local = threading.local()
+
+
+def _connect() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(RUNS_PATH) or ".", exist_ok=True)
+        conn = sqlite3.connect(RUNS_PATH, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(run_nodes)")}
+        if "partial" not in columns:
+            # stores created before partial outputs were tracked
+            conn.execute("ALTER TABLE run_nodes ADD COLUMN partial INTEGER NOT NULL DEFAULT 0")
+        _local.conn = conn
+    return conn
+
+
+def create_run(inputs: Dict[str, Any]) -> str:
+    run_id = uuid.uuid4().hex
+    now = time.time()
+    conn = _connect()
+    with conn:
+        conn.execute("INSERT INTO runs (run_id, status, inputs, created, updated) VALUES (?, 'queued', ?, ?, ?)",
+                     (run_id, json.dumps(inputs), now, now))
+    return run_id
+
+
+def set_status(run_id: str, status: str, error: Optional[str] = None) -> None:
+    conn = _connect()
+    with conn:
+        conn.execute("UPDATE runs SET status = ?, error = ?, updated = ? WHERE run_id = ?",
+                     (status, error, time.time(), run_id))
+
+
+def claim_for_resume(run_id: str) -> bool:
+    """
+    Moves a failed or interrupted run, or a completed one with a partial node,
+    back to queued; False if it is not resumable.
+    """
+    conn = _connect()
+    with conn:
+        cur = conn.execute(
+            "UPDATE runs SET status = 'queued', error = NULL, updated = ? "
+            "WHERE run_id = ? AND (status IN ('failed', 'interrupted') OR (status = 'completed' AND EXISTS "
+            "(SELECT 1 FROM run_nodes WHERE run_nodes.run_id = runs.run_id AND partial = 1)))",
+            (time.time(), run_id))
+    return cur.rowcount == 1
+
+
+def mark_interrupted() -> int:
+    """Runs left queued/running by a previous process can no longer finish on their own."""
+    conn = _connect()
+    with conn:
+        cur = conn.execute(
+            "UPDATE runs SET status = 'interrupted', updated = ? WHERE status IN ('queued', 'running')",
+            (time.time(),))
+    if cur.rowcount:
+        print(f"⚠️ {cur.rowcount} workflow run(s) were interrupted by a restart and can be resumed")
+    return cur.rowcount
+
+
+def save_node_output(run_id: str, node: str, output: Dict[str, Any], seconds: float,
+                     partial: bool = False) -> None:
+    """
+    Raises TypeError when the output is not JSON-serialisable: a resumed run
+    would otherwise get back strings where the node returned other objects.
+    """
+    try:
+        payload = json.dumps(output)
+    except (TypeError, ValueError) as e:
+        raise TypeError(f"Output of workflow node '{node}' cannot be checkpointed: {e}") from e
+    conn = _connect()
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO run_nodes (run_id, node, output, seconds, finished, partial) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (run_id, node, payload, seconds, time.time(), int(partial)))
+        conn.execute("UPDATE runs SET updated = ? WHERE run_id = ?", (time.time(), run_id))
+
+
+def _node_rows(conn: sqlite3.Connection, run_id: str) -> List[tuple]:
+    return conn.execute("SELECT node, output, seconds, partial FROM run_nodes WHERE run_id = ? ORDER BY finished",
+                        (run_id,)).fetchall()
+
+
+def load_state(run_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Inputs merged with every checkpointed node output, plus timings,
+    completed_nodes and partial_nodes; a partial node is not in completed_nodes.
+    """
+    conn = _connect()
+    row = conn.execute("SELECT inputs FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+    if row is None:
+        return None
+    state = {**json.loads(row[0]), "run_id": run_id, "timings": {}, "completed_nodes": [], "partial_nodes": []}
+    for node, output, seconds, partial in _node_rows(conn, run_id):
+        state.update(json.loads(output))
+        state["timings"][node] = seconds
+        state["partial_nodes" if partial else "completed_nodes"].append(node)
+    return state
+
+
+def get_run(run_id: str) -> Optional[Dict[str, Any]]:
+    conn = _connect()
+    row = conn.execute("SELECT status, error, created, updated FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+    if row is None:
+        return None
+    status, error, created, updated = row
+    nodes = _node_rows(conn, run_id)
+    return {
+        "run_id": run_id,
+        "status": status,
+        "error": error,
+        "created": created,
+        "updated": updated,
+        "completed_nodes": [n for n, _, _, p in nodes if not p],
+        "partial_nodes": [n for n, _, _, p in nodes if p],
+        "timings": {n: s for n, _, s, _ in nodes},
+    }
@@ -1,5 +1,9 @@
-from langgraph.graph import StateGraph
-from typing import Dict, List, TypedDict
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+from langgraph.graph import StateGraph, END
+from typing import Annotated, Dict, List, TypedDict
 from agents import (
     generate_research_questions_and_purpose_with_gpt,
     generate_abstract_with_openai,
@@ -8,14 +12,27 @@ from agents import (
     generate_research_objective_with_gpt
 )
 from agents2 import generate_search_string_with_gpt
-from agents3 import fetch_papers
+from agents3 import fetch_papers_with_status
 from agents4 import filter_papers_with_gpt_turbo
+from workflow_runs import create_run, set_status, claim_for_resume, load_state, save_node_output
+
+
+def merge_timings(left: Dict[str, float], right: Dict[str, float]) -> Dict[str, float]:
+    """Reducer for node timings: parallel branches each add their own key."""
+    return {**(left or {}), **(right or {})}
+
+
+def merge_completed(left: List[str], right: List[str]) -> List[str]:
+    left = left or []
+    return left + [n for n in (right or []) if n not in left]
 
 
 # Use TypedDict to define the structure of the state
 class ResearchState(TypedDict):
+    run_id: str
     prompt: str
     model: str
+    search_strategy: str
     objective: str
     research_questions: List[str]
     search_string: str
@@ -24,44 +41,86 @@ class ResearchState(TypedDict):
     abstract: str
     conclusion: str
     introduction: str
+    timings: Annotated[Dict[str, float], merge_timings]
+    completed_nodes: Annotated[List[str], merge_completed]
+    partial_nodes: Annotated[List[str], merge_completed]
+
+
+def timed(name):
+    """
+    Records the node's wall-clock seconds under state["timings"][name] and,
+    for a checkpointed run, saves its output as soon as it returns. A node
+    already in completed_nodes (a resumed run) is skipped; its output is in
+    the state loaded from the checkpoint. A node that lists itself in
+    partial_nodes is checkpointed as partial and runs again on resume.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(state: ResearchState) -> dict:
+            if name in (state.get("completed_nodes") or []):
+                return {}
+            t0 = time.perf_counter()
+            update = fn(state)
+            partial = name in (update.pop("partial_nodes", None) or [])
+            elapsed = round(time.perf_counter() - t0, 3)
+            print(f"⏱️ {name}: {elapsed}s")
+            if state.get("run_id"):
+                save_node_output(state["run_id"], name, update, elapsed, partial=partial)
+            update = {**update, "timings": {name: elapsed}, "completed_nodes": [name]}
+            return {**update, "partial_nodes": [name]} if partial else update
+        return wrapper
+    return decorator
 
-# Define steps (returning dictionaries)
-def generate_objective(state: ResearchState) -> ResearchState:
+
+# Define steps. Each returns only the keys it writes, so nodes on parallel
+# branches never overwrite each other's results when LangGraph merges them.
+@timed("generate_objective")
+def generate_objective(state: ResearchState) -> dict:
     objective = generate_research_objective_with_gpt(state["prompt"], state["model"])
     print(f"objective: {objective}")
-    return {**state, "objective": objective}
+    return {"objective": objective}
 
-def generate_questions(state: ResearchState) -> ResearchState:
-    research_questions = generate_research_questions_and_purpose_with_gpt(state["objective"], 3, state["model"])
+@timed("generate_questions")
+def generate_questions(state: ResearchState) -> dict:
+    research_questions = generate_research_questions_and_purpose_with_gpt(state["objective"], state["model"])
     print(f"questions: {research_questions}")
-    return {**state, "research_questions": research_questions}
+    return {"research_questions": research_questions}
 
-def generate_search_string(state: ResearchState) -> ResearchState:
-    search_string = generate_search_string_with_gpt(state["objective"], state["research_questions"], state["model"])
+@timed("generate_search_string")
+def generate_search_string(state: ResearchState) -> dict:
+    search_string = generate_search_string_with_gpt(state["objective"], state["research_questions"], state["model"],
+                                                    state.get("search_strategy") or "PICO")
     print(f"search string: {search_string}")
-    return {**state, "search_string": search_string}
+    return {"search_string": search_string}
 
-def fetch_papers_step(state: ResearchState) -> ResearchState:
-    fetched_papers = fetch_papers(state["search_string"])
-    return {**state, "fetched_papers": fetched_papers}
+@timed("fetch_papers")
+def fetch_papers_step(state: ResearchState) -> dict:
+    fetched_papers, complete = fetch_papers_with_status(state["search_string"])
+    if not complete:
+        return {"fetched_papers": fetched_papers, "partial_nodes": ["fetch_papers"]}
+    return {"fetched_papers": fetched_papers}
 
-def filter_papers_step(state: ResearchState) -> ResearchState:
+@timed("filter_papers")
+def filter_papers_step(state: ResearchState) -> dict:
     filtered_papers = filter_papers_with_gpt_turbo(state["search_string"], state["fetched_papers"], state["model"])
-    return {**state, "filtered_papers": filtered_papers}
+    return {"filtered_papers": filtered_papers}
 
-def generate_abstract_step(state: ResearchState) -> ResearchState:
+@timed("generate_abstract")
+def generate_abstract_step(state: ResearchState) -> dict:
     prompt = f"Generate an abstract based on research questions {state['research_questions']}, objective {state['objective']}, and search string {state['search_string']}."
     abstract = generate_abstract_with_openai(prompt, state["model"])
-    return {**state, "abstract": abstract}
+    return {"abstract": abstract}
 
-def generate_conclusion_step(state: ResearchState) -> ResearchState:
+@timed("generate_conclusion")
+def generate_conclusion_step(state: ResearchState) -> dict:
     conclusion = generate_summary_conclusion(state["filtered_papers"])
-    return {**state, "conclusion": conclusion}
+    return {"conclusion": conclusion}
 
-def generate_introduction_step(state: ResearchState) -> ResearchState:
+@timed("generate_introduction")
+def generate_introduction_step(state: ResearchState) -> dict:
     prompt = f"This document synthesizes {len(state['filtered_papers'])} papers. Objective: {state['objective']}. Findings: {state['abstract']}"
     introduction = generate_introduction_summary_with_openai(prompt, state["model"])
-    return {**state, "introduction": introduction}
+    return {"introduction": introduction}
 
 # Create the graph
 graph = StateGraph(ResearchState)
@@ -79,14 +138,115 @@ graph.add_node("generate_introduction", generate_introduction_step)
 # Set the entry point
 graph.set_entry_point("generate_objective")
 
-# Define edges
+# Define edges. After the search string the graph fans out:
+#
+#   generate_search_string ─┬─ fetch_papers ── filter_papers ─┬─ generate_conclusion ───┐
+#                           │                                 └─┐                       ├─ END
+#                           └─ generate_abstract ───────────────┴─ generate_introduction┘
+#
+# The abstract only needs the objective, questions and search string, so it
+# runs while papers are fetched and filtered; the introduction joins on both.
 graph.add_edge("generate_objective", "generate_questions")
 graph.add_edge("generate_questions", "generate_search_string")
 graph.add_edge("generate_search_string", "fetch_papers")
+graph.add_edge("generate_search_string", "generate_abstract")
 graph.add_edge("fetch_papers", "filter_papers")
-graph.add_edge("filter_papers", "generate_abstract")
-graph.add_edge("generate_abstract", "generate_conclusion")
-graph.add_edge("generate_conclusion", "generate_introduction")
+graph.add_edge("filter_papers", "generate_conclusion")
+graph.add_edge(["filter_papers", "generate_abstract"], "generate_introduction")
+graph.add_edge("generate_conclusion", END)
+graph.add_edge("generate_introduction", END)
 
 # Compile the graph
 research_workflow = graph.compile()
+
+
+# ---------- checkpointed runs ----------
+
+_runner = ThreadPoolExecutor(max_workers=int(os.getenv("WORKFLOW_WORKERS", "2")), thread_name_prefix="workflow")
+
+
+def initial_state(prompt: str, model: str, search_strategy: str = "PICO") -> ResearchState:
+    return {
+        "prompt": prompt,
+        "model": model,
+        "search_strategy": search_strategy,
+        "objective": None,
+        "research_questions": [],
+        "search_string": None,
+        "fetched_papers": [],
+        "filtered_papers": [],
+        "abstract": None,
+        "conclusion": None,
+        "introduction": None,
+        "timings": {},
+        "completed_nodes": [],
+        "partial_nodes": [],
+    }
+
+
+def start_run(prompt: str, model: str, search_strategy: str = "PICO") -> str:
+    """Creates a checkpointed run (status queued) and returns its id."""
+    return create_run({"prompt": prompt, "model": model, "search_strategy": search_strategy})
+
+
+def downstream_nodes(nodes: List[str]) -> List[str]:
+    """nodes plus every node that consumes their output, directly or transitively."""
+    edges = research_workflow.get_graph().edges
+    found, frontier = set(nodes), list(nodes)
+    while frontier:
+        node = frontier.pop()
+        for edge in edges:
+            if edge.source == node and edge.target != END and edge.target not in found:
+                found.add(edge.target)
+                frontier.append(edge.target)
+    return sorted(found)
+
+
+def execute_run(run_id: str) -> ResearchState:
+    """
+    Runs the workflow for run_id from its last checkpoint; nodes that already
+    finished are skipped. Partial nodes run again, and so does everything
+    downstream of them. Raises on failure after recording it on the run.
+    """
+    saved = load_state(run_id)
+    if saved is None:
+        raise KeyError(f"Unknown workflow run {run_id}")
+    if saved["partial_nodes"]:
+        stale = downstream_nodes(saved["partial_nodes"])
+        print(f"Workflow run {run_id}: re-running {stale} after partial {saved['partial_nodes']}")
+        saved["completed_nodes"] = [n for n in saved["completed_nodes"] if n not in stale]
+        saved["partial_nodes"] = []
+    state = {**initial_state(saved["prompt"], saved["model"], saved.get("search_strategy") or "PICO"), **saved}
+    if saved["completed_nodes"]:
+        print(f"Resuming workflow run {run_id} after {saved['completed_nodes']}")
+    set_status(run_id, "running")
+    try:
+        final_state = research_workflow.invoke(state)
+    except Exception as e:
+        set_status(run_id, "failed", error=str(e))
+        raise
+    set_status(run_id, "completed")
+    return final_state
+
+
+def _execute_in_background(run_id: str) -> None:
+    try:
+        execute_run(run_id)
+    except Exception as e:
+        print(f"❌ Workflow run {run_id} failed: {e}")
+
+
+def submit_run(run_id: str) -> None:
+    """Queues run_id on the background runner; poll workflow_runs.get_run for progress."""
+    _runner.submit(_execute_in_background, run_id)
+
+
+def resume_run(run_id: str) -> bool:
+    """
+    Re-queues a failed or interrupted run, or a completed one with partial
+    nodes; False if it is not in a resumable state.
+    """
+    if not claim_for_resume(run_id):
+        return False
+    submit_run(run_id)
+    return True